@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark subtree totals with the adjacency list and the closure table.
+
+"Total spend under Expense:Auto" needs every category under Expense:Auto.
+With only the adjacency list that's either a walk of the tree in Python
+or a recursive query; with the closure table it's a single join.
+
+Usage:
+    benchmark_category_tree.py [--categories=<n>] [--rows=<n>]
+
+Options:
+    -h --help               # Show this screen.
+    --categories=<n>        # Number of categories. [default: 1000]
+    --rows=<n>              # Number of transactions. [default: 100000]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import os
+import sys
+import time
+import random
+import logging
+
+# Third Party
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import orm
+from pybank import queries
+from benchmark_data import synthetic_database
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+NUM_ROOTS = 10
+MAX_DEPTH = 6
+
+# The same sum of the amounts in cents as queries.query_category_total
+CENTS_SQL = ("coalesce(sum(CAST(round(CAST(amount AS REAL) * 100)"
+             " AS INTEGER)), 0)")
+
+CTE_SQL = """
+    WITH RECURSIVE subtree (category_id) AS (
+        SELECT ?
+        UNION ALL
+        SELECT category.category_id
+        FROM category JOIN subtree ON category.parent = subtree.category_id
+        WHERE category.parent != category.category_id
+    )
+    SELECT count(*), {}
+    FROM "transaction"
+    WHERE category_id IN subtree
+""".format(CENTS_SQL)
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def random_tree(n, seed=0):
+    """ Return ``(category_id, name, parent)`` rows for a random tree """
+    rand = random.Random(seed)
+    depth = {}
+    rows = []
+    for category_id in range(1, n + 1):
+        if category_id <= NUM_ROOTS:
+            parent = category_id
+            depth[category_id] = 0
+        else:
+            parent = rand.randint(1, category_id - 1)
+            while depth[parent] >= MAX_DEPTH - 1:
+                parent = rand.randint(1, category_id - 1)
+            depth[category_id] = depth[parent] + 1
+        rows.append((category_id, "Category {}".format(category_id), parent))
+    return rows
+
+
+def build_database(num_categories, num_rows):
+    """ Return an engine and session with a category tree and ledger """
+    engine = synthetic_database(num_rows)
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        cursor.execute("DELETE FROM category")
+        start = time.perf_counter()
+        cursor.executemany("INSERT INTO category (category_id, name, parent)"
+                           " VALUES (?, ?, ?)", random_tree(num_categories))
+        insert_time = time.perf_counter() - start
+        cursor.execute('UPDATE "transaction"'
+                       " SET category_id = abs(random()) % ? + 1",
+                       (num_categories, ))
+        raw.commit()
+    finally:
+        raw.close()
+    return engine, orm.Session(bind=engine), insert_time
+
+
+def adjacency_walk(session, category_id):
+    """ Walk the adjacency list in Python, then total the transactions """
+    children = {}
+    for row in session.query(orm.Category.category_id, orm.Category.parent):
+        if row.parent != row.category_id:
+            children.setdefault(row.parent, []).append(row.category_id)
+
+    subtree = []
+    stack = [category_id]
+    while stack:
+        item = stack.pop()
+        subtree.append(item)
+        stack.extend(children.get(item, []))
+
+    sql = ('SELECT count(*), {} FROM "transaction"'
+           " WHERE category_id IN ({})".format(CENTS_SQL,
+                                              ", ".join("?" * len(subtree))))
+    raw = session.connection().connection
+    return tuple(raw.execute(sql, subtree).fetchone())
+
+
+def adjacency_cte(session, category_id):
+    """ Find the subtree with a recursive query """
+    raw = session.connection().connection
+    return tuple(raw.execute(CTE_SQL, (category_id, )).fetchone())
+
+
+def closure(session, category_id):
+    return tuple(queries.query_category_total(session, category_id))
+
+
+def main():
+    args = docopt(__doc__)
+    num_categories = int(args['--categories'])
+    num_rows = int(args['--rows'])
+
+    logging.disable(logging.INFO)
+    engine, session, insert_time = build_database(num_categories, num_rows)
+
+    start = time.perf_counter()
+    queries.rebuild_category_closure(engine)
+    rebuild_time = time.perf_counter() - start
+
+    # Sample categories at each depth
+    depths = {}
+    for row in session.query(orm.CategoryClosure.descendant_id,
+                             orm.CategoryClosure.depth):
+        depths[row.descendant_id] = max(row.depth,
+                                        depths.get(row.descendant_id, 0))
+    samples = {}
+    for category_id, depth in sorted(depths.items()):
+        samples.setdefault(depth, [])
+        if len(samples[depth]) < NUM_ROOTS:
+            samples[depth].append(category_id)
+
+    print("{} categories, {} transactions".format(num_categories, num_rows))
+    print("Inserting categories (with triggers): {:.1f} ms".format(
+        insert_time * 1e3))
+    print("Rebuilding closure table: {:.1f} ms".format(rebuild_time * 1e3))
+    print()
+    print("Mean ms per subtree total")
+    print("{:>5} {:>9} {:>14} {:>14} {:>10}".format(
+        "Depth", "Subtree", "Python walk", "Recursive CTE", "Closure"))
+    for depth, category_ids in sorted(samples.items()):
+        size = sum(session.query(orm.CategoryClosure)
+                   .filter_by(ancestor_id=c).count()
+                   for c in category_ids) / len(category_ids)
+        times = []
+        for func in (adjacency_walk, adjacency_cte, closure):
+            results = [func(session, c) for c in category_ids]
+            assert results == [closure(session, c) for c in category_ids]
+            elapsed = best_of(lambda: [func(session, c)
+                                       for c in category_ids])
+            times.append(elapsed / len(category_ids) * 1e3)
+        print("{:>5} {:>9.1f} {:>14.2f} {:>14.2f} {:>10.2f}".format(
+            depth, size, *times))
+
+    session.close()
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
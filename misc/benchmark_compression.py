@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the compression stage of the encrypted save pipeline.
+
+Uses the same database sizes as the benchmark table in ``crypto.py``.
+
+Usage:
+    benchmark_compression.py [--rows=<list>]
+
+Options:
+    -h --help           # Show this screen.
+    --rows=<list>       # Comma-separated transaction counts.
+                        # [default: 10,10000,50000]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import io
+import os
+import sys
+import time
+import logging
+
+# Third Party
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import crypto
+from pybank import orm
+from pybank import queries
+from benchmark_data import synthetic_database
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+CODECS = (("none", crypto.CODEC_NONE),
+          ("zlib", crypto.CODEC_ZLIB),
+          ("lzma", crypto.CODEC_LZMA),
+          )
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def payloads(n):
+    """ Return the checkpoint payloads (image and SQL text) for ``n`` rows """
+    engine = synthetic_database(n)
+    session = orm.Session(bind=engine)
+    text = "".join(queries.sqlite_iterdump(engine, session)).encode('utf-8')
+    image = queries.sqlite_serialize(engine, session)
+    session.close()
+    engine.dispose()
+    return (("image", image), ("text", text))
+
+
+def main():
+    args = docopt(__doc__)
+    rows = [int(n) for n in args['--rows'].split(",")]
+
+    logging.disable(logging.INFO)
+    key = crypto.create_key(b"benchmark", b"salt")
+
+    print("{:>6} {:>5} {:>9} {:>5} {:>10} {:>7} {:>10} {:>10}".format(
+        "Rows", "Data", "Size kB", "Codec", "Out kB", "Ratio",
+        "Enc ms", "Dec ms"))
+    for n in rows:
+        for kind, data in payloads(n):
+            for name, codec in CODECS:
+                stream = b"".join(
+                    crypto.encrypt_stream(key, [data], codec=codec))
+                enc = best_of(lambda: b"".join(
+                    crypto.encrypt_stream(key, [data], codec=codec)))
+                dec = best_of(lambda: b"".join(
+                    crypto.decrypt_stream(key, io.BytesIO(stream))))
+                print("{:>6} {:>5} {:>9.0f} {:>5} {:>10.0f} {:>6.1f}x"
+                      " {:>10.1f} {:>10.1f}".format(
+                          n, kind, len(data) / 1e3, name, len(stream) / 1e3,
+                          len(data) / len(stream), enc * 1e3, dec * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark frame encryption and decryption against the number of workers.
+
+Only run on more than one CPU does this say anything about scaling; on a
+single CPU it only measures the thread pool's overhead.
+
+Usage:
+    benchmark_crypto_workers.py [--rows=<list>] [--workers=<list>]
+
+Options:
+    -h --help           # Show this screen.
+    --rows=<list>       # Comma-separated transaction counts.
+                        # [default: 10000,100000,1000000]
+    --workers=<list>    # Comma-separated thread pool sizes. [default: 1,2,4,8]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import io
+import os
+import sys
+import time
+import logging
+
+# Third Party
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import crypto
+from benchmark_data import synthetic_image
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def bench(image, key, workers):
+    """ Return (encrypt, decrypt) throughput in MB/s """
+    stream = b"".join(crypto.encrypt_stream(key, [image], workers=workers))
+
+    def encrypt():
+        for _ in crypto.encrypt_stream(key, [image], workers=workers):
+            pass
+
+    def decrypt():
+        for _ in crypto.decrypt_stream(key, io.BytesIO(stream), workers):
+            pass
+
+    megabytes = len(image) / 1e6
+    return megabytes / best_of(encrypt), megabytes / best_of(decrypt)
+
+
+def main():
+    args = docopt(__doc__)
+    rows = [int(n) for n in args['--rows'].split(",")]
+    workers = [int(n) for n in args['--workers'].split(",")]
+
+    logging.disable(logging.INFO)
+    key = crypto.create_key(b"benchmark", b"salt")
+
+    print("{} CPUs".format(os.cpu_count()))
+    if (os.cpu_count() or 1) < 2:
+        print("Only one CPU: this measures overhead, not scaling.")
+    print("{:>9} {:>9} {:>8} {:>12} {:>12}".format(
+        "Rows", "Image MB", "Workers", "Enc MB/s", "Dec MB/s"))
+    for n in rows:
+        image = synthetic_image(n)
+        for w in workers:
+            enc, dec = bench(image, key, w)
+            print("{:>9} {:>9.1f} {:>8} {:>12.0f} {:>12.0f}".format(
+                n, len(image) / 1e6, w, enc, dec))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetic PyBank databases for the benchmark scripts in this directory.
+
+Usage:
+    from benchmark_data import synthetic_database
+    engine = synthetic_database(100000)
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import os
+import sys
+import random
+import datetime
+
+# Third Party
+import sqlalchemy as sa
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import orm
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+NUM_ACCOUNTS = 5
+NUM_PAYEES = 200
+NUM_CATEGORIES = 60
+START_DATE = datetime.date(2005, 1, 1)
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def random_transactions(n, seed=0):
+    """ Yield ``n`` rows for the ``transaction`` table """
+    rand = random.Random(seed)
+    for num in range(1, n + 1):
+        date = START_DATE + datetime.timedelta(days=num * 3650 // n)
+        yield (num,
+               rand.randint(1, NUM_ACCOUNTS),
+               date.isoformat(),
+               date.isoformat(),
+               rand.choice([None, rand.randint(100, 9999)]),
+               "{:0.2f}".format(rand.uniform(-500, 500)),
+               rand.randint(1, NUM_PAYEES),
+               rand.randint(1, NUM_CATEGORIES),
+               None,
+               None,
+               num,
+               )
+
+
+def synthetic_database(n, seed=0):
+    """
+    Create an in-memory PyBank database with ``n`` transactions.
+
+    Returns
+    -------
+    engine : :class:`sqlalchemy.engine.Engine`
+    """
+    engine = sa.create_engine('sqlite://')
+    orm.Base.metadata.create_all(engine)
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.executemany("INSERT INTO account (account_id, account_num, name,"
+                        " user_name) VALUES (?, ?, ?, ?)",
+                        [(i, str(i), "Account {}".format(i), "user")
+                         for i in range(1, NUM_ACCOUNTS + 1)])
+        cur.executemany("INSERT INTO payee (payee_id, name) VALUES (?, ?)",
+                        [(i, "Payee {}".format(i))
+                         for i in range(1, NUM_PAYEES + 1)])
+        cur.executemany("INSERT INTO category (category_id, name, parent)"
+                        " VALUES (?, ?, ?)",
+                        [(i, "Category {}".format(i), None)
+                         for i in range(1, NUM_CATEGORIES + 1)])
+        cur.executemany('INSERT INTO "transaction" (transaction_id,'
+                        ' account_id, date, enter_date, check_num, amount,'
+                        ' payee_id, category_id, transaction_label_id,'
+                        ' memo_id, fitid)'
+                        ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        random_transactions(n, seed))
+        raw.commit()
+    finally:
+        raw.close()
+
+    return engine
+
+
+def synthetic_image(n, seed=0):
+    """ Return a database with ``n`` transactions as an SQLite image """
+    engine = synthetic_database(n, seed)
+    raw = engine.raw_connection()
+    try:
+        return raw.connection.serialize()
+    finally:
+        raw.close()
+        engine.dispose()
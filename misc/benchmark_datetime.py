@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark converting the OFX datetimes in tests/data.
+
+Compares convert_datetime against the old strptime-based version, both
+with an empty cache and with the cache warm.
+
+Usage:
+    benchmark_datetime.py [--repeat=<n>]
+
+Options:
+    -h --help               # Show this screen.
+    --repeat=<n>            # Times to convert each datetime. [default: 1000]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import os
+import re
+import sys
+import glob
+import time
+import datetime
+import logging
+
+# Third Party
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import parseofx
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "tests", "data")
+
+DATETIME_TAG_RE = re.compile(r"<DT\w+>([^<\r\n]+)")
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def old_convert_datetime(ofx_dt):
+    """ convert_datetime as it was, falling back through strptime formats """
+    tz_type = re.search(r"\[(?P<tz>[-+]?\d+\.?\d*)\:\w*\]$", ofx_dt)
+    if tz_type is not None:
+        tz = float(tz_type.group('tz'))
+    else:
+        tz = 0
+
+    tz_offset = datetime.timedelta(hours=tz)
+
+    strptime = datetime.datetime.strptime
+    try:
+        local_dt = strptime(ofx_dt, "%Y%m%d%H%M%S.%f[%z:%Z]")
+    except ValueError:
+        try:
+            local_dt = strptime(ofx_dt[:18], "%Y%m%d%H%M%S.%f")
+        except ValueError:
+            try:
+                local_dt = strptime(ofx_dt[:14], "%Y%m%d%H%M%S")
+            except ValueError:
+                try:
+                    local_dt = strptime(ofx_dt[:8], "%Y%m%d")
+                except ValueError:
+                    raise ValueError("Unknown OFX datetime format")
+
+    return local_dt - tz_offset
+
+
+def read_datetimes():
+    """ Return every datetime string in the OFX files in tests/data """
+    datetimes = []
+    for path in sorted(glob.glob(os.path.join(DATA_DIR, "*.ofx"))):
+        with open(path, 'r') as openf:
+            datetimes.extend(dt.strip()
+                             for dt in DATETIME_TAG_RE.findall(openf.read()))
+    return datetimes
+
+
+def main():
+    args = docopt(__doc__)
+    repeat = int(args['--repeat'])
+
+    logging.disable(logging.INFO)
+
+    datetimes = read_datetimes()
+    for dt in datetimes:
+        assert parseofx.convert_datetime(dt) == old_convert_datetime(dt), dt
+    workload = datetimes * repeat
+    uncached = parseofx._convert_datetime.__wrapped__
+
+    def cold():
+        parseofx._convert_datetime.cache_clear()
+        for dt in workload:
+            parseofx.convert_datetime(dt)
+
+    results = [("Old (strptime)", best_of(
+                    lambda: [old_convert_datetime(dt) for dt in workload])),
+               ("New, no cache", best_of(
+                    lambda: [uncached(dt) for dt in workload])),
+               ("New, cached", best_of(cold)),
+               ]
+
+    print("{} datetimes ({} distinct) from {}, each converted {} times".format(
+        len(datetimes), len(set(datetimes)), os.path.normpath(DATA_DIR),
+        repeat))
+    print("{:<16} {:>14}".format("", "us per call"))
+    for name, elapsed in results:
+        print("{:<16} {:>14.2f}".format(name, elapsed / len(workload) * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the ledger queries with and without the ``transaction`` indexes.
+
+Usage:
+    benchmark_indexes.py [--rows=<list>]
+
+Options:
+    -h --help           # Show this screen.
+    --rows=<list>       # Comma-separated transaction counts.
+                        # [default: 10000,100000]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import os
+import sys
+import time
+import logging
+
+# Third Party
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import queries
+from benchmark_data import synthetic_database
+from benchmark_data import START_DATE
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+# The number of FITID lookups, as done when importing a statement.
+NUM_LOOKUPS = 1000
+
+QUERIES = (
+    ("account ledger",
+     'SELECT * FROM "transaction" WHERE account_id = 3 ORDER BY date'),
+    ("account view",
+     "SELECT * FROM ledger_view WHERE account_id = 3"),
+    ("date range",
+     'SELECT count(*), sum(amount) FROM "transaction"'
+     " WHERE date BETWEEN '2010-01-01' AND '2010-03-31'"),
+    ("payee",
+     'SELECT * FROM "transaction" WHERE payee_id = 17'),
+    ("category",
+     'SELECT * FROM "transaction" WHERE category_id = 42'),
+)
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def time_queries(cursor, n):
+    """ Return ``(name, seconds)`` for each query against ``cursor`` """
+    results = []
+    for name, sql in QUERIES:
+        results.append(
+            (name, best_of(lambda: cursor.execute(sql).fetchall())))
+
+    def fitid_lookups():
+        sql = ('SELECT 1 FROM "transaction"'
+               " WHERE account_id = ? AND fitid = ?")
+        for fitid in range(1, n + 1, max(n // NUM_LOOKUPS, 1)):
+            cursor.execute(sql, (fitid % 5 + 1, fitid)).fetchone()
+
+    results.append(("{} fitid checks".format(NUM_LOOKUPS),
+                    best_of(fitid_lookups)))
+    return results
+
+
+def main():
+    args = docopt(__doc__)
+    rows = [int(n) for n in args['--rows'].split(",")]
+
+    logging.disable(logging.INFO)
+
+    print("Data starts {}".format(START_DATE))
+    print("{:>7} {:<18} {:>10} {:>10} {:>8}".format(
+        "Rows", "Query", "Before ms", "After ms", "Speedup"))
+    for n in rows:
+        engine = synthetic_database(n)
+        queries.drop_indexes(engine)
+        raw = engine.raw_connection()
+        cursor = raw.cursor()
+        before = time_queries(cursor, n)
+        raw.close()
+
+        start = time.perf_counter()
+        queries.create_indexes(engine)
+        build = time.perf_counter() - start
+
+        raw = engine.raw_connection()
+        cursor = raw.cursor()
+        after = time_queries(cursor, n)
+        raw.close()
+        engine.dispose()
+
+        for (name, old), (_, new) in zip(before, after):
+            print("{:>7} {:<18} {:>10.2f} {:>10.2f} {:>7.0f}x".format(
+                n, name, old * 1e3, new * 1e3, old / new))
+        print("{:>7} {:<18} {:>10} {:>10.2f}".format(
+            n, "build indexes", "", build * 1e3))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark parsing a large OFX statement.
+
+Compares the streaming parser against building the whole BeautifulSoup
+tree first, which is how ParseOFX used to work.
+
+Usage:
+    benchmark_ofx.py [--transactions=<list>]
+
+Options:
+    -h --help               # Show this screen.
+    --transactions=<list>   # Comma-separated numbers of transactions.
+                            # [default: 1000,10000]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import io
+import os
+import sys
+import time
+import logging
+import tracemalloc
+
+# Third Party
+from bs4 import BeautifulSoup
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import parseofx
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+HEADER = """OFXHEADER:100
+DATA:OFXSGML
+VERSION:102
+SECURITY:NONE
+ENCODING:USASCII
+CHARSET:1252
+COMPRESSION:NONE
+OLDFILEUID:NONE
+NEWFILEUID:NONE
+
+<OFX>
+<SIGNONMSGSRSV1><SONRS>
+<STATUS><CODE>0<SEVERITY>INFO</STATUS>
+<DTSERVER>20150522120000.000[0:GMT]<LANGUAGE>ENG
+<FI><ORG>org<FID>1234</FI>
+</SONRS></SIGNONMSGSRSV1>
+<BANKMSGSRSV1><STMTTRNRS><TRNUID>0
+<STATUS><CODE>0<SEVERITY>INFO</STATUS>
+<STMTRS><CURDEF>USD
+<BANKACCTFROM><BANKID>1<ACCTID>2<ACCTTYPE>CHECKING</BANKACCTFROM>
+<BANKTRANLIST><DTSTART>20150101<DTEND>20150522
+"""
+
+TRANSACTION = """<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20150518120000.000[0:GMT]
+<TRNAMT>-{}.{:02d}
+<FITID>fitid{}
+<NAME>Payee {}
+<MEMO>memo
+</STMTTRN>
+"""
+
+FOOTER = """</BANKTRANLIST>
+<LEDGERBAL><BALAMT>0.00<DTASOF>20150522070000.000[0:GMT]</LEDGERBAL>
+</STMTRS></STMTTRNRS></BANKMSGSRSV1>
+</OFX>
+"""
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def measure(func):
+    """ Return the seconds and peak traced MiB of ``func()`` """
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+
+    # Tracing slows everything down, so it's a separate run.
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2**20
+
+
+def statement(num_transactions):
+    """ Return the text of an OFX file with ``num_transactions`` """
+    transactions = (TRANSACTION.format(n % 500, n % 100, n, n % 50)
+                    for n in range(num_transactions))
+    return HEADER + "".join(transactions) + FOOTER
+
+
+def soup_parse(text):
+    """ Parse the way ParseOFX used to: the whole soup, then the items """
+    ofx_data, _ = parseofx.strip_header(io.StringIO(text))
+    soup = BeautifulSoup(parseofx.close_tags(ofx_data), "xml")
+    return [parseofx.parse_transaction(stmttrn)
+            for stmttrn in soup.find_all("STMTTRN")]
+
+
+def stream_parse(text):
+    return parseofx.ParseOFX(text).statement.transactions
+
+
+def stream_count(text):
+    """ Handle the transactions one at a time without keeping them """
+    return sum(1 for _ in parseofx.ParseOFX(text, parse=False)
+               .iter_transactions())
+
+
+def main():
+    args = docopt(__doc__)
+    sizes = [int(n) for n in args['--transactions'].split(",")]
+
+    logging.disable(logging.INFO)
+
+    print("Seconds and peak MiB to parse a statement")
+    print("{:>12} {:>8} {:>16} {:>16} {:>16}".format(
+        "Transactions", "MiB", "BeautifulSoup", "Streaming",
+        "iter_transactions"))
+    for n in sizes:
+        text = statement(n)
+        results = [measure(lambda: soup_parse(text)),
+                   measure(lambda: stream_parse(text)),
+                   measure(lambda: stream_count(text)),
+                   ]
+        assert len(stream_parse(text)) == len(soup_parse(text)) == n
+        print("{:>12} {:>8.1f} {}".format(
+            n, len(text) / 2**20,
+            " ".join("{:>7.2f} {:>8.1f}".format(*r) for r in results)))
+
+
+if __name__ == "__main__":
+    main()
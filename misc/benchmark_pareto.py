@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark the Pareto calculations against the old pure-Python versions.
+
+Usage:
+    benchmark_pareto.py [--categories=<list>] [--per-category=<n>]
+
+Options:
+    -h --help               # Show this screen.
+    --categories=<list>     # Comma-separated numbers of categories.
+                            # [default: 100,1000,10000,50000]
+    --per-category=<n>      # Transactions per category. [default: 10]
+
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import os
+import sys
+import time
+import logging
+
+# Third Party
+import numpy as np
+from docopt import docopt
+
+# Package / Application
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from pybank import plots
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+LIMIT = 0.8
+
+# The old versions are O(n**2); skip them above this many categories.
+MAX_OLD_CATEGORIES = 50000
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def best_of(func, repeat=3):
+    """ Return the fastest of ``repeat`` runs of ``func()``, in seconds """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def old_cum_line(counts):
+    """ calc_pareto_cum_line as it was, summing a slice per bin """
+    line_data = [0.0] * len(counts)
+    total_data = float(sum(counts))
+    for i, d in enumerate(counts):
+        if i == 0:
+            line_data[i] = d/total_data
+        else: line_data[i] = sum(counts[:i + 1])/total_data
+    return line_data
+
+
+def old_trim(limit, counts, categories):
+    """ trim_pareto_data as it was, walking the lists """
+    cumulative_data = old_cum_line(counts)
+    ltcount = 0
+    for _x in cumulative_data:
+        if _x < limit:
+            ltcount += 1
+    limit_loc = range(ltcount + 1)
+
+    counts = [counts[i] for i in limit_loc]
+    categories = [categories[i] for i in limit_loc]
+    cumulative_data = [cumulative_data[i] for i in limit_loc]
+    return counts, categories, cumulative_data
+
+
+def sample(num_categories, per_category, seed=0):
+    """ Return Zipf-ish category labels and amounts for the transactions """
+    rand = np.random.RandomState(seed)
+    size = num_categories * per_category
+    ranks = rand.zipf(1.3, size) % num_categories
+    labels = np.array(["Category {}".format(n)
+                       for n in range(num_categories)])
+    amounts = np.round(rand.lognormal(3, 1, size), 2)
+    return labels[ranks], amounts
+
+
+def main():
+    args = docopt(__doc__)
+    sizes = [int(n) for n in args['--categories'].split(",")]
+    per_category = int(args['--per-category'])
+
+    logging.disable(logging.INFO)
+
+    print("Milliseconds to bin the transactions, then to build the")
+    print("cumulative line and trim it at {:.0%}".format(LIMIT))
+    print("{:>10} {:>8} {:>8} {:>10} {:>12} {:>12}".format(
+        "Categories", "Rows", "Bins", "Weighted", "Old trim", "New trim"))
+    for n in sizes:
+        data, amounts = sample(n, per_category)
+
+        bins = best_of(lambda: plots.calc_pareto_data(data))
+        weighted = best_of(lambda: plots.calc_pareto_data(data, amounts))
+
+        counts, categories = plots.calc_pareto_data(data)
+        new = best_of(
+            lambda: plots.trim_pareto_data(LIMIT, counts, categories))
+        if n <= MAX_OLD_CATEGORIES:
+            expected = old_trim(LIMIT, counts, categories)
+            actual = plots.trim_pareto_data(LIMIT, counts, categories)
+            assert list(actual[0]) == list(expected[0])
+            np.testing.assert_allclose(actual[2], expected[2])
+            old = best_of(lambda: old_trim(LIMIT, counts, categories), 1)
+            old = "{:.2f}".format(old * 1e3)
+        else:
+            old = "-"
+
+        print("{:>10} {:>8} {:>8.2f} {:>10.2f} {:>12} {:>12.3f}".format(
+            n, len(data), bins * 1e3, weighted * 1e3, old, new * 1e3))
+
+
+if __name__ == "__main__":
+    main()
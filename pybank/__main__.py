@@ -23,6 +23,7 @@ import logging
 import os.path
 
 # Third-Party
+import wx
 
 # Package / Application
 from pybank import (__package_name__,
@@ -35,6 +36,7 @@ from . import crypto
 from . import utils
 from . import orm
 from . import queries
+from . import savefile
 from . import constants
 
 
@@ -73,15 +75,13 @@ def create_new(db_file):
         logging.warning('User canceled password creation; exiting')
         raise RuntimeError
 
-    key = crypto.get_key()
+    # Derive the key once; it's cached for the rest of the session.
+    crypto.key_manager.unlock()
 
     logging.info('Creating database file')
-    # 1. Create the DB and dump it
-    dump = list(queries.sqlite_iterdump(orm.engine, orm.session))
-    dump = "".join(line for line in dump)
-    dump = dump.encode('utf-8')
-    # 2. Save the dump to an encrypted file.
-    crypto.encrypted_write(db_file, key, dump)
+    # Dump the new DB and save it as the file's first checkpoint.
+    with crypto.key_manager.key() as key:
+        savefile.get_file(db_file).save(key, orm.engine, orm.session)
 
 
 def read_pybank_file(pybank_file):
@@ -94,13 +94,16 @@ def read_pybank_file(pybank_file):
         raise RuntimeError
 
     logging.debug('creating key')
-    key = crypto.get_key()
+    crypto.key_manager.unlock()
 
     logging.debug('decrypting database')
-    new_dump = crypto.encrypted_read(pybank_file, key)
-    new_dump = new_dump.decode('utf-8').split(";")
-
-    queries.copy_to_sa(orm.engine, orm.session, new_dump)
+    progress = gui_utils.LoadProgress()
+    try:
+        with crypto.key_manager.key() as key:
+            savefile.get_file(pybank_file).load(key, orm.engine,
+                                                orm.session, progress)
+    finally:
+        progress.close()
 
 
 @utils.logged
@@ -123,6 +126,10 @@ def main():
     """
     msg = "Starting %s v%s, released %s"
     logging.info(msg, __package_name__, __version__, __released__)
+
+    # The one wx.App for the whole session; the password prompts, the
+    # progress dialog and the main window all get it with wx.GetApp().
+    wx.App()
     logging.info("End of %s program.", __package_name__)
 
     # Check if the database file exists
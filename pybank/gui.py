@@ -20,6 +20,7 @@ Options:
 # Standard Library
 import logging
 import decimal
+import datetime
 from enum import Enum
 
 # Third Party
@@ -41,6 +42,9 @@ from . import utils
 from . import crypto
 from . import orm
 from . import queries
+from . import savefile
+from . import ledger
+from . import plots
 
 
 # ---------------------------------------------------------------------------
@@ -53,6 +57,7 @@ LEDGER_COLOR_ROW_EVEN = wx.Colour(255, 255, 204, 255)
 LEDGER_COLOR_VALUE_NEGATIVE = wx.Colour(255, 0, 0, 255)
 LEDGER_COLOR_VALUE_POSITIVE = wx.Colour(0, 0, 0, 255)
 DATABASE = "test_database.db"
+SAVE_FILE = "test_database.pybank"
 
 TITLE_TEXT = "{} v{}".format(__project_name__, __version__)
 
@@ -63,7 +68,7 @@ TITLE_TEXT = "{} v{}".format(__project_name__, __version__)
 class MainApp(object):
     """ Main App """
     def __init__(self):
-        self.app = wx.App()
+        self.app = wx.GetApp() or wx.App()
 
         self.frame = MainFrame(TITLE_TEXT, (1250, 700))
 
@@ -94,6 +99,15 @@ class MainFrame(wx.Frame):
 
         self._init_ui()
 
+        # Autosaves and manual saves run in the background.
+        self.saver = savefile.BackgroundSaver(savefile.get_file(SAVE_FILE),
+                                              orm.engine,
+                                              orm.session,
+                                              crypto.key_manager.get_key,
+                                              wx.CallAfter,
+                                              self._on_save_done,
+                                              )
+
     def _init_ui(self):
         """ Initi UI Components """
         # Create the menu bar and bind events
@@ -111,6 +125,7 @@ class MainFrame(wx.Frame):
         self.panel = MainPanel(self)
 
         self.ledger = self.panel.panel2.ledger_page.ledger
+        self.summary_bar = self.panel.panel2.ledger_page.summary_bar
 
     def _create_menus(self):
         """ Create each menu for the menu bar """
@@ -322,7 +337,9 @@ class MainFrame(wx.Frame):
         """
         logging.debug("close event fired!")
 
-        save_pybank_file()
+        self.saver.shutdown()
+        save_pybank_file(compact=True)
+        crypto.key_manager.lock()
 
         self.Destroy()
 
@@ -376,7 +393,7 @@ class MainFrame(wx.Frame):
         """ Saves the current pybank file """
         logging.info("Saving file...")
 
-        save_pybank_file()
+        self._request_save()
 
     def _on_new(self, event):
         """ Create a new file """
@@ -405,7 +422,21 @@ class MainFrame(wx.Frame):
 
     def _on_encryption_timer(self, event):
         logging.info("Encryption Timer event start")
-        save_pybank_file()
+        self._request_save()
+
+    def _request_save(self):
+        """ Start a background save and show its progress. """
+        if not self.saver.busy:
+            self.summary_bar.save_status = "Saving..."
+        self.saver.request()
+
+    def _on_save_done(self, error):
+        """ Called on the GUI thread when a background save finishes. """
+        if error is None:
+            status = "Saved {:%H:%M:%S}".format(datetime.datetime.now())
+        else:
+            status = "Save failed: {}".format(error)
+        self.summary_bar.save_status = status
 
     def _on_write_db_timer(self, event):
         logging.debug("Write_db_timer event!")
@@ -561,6 +592,7 @@ class MainNotebook(wx.Notebook):
     def __init__(self, parent):
         wx.Notebook.__init__(self, parent)
         self.parent = parent
+        self.plot_data = plots.PlotData()
 
         self._init_ui()
 
@@ -622,16 +654,19 @@ class MainNotebook(wx.Notebook):
 
         Fires the plot.draw() method.
         """
-        # TODO: Change this data grab to sql.
-        d = self.ledger_page.ledger.GetTable().data
-        x = np.arange(1, len(d) + 1)
+        # One point per day, totalled by the database and cached until the
+        # data changes.
+        dates, cents = self.plot_data.balance('day')
+        x = dates.astype(np.int64)          # days since 1970-01-01
 #        y = [random.uniform(-1, 1) + _x for _x in x]
-        y = np.array([x[10] for x in d], dtype=np.float)
+        y = cents / 100
         client = self.GetPage(NotebookPages.plots.value).client
         client.Clear()    # XXX: Not working (panel not updating?)
 #        plot.draw(x, y, 'r')
 
-        tdata = list(zip(x, y))
+        # No more points than the canvas has pixels to show.
+        x, y = plots.decimate(x, y, max(client.GetClientSize()[0], 1))
+        tdata = np.column_stack((x, y))
 
         line = wxplot.PolyLine(tdata,
                                colour='red',
@@ -650,7 +685,7 @@ class MainNotebook(wx.Notebook):
 
         plot = wxplot.PlotGraphics([line, data],
                                    title="Title",
-                                   xLabel="X label",
+                                   xLabel="Days since 1970",
                                    yLabel="Monies",
                                    )
 
@@ -714,43 +749,41 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
         wx.grid.GridTableBase.__init__(self)
         self.parent = parent
         self.column_labels, self.col_types = self._set_columns()
-        self.data = []
-            # TODO: move amount and balance to numpy arrays?
+        self.data = ledger.LedgerWindow()
 
         # flag for when the data has been changed with respect to the database
         self.data_is_modified = False
         self.row_is_new = False
 
-        # pull the category strings and create the choicelist.
-        self.cat_data = [(row.category_id, row.name, row.parent)
-                          for row in queries.query_category()]
+        self._pull_data()
 
-        self.choicelist = utils.build_cat_strings(self.cat_data)
+    # -----------------------------------------------------------------------
+    ### Properties
+    # -----------------------------------------------------------------------
+    @property
+    def categories(self):
+        """ The category strings, by ID and by string """
+        return queries.query_category_index()
 
-        self._pull_data()
+    @property
+    def choicelist(self):
+        """ Every category string, for the category editor """
+        return self.categories.choices
 
     # -----------------------------------------------------------------------
     ### Override Methods
     # -----------------------------------------------------------------------
     def GetNumberRows(self):
-        # TODO: Change to database query?
-#        rows = pbsql.db_query_single(DATABASE,
-#                                     "SELECT COUNT(*) FROM v_ledger_0")[0]
+        # The row count is a cached COUNT query; the +1 is the new row.
         rows = len(self.data)
         return rows + 1
 
     def GetNumberCols(self):
-        try:
-            return len(self.data[0])
-        except IndexError:
-            return len(self.columns)
+        return len(self.columns)
 
     def IsEmptyCell(self, row, column):
 #        logging.debug("IsEmptyCell(row={}, col={})".format(row, column))
-        try:
-            return not self.data[row][column]
-        except IndexError:
-            return True
+        return self._get_value(row, column) == ''
 
     def GetValue(self, row, col):
         """
@@ -811,27 +844,10 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
 
     @utils.logged
     def _pull_data(self):
-        # grab the table data from the database
-        self.data = []
-
-        # convert the query results to something usable by the grid
-        # Also calculate the running balancefor the view.
-        # TODO: I hate this - come up with an alternate solution
-        starting_bal = decimal.Decimal(200)
-        balance = starting_bal
-        for row_num, row_data in enumerate(queries.query_ledger_view()):
-            data_dict = row_data.__dict__
-            row_values = []
-            for item in self.columns:
-                if item.view_name is None:
-                    continue
-
-                row_values.append(data_dict[item.view_name])
-
-            balance += decimal.Decimal(row_values[-1])
-            row_values[-1] = str(row_values[-1])
-            row_values.append(str(balance))
-            self.data.append(row_values)
+        # Throw away the cached pages. Rows (and their running balance) are
+        # fetched from the database a page at a time as the grid asks for
+        # them; see ledger.LedgerWindow.
+        self.data.reset()
 
         # update the summary bar. Need to go to the grandparent.
         try:
@@ -852,17 +868,17 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
         """
 #        logging.debug("Getting value of r{}c{}".format(row, column))
         try:
-            value = self.data[row][col]
+            value = self.data.value(row, col)
         except IndexError:
             return ''
+        except AttributeError:
+            # No ledger loaded; see MainFrame._on_close
+            return ''
 
         if col == self.columns.category.index:
-            try:
-                return utils.build_cat_string(value, self.cat_data)
-            except TypeError:
-                return ''
+            return self.categories.path(value)
 
-        if value is None or value == 'None':
+        if value is None:
             return ''
         else:
             return str(value)
@@ -881,19 +897,6 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
             logging.info("Update failed. Adding new row")
             self._insert_row(row, col, value)
 
-            # tell the grid that we've added a row
-            logging.debug("GRIDTABLE_NOTIFY_ROWS_APPENDED")
-            action = wx.grid.GRIDTABLE_NOTIFY_ROWS_APPENDED
-            msg = wx.grid.GridTableMessage(self, action, 1)
-        else:       # run only if no *unhandled* errors
-            # tell the grid to display the new values
-            logging.debug("GRIDTABLE_REQUEST_VIEW_GET_VALUES")
-            action = wx.grid.GRIDTABLE_REQUEST_VIEW_GET_VALUES
-            msg = wx.grid.GridTableMessage(self, action)
-        finally:    # always runs
-            pass
-
-        self.GetView().ProcessTableMessage(msg)
         self.parent._format_table()
 
 #        self.data_is_modified = True
@@ -920,7 +923,7 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
                                   category=None,
                                   label=None,
                                   memo=None,
-                                  fitid=-1,
+                                  fitid=None,
                                   )
             else:       # row is not new, but rather was updated
                 self._update_row(row)
@@ -945,18 +948,17 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
         # Make sure we write the cateogry ID instead of the string
         if col == self.columns.category.index:
             try:
-                # +1 because lists are 0-indexed and my table is 1-indexed
-                value = self.choicelist.index(value) + 1
-            except ValueError:
+                value = self.categories.ids[value]
+            except KeyError:
                 # value not found. For now, lets just use None
                 # TODO: figure out how I want to handle this.
                 value = None
 
         self.row_is_new = False
-        self.data[row][col] = value
-        new = self.data[row]
-        logging.info("New.....: %s", self.data[row])
-        trans_id = self.data[row][self.columns.trans_id.index]
+        new = list(prev)
+        new[col] = value
+        logging.info("New.....: %s", new)
+        trans_id = new[self.columns.trans_id.index]
 
         # create a dict of the colums:values
         update_dict = {}
@@ -994,7 +996,10 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
             logging.debug("New Items: {}".format(orm.session.new))
             logging.debug("Dirty Items: {}".format(orm.session.dirty))
             orm.session.commit()
-            self._pull_data()
+
+            # Patch the cached row rather than pulling everything again.
+            first, last, delta = self.data.patch(row, col, prev[col], value)
+            self._show_changes(first, last, delta)
 
     def _insert_row(self, row, col, value):
         """
@@ -1002,19 +1007,16 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
         """
         logging.info("Inserting row %s", row)
         self.row_is_new = True
-        self.data.append([None] * self.GetNumberCols())
-        self.data[row][0] = "-1"
         # Make sure we write the cateogry ID instead of the string
         if col == self.columns.category.index:
             try:
-                # +1 because lists are 0-indexed and my table is 1-indexed
-                value = self.choicelist.index(value) + 1
-            except ValueError:
+                value = self.categories.ids[value]
+            except KeyError:
                 # value not found. For now, lets just use None
                 # TODO: figure out how I want to handle this.
                 value = None
 
-        logging.info("New Value: %s", self.data[row])
+        logging.info("New Value: %s", value)
 
         # create a dict of the colums:values
         insert_dict = {}
@@ -1046,7 +1048,7 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
             return
 
         try:
-            queries.insert_transaction(insert_dict)
+            trans = queries.insert_transaction(insert_dict)
         except TypeError:
             # TODO: more exact error conditions
             logging.exception("Error writing to database!", stack_info=True)
@@ -1055,7 +1057,140 @@ class LedgerGridBaseTable(wx.grid.GridTableBase):
             logging.debug("New Items: {}".format(orm.session.new))
             logging.debug("Dirty Items: {}".format(orm.session.dirty))
             orm.session.commit()
-            self._pull_data()
+
+            # The new row goes wherever its date puts it, not at the end.
+            row = self.data.insert((trans.date, trans.transaction_id),
+                                   trans.amount)
+            logging.debug("GRIDTABLE_NOTIFY_ROWS_INSERTED at %s", row)
+            action = wx.grid.GRIDTABLE_NOTIFY_ROWS_INSERTED
+            msg = wx.grid.GridTableMessage(self, action, row, 1)
+            self.GetView().ProcessTableMessage(msg)
+            self._show_changes(row, len(self.data) - 1,
+                               decimal.Decimal(trans.amount), rows=1)
+
+    def _show_changes(self, first, last, delta, rows=0):
+        """
+        Redraw the rows that changed and update the summary bar.
+
+        Parameters
+        ----------
+        first, last : int
+            The range of rows whose values changed.
+        delta : :class:`decimal.Decimal`
+            The change in the ledger total.
+        rows : int, optional
+            The change in the number of transactions.
+        """
+        last_col = self.GetNumberCols() - 1
+        self.GetView().RefreshBlock(first, 0, last, last_col)
+
+        try:
+            self.parent.parent.summary_bar._apply_change(delta, rows)
+        except AttributeError:
+            # See _pull_data
+            pass
+
+
+class LedgerAttrProvider(wx.grid.GridCellAttrProvider):
+    """
+    Works out the look of each ledger cell as it's drawn.
+
+    Rows alternate colours, the new row is grey and negative amounts and
+    balances are red. The sign comes from the cents held by the table's
+    :class:`pybank.ledger.RunningBalance` instead of the cell text. There
+    are only a few distinct combinations, so each attribute is built once
+    and shared, and nothing is done for rows that are never drawn.
+    """
+    right_aligned = (utils.LedgerCols.check_num.index,
+                     utils.LedgerCols.amount.index,
+                     utils.LedgerCols.balance.index,
+                     )
+    dollars = (utils.LedgerCols.amount.index,
+               utils.LedgerCols.balance.index,
+               )
+    category = utils.LedgerCols.category.index
+    backgrounds = {'new': LEDGER_COLOR_ROW_NEW,
+                   'even': LEDGER_COLOR_ROW_EVEN,
+                   'odd': LEDGER_COLOR_ROW_ODD,
+                   }
+
+    def __init__(self, table):
+        wx.grid.GridCellAttrProvider.__init__(self)
+        self.table = table
+        self._attrs = {}
+
+    # -----------------------------------------------------------------------
+    ### Override Methods
+    # -----------------------------------------------------------------------
+    def GetAttr(self, row, col, kind):
+        if kind != wx.grid.GridCellAttr.Any:
+            return wx.grid.GridCellAttrProvider.GetAttr(self, row, col, kind)
+
+        key = (self._row_kind(row), self._is_negative(row, col), col)
+        if col not in self.right_aligned and col != self.category:
+            # Every other column looks the same.
+            key = key[:2] + (None, )
+        try:
+            attr = self._attrs[key]
+        except KeyError:
+            attr = self._attrs[key] = self._make_attr(*key)
+        # The grid releases the attr it's given, so keep our reference.
+        attr.IncRef()
+        return attr
+
+    # -----------------------------------------------------------------------
+    ### Public Methods
+    # -----------------------------------------------------------------------
+    def reset(self):
+        """ Drop the shared attributes, such as when categories change. """
+        for attr in self._attrs.values():
+            attr.DecRef()
+        self._attrs.clear()
+
+    # -----------------------------------------------------------------------
+    ### Private Methods
+    # -----------------------------------------------------------------------
+    def _row_kind(self, row):
+        """ Return which of :attr:`backgrounds` ``row`` uses """
+        if row >= len(self.table.data):
+            return 'new'
+        elif row % 2 == 0:
+            return 'even'
+        else:
+            return 'odd'
+
+    def _is_negative(self, row, col):
+        """ Return True if the amount or balance at ``row`` is below zero """
+        if col not in self.dollars:
+            return False
+        try:
+            balances = self.table.data.balances
+            if col == utils.LedgerCols.amount.index:
+                return balances.cents[row] < 0
+            return balances.balance(row) < 0
+        except (AttributeError, IndexError):
+            # The new row, or no ledger loaded (see MainFrame._on_close)
+            return False
+
+    def _make_attr(self, row_kind, negative, col):
+        """ Build the attribute shared by cells that look alike """
+        attr = wx.grid.GridCellAttr()
+        attr.SetBackgroundColour(self.backgrounds[row_kind])
+        if negative:
+            attr.SetTextColour(LEDGER_COLOR_VALUE_NEGATIVE)
+        else:
+            attr.SetTextColour(LEDGER_COLOR_VALUE_POSITIVE)
+
+        if col in self.right_aligned:
+            attr.SetAlignment(wx.ALIGN_RIGHT, wx.ALIGN_CENTER)
+        else:
+            attr.SetAlignment(wx.ALIGN_LEFT, wx.ALIGN_CENTER)
+
+        if col == self.category:
+            editor = wx.grid.GridCellChoiceEditor(self.table.choicelist,
+                                                  allowOthers=True)
+            attr.SetEditor(editor)
+        return attr
 
 
 class LedgerGrid(wx.grid.Grid):
@@ -1068,16 +1203,12 @@ class LedgerGrid(wx.grid.Grid):
         self.parent = parent
         self._setup()
 
-        choiceEditor = wx.grid.GridCellChoiceEditor(self.table.choicelist,
-                                                    allowOthers=True)
-
-        for row in range(self.GetNumberRows()):
-            self.SetCellEditor(row, 7, choiceEditor)
-
     @utils.logged
     def _setup(self):
         logging.info("Running LedgerGrid._setup()")
         self.table = LedgerGridBaseTable(self)
+        self.attr_provider = LedgerAttrProvider(self.table)
+        self.table.SetAttrProvider(self.attr_provider)
 
         self.SetTable(self.table, takeOwnership=True)
 
@@ -1114,57 +1245,15 @@ class LedgerGrid(wx.grid.Grid):
 
     @utils.logged
     def _format_table(self):
-        """ Formats all table properties """
-        logging.info("Formatting table")
-        self._color_rows()
-        self._align_columns()
-        self._color_dollars()
-
-    @utils.logged
-    def _color_rows(self):
-        """ Color alternating rows and color the last row light grey """
-        logging.info("Coloring rows")
-        num_rows = self.GetNumberRows()
-        for row in range(num_rows):
-            attr = wx.grid.GridCellAttr()
-            if row == num_rows - 1:
-                attr.SetBackgroundColour(LEDGER_COLOR_ROW_NEW)
-            elif row % 2 == 0:
-                attr.SetBackgroundColour(LEDGER_COLOR_ROW_EVEN)
-            else:
-                attr.SetBackgroundColour(LEDGER_COLOR_ROW_ODD)
-            self.SetRowAttr(row, attr)
-
-    def _align_columns(self):
-        """ Sets the alignment for each column """
-        logging.info("Setting column alignment")
-        num_cols = self.GetNumberCols()
-        for column in range(num_cols):
-            attr = wx.grid.GridCellAttr()
-            if column in (3, 9, 10):
-                attr.SetAlignment(wx.ALIGN_RIGHT, wx.ALIGN_CENTER)
-            else:
-                attr.SetAlignment(wx.ALIGN_LEFT, wx.ALIGN_CENTER)
-            self.SetColAttr(column, attr)
-
-    def _color_dollars(self):
-        """ Colors negative amounts and balances as red """
-        logging.info("Coloring negative balances")
-        num_rows = self.GetNumberRows() - 1
-        for row in range(num_rows):
-            for col in (9, 10):
-                try:
-                    val = float(self.GetCellValue(row, col))
-                except ValueError:
-                    logging.warning("Unable to convert r%sc%s to float. Assuming 0 for row coloring.", row, col)
-                    val = 0
-                if val < 0:
-                    self.SetCellTextColour(row, col,
-                                           LEDGER_COLOR_VALUE_NEGATIVE)
-                else:
-                    self.SetCellTextColour(row, col,
-                                           LEDGER_COLOR_VALUE_POSITIVE)
+        """
+        Formats all table properties.
 
+        Colours and alignment are worked out per cell as they're drawn
+        (see :class:`LedgerAttrProvider`), so this just drops the shared
+        attributes in case the category choices have changed.
+        """
+        logging.info("Formatting table")
+        self.attr_provider.reset()
 
     def _on_left_dclick(self, event):
         # TODO: get cell coord from event
@@ -1415,6 +1504,8 @@ class LedgerSummaryBar(wx.Panel):
         self._curr_fmt = "Current Balance: {:<16s}"
         self._curr_text = self._curr_fmt.format(utils.moneyfmt(self._curr_bal))
 
+        self._save_text = ""                        # last save result
+
         self._init_ui()
 
     def _init_ui(self):
@@ -1441,6 +1532,11 @@ class LedgerSummaryBar(wx.Panel):
                                            size=(-1, -1),
                                            )
 
+        self._save_display = wx.StaticText(self, wx.ID_ANY,
+                                           label=self._save_text,
+                                           size=(-1, -1),
+                                           )
+
         # Create layout managers and add items
         self.hbox = wx.BoxSizer(wx.HORIZONTAL)
         self.hbox.Add(self._num_trans_display, 0, wx.EXPAND)
@@ -1450,6 +1546,8 @@ class LedgerSummaryBar(wx.Panel):
         self.hbox.Add(self._avail_display, 0, wx.EXPAND)
         self.hbox.Add((30, -1), 0, wx.EXPAND)
         self.hbox.Add(self._curr_display, 0, wx.EXPAND)
+        self.hbox.Add((30, -1), 0, wx.EXPAND)
+        self.hbox.Add(self._save_display, 0, wx.EXPAND)
 
         self.SetSizer(self.hbox)
 
@@ -1457,16 +1555,29 @@ class LedgerSummaryBar(wx.Panel):
     def _update(self):
         """ Updates the ledger summary """
         logging.info("updating summary bar")
-        data = self.parent.ledger.table.data    # Should I not do this because
-                                                # of memory usage?
+        data = self.parent.ledger.table.data
 
         self.online_balance = decimal.Decimal('0.00')
         self.num_transactions = len(data)
         self.available_balance = decimal.Decimal('0.00')
-        try:
-            self.current_balance = decimal.Decimal(data[-1][-1])
-        except IndexError:
-            self.current_balance = decimal.Decimal('0.00')
+        # Read from the running balance index rather than the last row.
+        self.current_balance = data.current_balance
+
+    def _apply_change(self, delta, rows=0):
+        """
+        Update the summary from a change instead of the whole ledger.
+
+        Parameters
+        ----------
+        delta : :class:`decimal.Decimal`
+            The change in the current balance.
+        rows : int, optional
+            The change in the number of transactions.
+        """
+        if rows:
+            self.num_transactions += rows
+        if delta:
+            self.current_balance += delta
 
     @property
     def online_balance(self):
@@ -1516,6 +1627,17 @@ class LedgerSummaryBar(wx.Panel):
         self._curr_text = self._curr_fmt.format(utils.moneyfmt(value))
         self._curr_display.SetLabel(self._curr_text)
 
+    @property
+    def save_status(self):
+        """ Gets the result of the last save """
+        return self._save_text
+
+    @save_status.setter
+    def save_status(self, value):
+        """ Sets the result of the last save """
+        self._save_text = value
+        self._save_display.SetLabel(value)
+
 
 class LedgerHeaderBar(wx.Panel):
     """ The ledger header bar """
@@ -1540,22 +1662,27 @@ class LedgerHeaderBar(wx.Panel):
 ### Functions
 # ---------------------------------------------------------------------------
 @utils.logged
-def save_pybank_file(filename="test_database.pybank"):
+def save_pybank_file(filename=SAVE_FILE, compact=False):
     """
-    Save the pybank file by dumping the database to a string and then
-    writing that to an encrypted file.
+    Save the pybank file.
+
+    Only the rows that changed since the last save are dumped and appended
+    to the encrypted file. See :mod:`pybank.savefile`.
+
+    Parameters
+    ----------
+    filename : str, optional
+        The file to save to.
+    compact : bool, optional
+        If True, rewrite the whole file as a single checkpoint.
     """
     logging.info("Saving file to '%s'", filename)
 
-    # Get the required encryption stuff
-    key = crypto.get_key()
-
-    # dump the memory database directly to an encrypted file.
-    dump = queries.sqlite_iterdump(orm.engine, orm.session)
-    dump = "".join(line for line in dump)
-    dump = dump.encode('utf-8')
+    pybank_file = savefile.get_file(filename)
 
-    crypto.encrypted_write(filename, key, dump)
+    # The key was derived at unlock so this doesn't run the KDF again.
+    with crypto.key_manager.key() as key:
+        pybank_file.save(key, orm.engine, orm.session, compact=compact)
 
 # ---------------------------------------------------------------------------
 ### Run module as standalone
@@ -134,12 +134,43 @@ class PasswordCreateDialog(wx.Dialog):
             self.ok_btn.Disable()
 
 
+class LoadProgress(object):
+    """
+    Progress dialog shown while the PyBank file loads after the password
+    prompt.
+
+    Instances are callable as ``progress(done, total)`` so they can be given
+    directly to :meth:`pybank.savefile.PyBankFile.load`.
+    """
+    def __init__(self, title="PyBank", message="Loading your data..."):
+        self.app = wx.GetApp() or wx.App()
+        self.dialog = wx.ProgressDialog(title,
+                                        message,
+                                        maximum=100,
+                                        style=wx.PD_APP_MODAL
+                                        | wx.PD_AUTO_HIDE
+                                        | wx.PD_ELAPSED_TIME,
+                                        )
+
+    def __call__(self, done, total):
+        """ Update the dialog. ``total`` may be None if unknown. """
+        if total:
+            # Stay below the maximum; reaching it closes the dialog.
+            self.dialog.Update(min(99, 100 * done // total))
+        else:
+            self.dialog.Pulse()
+
+    def close(self):
+        """ Close the dialog """
+        self.dialog.Destroy()
+
+
 # ---------------------------------------------------------------------------
 ### Functions
 # ---------------------------------------------------------------------------
 def _prompt_pw(prompt="Please enter your password:"):
     """ Internals to `prompt_pw` """
-    app = wx.App()
+    app = wx.GetApp() or wx.App()
     dialog = PasswordPromptDialog(prompt=prompt)
     # XXX: Is this a security risk? Sending an unencrypted
     #      password between functions and modules?
@@ -192,7 +223,7 @@ def create_pw():
     If canceled, returns False. Otherwise returns the password and saves
     it to the keyring.
     """
-    app = wx.App()
+    app = wx.GetApp() or wx.App()
     dialog = PasswordCreateDialog()
     # XXX: Is this a security risk? Sending an unencrypted
     #      password between functions and modules?
@@ -0,0 +1,589 @@
+# -*- coding: utf-8 -*-
+"""
+Ledger data models used by the ledger grid.
+
+The grid only ever shows a few dozen rows at a time, so rather than
+pulling the entire ledger into memory the rows are fetched a page at a
+time, as they're needed, and the most recently used pages are kept. Each
+page is held column by column in a :class:`LedgerPage`: amounts and
+balances as integer cents, dates as ``datetime64`` and text as codes into
+a :class:`StringPool` shared by every page, so nothing is kept as (or
+parsed back from) display strings.
+
+Running balances come from a :class:`RunningBalance`, which holds just the
+amounts, in integer cents, and a Fenwick tree (binary indexed tree) of
+daily totals. Any row's balance can be looked up, and any amount changed
+or added, in O(log n).
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import logging
+from collections import OrderedDict
+from decimal import Decimal
+
+# Third Party
+import numpy as np
+
+# Package / Application
+from . import utils
+from . import orm
+from . import queries
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+# The number of ledger rows fetched at a time.
+PAGE_SIZE = 100
+
+# The number of pages kept in memory.
+CACHE_PAGES = 20
+
+# The balance before the first transaction.
+# TODO: This should come from the account.
+OPENING_BALANCE = Decimal("200")
+
+# Extra days to allow for when sizing a RunningBalance, so that adding
+# transactions after the last one doesn't mean rebuilding it.
+DAYS_HEADROOM = 366
+
+# Stands in for NULL in the integer columns of a LedgerPage.
+MISSING = -1
+
+
+# ---------------------------------------------------------------------------
+### Classes
+# ---------------------------------------------------------------------------
+class LedgerWindow(object):
+    """
+    A read-only, paged view of the ledger.
+
+    Acts like a list of rows in ledger order, where each row is a list of
+    the values of :class:`pybank.utils.LedgerCols` with the running balance
+    at the end. Rows are fetched :data:`PAGE_SIZE` at a time with keyset
+    pagination on ``(date, transaction_id)`` and the least recently used
+    page is dropped once more than :data:`CACHE_PAGES` are held. The row
+    count is cached too, so call :meth:`reset` after the database changes.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`, optional
+        The session to query. Defaults to :data:`pybank.orm.session`.
+    page_size : int, optional
+    cache_pages : int, optional
+    opening_balance : :class:`decimal.Decimal`, optional
+        The balance before the first transaction.
+    """
+    columns = utils.LedgerCols
+
+    def __init__(self, session=None, page_size=PAGE_SIZE,
+                 cache_pages=CACHE_PAGES, opening_balance=OPENING_BALANCE):
+        self.session = orm.session if session is None else session
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.opening_balance = opening_balance
+
+        self._pages = OrderedDict()     # {page_num: LedgerPage}, oldest 1st
+        self._keys = {0: None}          # {page_num: key of the row before}
+        self._count = None
+        self._balances = None
+        self.strings = StringPool()
+
+    def __len__(self):
+        if self._count is None:
+            self._count = queries.query_ledger_count(self.session)
+        return self._count
+
+    def __getitem__(self, row):
+        num_rows = len(self)
+        if row < 0:
+            row += num_rows
+        if not 0 <= row < num_rows:
+            raise IndexError("ledger row out of range")
+
+        page_num, index = divmod(row, self.page_size)
+        return self._page(page_num).row(index)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    @property
+    def balances(self):
+        """ The :class:`RunningBalance` of the ledger, built when needed. """
+        if self._balances is None:
+            self._balances = RunningBalance.from_session(
+                self.session, _to_cents(self.opening_balance))
+        return self._balances
+
+    @property
+    def current_balance(self):
+        """ The balance after the last transaction. """
+        return _from_cents(self.balances.total)
+
+    def value(self, row, col):
+        """
+        Return a single value of a row, without building the whole row.
+
+        Parameters
+        ----------
+        row : int
+            The ledger row.
+        col : int
+            The :class:`pybank.utils.LedgerCols` index.
+
+        Returns
+        -------
+        value :
+            See :meth:`LedgerPage.value`.
+        """
+        if not 0 <= row < len(self):
+            raise IndexError("ledger row out of range")
+        page_num, index = divmod(row, self.page_size)
+        return self._page(page_num).value(index, col)
+
+    def reset(self):
+        """ Forget every cached page, the row count and the balances. """
+        self._pages.clear()
+        self._keys = {0: None}
+        self._count = None
+        self._balances = None
+        self.strings = StringPool()
+
+    def patch(self, row, col, old, new):
+        """
+        Change a value of a row that has already been updated in the
+        database, without fetching anything.
+
+        Only the rows whose displayed values change are touched: a new
+        amount is applied to :attr:`balances` and the cached rows from
+        ``row`` onwards read their new balance from it. A new date can
+        move the row, so that resets everything.
+
+        Parameters
+        ----------
+        row : int
+            The ledger row.
+        col : int
+            The :class:`pybank.utils.LedgerCols` index.
+        old, new :
+            The previous and new value.
+
+        Returns
+        -------
+        first, last : int
+            The range of rows whose displayed values changed.
+        delta : :class:`decimal.Decimal`
+            The change in the amount of the row.
+        """
+        if col == self.columns.date.index:
+            self.reset()
+            return 0, len(self) - 1, Decimal(0)
+
+        page_num, index = divmod(row, self.page_size)
+        if page_num in self._pages:
+            self._pages[page_num].set_value(index, col, new)
+
+        if col != self.columns.amount.index:
+            return row, row, Decimal(0)
+
+        delta = Decimal(new) - Decimal(old)
+        self.balances.update(row, _to_cents(new))
+        balance = self.columns.balance.index
+        for page_num, page in self._pages.items():
+            start = page_num * self.page_size
+            first = max(row - start, 0)
+            if first >= len(page):
+                continue
+            page.columns[balance][first:] = self.balances.balances(
+                start + first, start + len(page))
+        return row, len(self) - 1, delta
+
+    def insert(self, key, amount):
+        """
+        Account for a row that has already been added to the database.
+
+        Parameters
+        ----------
+        key : tuple of (date, int)
+            The ``(date, transaction_id)`` of the new row.
+        amount : :class:`decimal.Decimal` or str
+            The amount of the new row.
+
+        Returns
+        -------
+        row : int
+            Where the new row is in the ledger. Cached rows before it are
+            kept; everything from it onwards is fetched again when needed.
+        """
+        date, trans_id = key
+        day = 0 if date is None else date.toordinal()
+        if self._balances is None:
+            # Built from the database, so it already has the new row.
+            row = self.balances.position(day, trans_id)
+        else:
+            row = self._balances.insert(day, trans_id, _to_cents(amount))
+        page_num = row // self.page_size
+        for num in [num for num in self._pages if num >= page_num]:
+            del self._pages[num]
+        for num in [num for num in self._keys if num > page_num]:
+            del self._keys[num]
+        self._count = len(self._balances)
+        return row
+
+    def _page(self, page_num):
+        """ Return a page of rows, from the cache if possible. """
+        try:
+            self._pages.move_to_end(page_num)
+        except KeyError:
+            self._pages[page_num] = self._fetch(page_num)
+            if len(self._pages) > self.cache_pages:
+                self._pages.popitem(last=False)
+        return self._pages[page_num]
+
+    def _fetch(self, page_num):
+        """ Query a page of rows and calculate their running balance. """
+        logging.debug("fetching ledger page %s", page_num)
+        after = self._key_before(page_num)
+        rows = queries.query_ledger_page(self.session, after, self.page_size)
+
+        start = page_num * self.page_size
+        balances = self.balances.balances(start, start + len(rows))
+        page = LedgerPage.from_rows(rows, balances, self.strings)
+
+        if rows:
+            self._keys[page_num + 1] = _sort_key(rows[-1])
+        return page
+
+    def _key_before(self, page_num):
+        """
+        Return the sort key of the last row before a page.
+
+        Keys are remembered as pages are fetched. To jump ahead, skip rows
+        from the closest page before this one whose key is known.
+        """
+        try:
+            return self._keys[page_num]
+        except KeyError:
+            pass
+
+        known = max(num for num in self._keys if num < page_num)
+        skip = (page_num - known) * self.page_size - 1
+        row, = queries.query_ledger_page(self.session, self._keys[known],
+                                         limit=1, offset=skip)
+        self._keys[page_num] = _sort_key(row)
+        return self._keys[page_num]
+
+
+class StringPool(object):
+    """
+    A dictionary of strings, each stored once and referred to by an
+    integer code.
+
+    Code 0 is always ``None``. Payees, memos and labels repeat a lot, so
+    a :class:`LedgerPage` keeps an ``int32`` code per row and the text
+    lives here, shared by every page.
+    """
+    def __init__(self):
+        self.strings = [None]
+        self._codes = {None: 0}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def code(self, text):
+        """ Return the code of ``text``, adding it if it's new. """
+        try:
+            return self._codes[text]
+        except KeyError:
+            code = self._codes[text] = len(self.strings)
+            self.strings.append(text)
+            return code
+
+    def encode(self, texts):
+        """ Return the codes of ``texts`` as an ``int32`` array. """
+        return np.array([self.code(text) for text in texts], dtype=np.int32)
+
+
+class LedgerPage(object):
+    """
+    A page of ledger rows, stored column by column.
+
+    ``columns`` maps each :class:`pybank.utils.LedgerCols` index to a
+    NumPy array:
+
+    + ``amount`` and ``balance`` are ``int64`` cents
+    + ``date`` and ``enter_date`` are ``datetime64[D]``, NaT when missing
+    + ``payee``, ``dl_payee``, ``check_num``, ``memo`` and ``label`` are
+      ``int32`` codes into a :class:`StringPool`. Check numbers are free
+      text in the grid, such as "ATM", so they're kept as they come.
+    + ``trans_id`` and ``category`` are integers, with :data:`MISSING`
+      for NULL
+
+    Parameters
+    ----------
+    columns : dict of {int: ndarray}
+    strings : :class:`StringPool`
+    """
+    cols = utils.LedgerCols
+    cents_cols = (cols.amount.index, cols.balance.index)
+    date_cols = (cols.date.index, cols.enter_date.index)
+    string_cols = (cols.payee.index, cols.dl_payee.index,
+                   cols.check_num.index, cols.memo.index, cols.label.index)
+    int_cols = {cols.trans_id.index: np.int64,
+                cols.category.index: np.int32,
+                }
+
+    def __init__(self, columns, strings):
+        self.columns = columns
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.columns[self.cols.trans_id.index])
+
+    @classmethod
+    def from_rows(cls, rows, balances, strings):
+        """
+        Build a page from query results.
+
+        Parameters
+        ----------
+        rows : list of :class:`pybank.orm.LedgerView`
+        balances : sequence of int
+            The balance after each row, in cents.
+        strings : :class:`StringPool`
+        """
+        columns = {}
+        for item in cls.cols:
+            col = item.index
+            if item is cls.cols.balance:
+                columns[col] = np.array(balances, dtype=np.int64)
+                continue
+
+            values = [row.__dict__[item.view_name] for row in rows]
+            if col in cls.cents_cols:
+                columns[col] = np.array([_to_cents(value) for value in values],
+                                        dtype=np.int64)
+            elif col in cls.date_cols:
+                columns[col] = np.array(values, dtype='datetime64[D]')
+            elif col in cls.string_cols:
+                columns[col] = strings.encode(values)
+            else:
+                columns[col] = np.array(
+                    [MISSING if value is None else value for value in values],
+                    dtype=cls.int_cols[col])
+        return cls(columns, strings)
+
+    def value(self, index, col):
+        """
+        Return a value as a Python object.
+
+        Amounts and balances are :class:`decimal.Decimal`, dates are
+        :class:`datetime.date` and missing values are ``None``.
+        """
+        value = self.columns[col][index]
+        if col in self.cents_cols:
+            return _from_cents(int(value))
+        elif col in self.date_cols:
+            return value.item()         # NaT becomes None
+        elif col in self.string_cols:
+            return self.strings[value]
+        elif value == MISSING:
+            return None
+        else:
+            return int(value)
+
+    def row(self, index):
+        """ Return the values of a row, in column order. """
+        return [self.value(index, item.index) for item in self.cols]
+
+    def set_value(self, index, col, value):
+        """ Change a value, converting it to how the column is stored. """
+        if value == '':
+            value = None
+        if col in self.cents_cols:
+            value = _to_cents(value)
+        elif col in self.string_cols:
+            value = self.strings.code(value)
+        elif value is None:
+            value = 'NaT' if col in self.date_cols else MISSING
+        elif col in self.int_cols:
+            value = int(value)
+        self.columns[col][index] = value
+
+
+class FenwickTree(object):
+    """
+    A Fenwick tree (binary indexed tree) of integers.
+
+    Holds ``size`` values, all starting at 0, and supports adding to any
+    value and summing any prefix of them in O(log n).
+
+    Parameters
+    ----------
+    size : int
+    """
+    def __init__(self, size):
+        self._tree = [0] * (size + 1)
+
+    def __len__(self):
+        return len(self._tree) - 1
+
+    @classmethod
+    def from_values(cls, values):
+        """ Build a tree holding ``values``, in O(n). """
+        tree = cls(len(values))
+        data = tree._tree
+        data[1:] = [int(value) for value in values]
+        for index in range(1, len(data)):
+            parent = index + (index & -index)
+            if parent < len(data):
+                data[parent] += data[index]
+        return tree
+
+    def add(self, index, delta):
+        """ Add ``delta`` to the value at ``index``. """
+        index += 1
+        while index < len(self._tree):
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, stop):
+        """ Return the sum of the values before ``stop``. """
+        total = 0
+        while stop > 0:
+            total += self._tree[stop]
+            stop -= stop & -stop
+        return total
+
+
+class RunningBalance(object):
+    """
+    The running balance of the ledger, in integer cents.
+
+    The amounts are kept in ledger order along with the day and
+    transaction ID that order them. The total for each day is kept in a
+    :class:`FenwickTree`, so the balance of a row is the sum of the days
+    before it plus the rows before it on the same day. Keying the tree by
+    day rather than by row means a transaction added out of date order
+    doesn't shift anything in the tree.
+
+    Parameters
+    ----------
+    days : sequence of int
+        The date ordinal of each row, in ledger order. 0 for undated rows.
+    trans_ids : sequence of int
+    cents : sequence of int
+        The amount of each row.
+    opening : int, optional
+        The balance before the first row.
+    """
+    def __init__(self, days, trans_ids, cents, opening=0):
+        self.days = np.array(days, dtype=np.int64)
+        self.trans_ids = np.array(trans_ids, dtype=np.int64)
+        self.cents = np.array(cents, dtype=np.int64)
+        self.opening = opening
+        self._build_tree()
+
+    def __len__(self):
+        return len(self.cents)
+
+    @classmethod
+    def from_session(cls, session, opening=0):
+        """ Build the running balance of the ledger in the database. """
+        rows = queries.query_ledger_amounts(session)
+        columns = np.array(rows, dtype=np.int64).reshape(-1, 3).T
+        return cls(columns[0], columns[1], columns[2], opening)
+
+    @property
+    def total(self):
+        """ The balance after the last row. """
+        return self.opening + self._tree.prefix(len(self._tree))
+
+    def balance(self, row):
+        """ Return the balance after ``row``. """
+        day = self.days[row]
+        first = np.searchsorted(self.days, day, 'left')
+        same_day = int(self.cents[first:row + 1].sum())
+        return self.opening + self._tree.prefix(self._slot(day)) + same_day
+
+    def balances(self, start, stop):
+        """ Return the balances after rows ``start`` to ``stop - 1``. """
+        if start >= stop:
+            return []
+        before = self.balance(start) - int(self.cents[start])
+        return (np.cumsum(self.cents[start:stop]) + before).tolist()
+
+    def update(self, row, cents):
+        """ Change the amount of ``row``. """
+        delta = cents - int(self.cents[row])
+        self.cents[row] = cents
+        self._tree.add(self._slot(self.days[row]), delta)
+
+    def position(self, day, trans_id):
+        """ Return the row of ``(day, trans_id)``, or where it would go. """
+        first = np.searchsorted(self.days, day, 'left')
+        last = np.searchsorted(self.days, day, 'right')
+        return int(first + np.searchsorted(self.trans_ids[first:last],
+                                           trans_id))
+
+    def insert(self, day, trans_id, cents):
+        """
+        Add a row.
+
+        Returns
+        -------
+        row : int
+            Where the row went.
+        """
+        row = self.position(day, trans_id)
+
+        self.days = np.insert(self.days, row, day)
+        self.trans_ids = np.insert(self.trans_ids, row, trans_id)
+        self.cents = np.insert(self.cents, row, cents)
+
+        if 0 < day < self._first_day or self._slot(day) >= len(self._tree):
+            self._build_tree()
+        else:
+            self._tree.add(self._slot(day), cents)
+        return row
+
+    def _slot(self, day):
+        """ The tree index of a day. Undated rows are in slot 0. """
+        if day == 0:
+            return 0
+        return int(day) - self._first_day + 1
+
+    def _build_tree(self):
+        """ Total up each day and build the tree from scratch. """
+        dated = self.days[self.days > 0]
+        self._first_day = int(dated[0]) if len(dated) else 1
+        last_day = int(dated[-1]) if len(dated) else self._first_day
+
+        num_slots = last_day - self._first_day + 2 + DAYS_HEADROOM
+        slots = np.where(self.days > 0, self.days - self._first_day + 1, 0)
+        totals = np.bincount(slots, weights=self.cents, minlength=num_slots)
+        self._tree = FenwickTree.from_values(totals.astype(np.int64))
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def _to_cents(amount):
+    """ Convert a decimal amount to integer cents. """
+    return int((Decimal(amount) * 100).to_integral_value())
+
+
+def _from_cents(cents):
+    """ Convert integer cents to a decimal amount. """
+    return Decimal(cents).scaleb(-2)
+
+
+def _sort_key(row):
+    """ The ``(date, transaction_id)`` that orders a ledger row. """
+    return (row.date, row.transaction_id)
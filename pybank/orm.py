@@ -30,6 +30,58 @@ from sqlalchemy.orm import sessionmaker
 Base = declarative_base()
 engine = sa.create_engine('sqlite:///:memory:', echo=False)
 
+# Keep `category_closure` in step with `category`. A category's ancestors
+# are its parent's ancestors plus the parent. When a category moves, its
+# whole subtree is cut from the old ancestors and joined to the new ones.
+CATEGORY_INSERT_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS category_closure_insert
+AFTER INSERT ON category
+BEGIN
+    INSERT OR IGNORE INTO category_closure
+        (ancestor_id, descendant_id, depth)
+        VALUES (NEW.category_id, NEW.category_id, 0);
+    INSERT OR IGNORE INTO category_closure
+        (ancestor_id, descendant_id, depth)
+        SELECT ancestor_id, NEW.category_id, depth + 1
+        FROM category_closure
+        WHERE descendant_id = NEW.parent
+          AND NEW.parent != NEW.category_id;
+END
+"""
+
+CATEGORY_MOVE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS category_closure_move
+AFTER UPDATE OF parent ON category
+WHEN OLD.parent IS NOT NEW.parent
+BEGIN
+    DELETE FROM category_closure
+    WHERE descendant_id IN (SELECT descendant_id
+                            FROM category_closure
+                            WHERE ancestor_id = NEW.category_id)
+      AND ancestor_id NOT IN (SELECT descendant_id
+                              FROM category_closure
+                              WHERE ancestor_id = NEW.category_id);
+    INSERT OR IGNORE INTO category_closure
+        (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, below.descendant_id,
+               above.depth + below.depth + 1
+        FROM category_closure AS above, category_closure AS below
+        WHERE above.descendant_id = NEW.parent
+          AND below.ancestor_id = NEW.category_id
+          AND NEW.parent != NEW.category_id;
+END
+"""
+
+CATEGORY_DELETE_TRIGGER = """
+CREATE TRIGGER IF NOT EXISTS category_closure_delete
+AFTER DELETE ON category
+BEGIN
+    DELETE FROM category_closure
+    WHERE descendant_id = OLD.category_id
+       OR ancestor_id = OLD.category_id;
+END
+"""
+
 
 # ---------------------------------------------------------------------------
 ### Items needed to create a view in SQLAlchemy
@@ -143,6 +195,120 @@ class SqliteNumeric(sa.types.TypeDecorator):
 #event.listen(engine, 'connect', on_connect)
 
 
+class ChangeTracker(object):
+    """
+    Keeps track of which tables and rows have changed since the last save.
+
+    Listens to the session ``after_flush``, ``after_bulk_update`` and
+    ``after_bulk_delete`` events. Rows that go through the unit of work are
+    tracked by primary key. Bulk operations track the matched primary keys
+    when they can be found and otherwise mark the entire table as changed.
+
+    Attributes
+    ----------
+    rows : dict
+        ``{table_name: set(primary_key_tuple)}`` of changed rows.
+    tables : set
+        Names of tables that have changed in their entirety.
+    version : int
+        Incremented every time a change is recorded. Never reset, so it can
+        be used as a cache key for anything derived from the database.
+    """
+    def __init__(self):
+        self.rows = {}
+        self.tables = set()
+        self.version = 0
+
+    def listen(self, target):
+        """
+        Register the event listeners on ``target``.
+
+        Parameters
+        ----------
+        target : :class:`sqlalchemy.orm.session.Session` or sessionmaker
+        """
+        event.listen(target, 'after_flush', self._on_after_flush)
+        event.listen(target, 'after_bulk_update', self._on_after_bulk_update)
+        event.listen(target, 'after_bulk_delete', self._on_after_bulk_delete)
+
+    @property
+    def has_changes(self):
+        """ ``True`` if anything has changed since the last :meth:`reset` """
+        return bool(self.rows or self.tables)
+
+    def mark_row(self, table_name, pk):
+        """ Record that a single row has changed. """
+        self.rows.setdefault(table_name, set()).add(tuple(pk))
+        self.version += 1
+
+    def mark_table(self, table_name):
+        """ Record that an entire table has changed. """
+        self.tables.add(table_name)
+        self.rows.pop(table_name, None)
+        self.version += 1
+
+    def touch(self):
+        """
+        Change :attr:`version` without recording anything to save.
+
+        For when the data changed without going through the session, such
+        as loading a file, so that anything derived from it is rebuilt.
+        """
+        self.version += 1
+
+    def reset(self):
+        """
+        Clear the recorded changes and return them.
+
+        Returns
+        -------
+        (rows, tables) : (dict, set)
+            The changes that were recorded since the previous reset.
+        """
+        rows, tables = self.rows, self.tables
+        self.rows, self.tables = {}, set()
+        return rows, tables
+
+    def _on_after_flush(self, session, flush_context):
+        """ Record every object that was part of the flush. """
+        for obj in session.new | session.dirty | session.deleted:
+            mapper = sa.inspect(obj).mapper
+            table_name = mapper.local_table.name
+            if table_name in self.tables:
+                continue
+            self.mark_row(table_name, mapper.primary_key_from_instance(obj))
+
+    def _on_after_bulk_update(self, update_context):
+        """ Record the rows matched by a ``Query.update()`` call. """
+        table = update_context.primary_table
+        where = update_context.context.whereclause
+
+        if where is None:
+            self.mark_table(table.name)
+            return
+
+        # If the UPDATE changes a column that it also filters on then
+        # re-running the filter won't find the same rows.
+        updated = {getattr(k, 'key', k) for k in update_context.values}
+        filtered = {elem.key
+                    for elem in sa.sql.visitors.iterate(where, {})
+                    if isinstance(elem, sa.Column)}
+        if updated & filtered:
+            self.mark_table(table.name)
+            return
+
+        if table.name in self.tables:
+            return
+
+        query = sa.select(list(table.primary_key.columns)).where(where)
+        for pk in update_context.session.execute(query):
+            self.mark_row(table.name, pk)
+
+    def _on_after_bulk_delete(self, delete_context):
+        """ The deleted rows are gone, so mark the whole table. """
+        self.mark_table(delete_context.primary_table.name)
+
+
 # ---------------------------------------------------------------------------
 ### Functions required by ORM classes
 # ---------------------------------------------------------------------------
@@ -261,7 +427,8 @@ class Category(Base):
     Uses Adjacency List Model. See
     http://mikehillyer.com/articles/managing-hierarchical-data-in-mysql/
 
-    Contains the category_id, name, and parent.
+    Contains the category_id, name, and parent. Top-level categories are
+    their own parent. Subtrees are found through :class:`CategoryClosure`.
     """
     __tablename__ = 'category'
 
@@ -275,6 +442,50 @@ class Category(Base):
         return "{}: {}".format(self.category_id, self.name)
 
 
+class CategoryClosure(Base):
+    """
+    CategoryClosure
+
+    The closure table of the category tree: one row for every ancestor
+    and descendant pair, including each category paired with itself at a
+    depth of 0. Finding everything under a category is then a single
+    indexed lookup rather than a recursive query.
+
+    Contains the ancestor_id, descendant_id and depth.
+
+    Triggers on ``category`` keep it up to date when categories are added,
+    moved (their parent changes) or deleted. It's derived entirely from
+    ``category`` so it isn't saved; see
+    :func:`pybank.queries.rebuild_category_closure`.
+    """
+    __tablename__ = 'category_closure'
+    __table_args__ = (
+        sa.Index('ix_category_closure_descendant', 'descendant_id'),
+        {'info': {'derived': True}},
+    )
+
+    ancestor_id = sa.Column(sa.Integer,
+                            sa.ForeignKey('category.category_id'),
+                            primary_key=True)
+    descendant_id = sa.Column(sa.Integer,
+                              sa.ForeignKey('category.category_id'),
+                              primary_key=True)
+    depth = sa.Column(sa.Integer, nullable=False)
+
+    def __str__(self):
+        return "{} -> {}: {}".format(self.ancestor_id,
+                                     self.descendant_id,
+                                     self.depth)
+
+
+for _trigger in (CATEGORY_INSERT_TRIGGER,
+                 CATEGORY_MOVE_TRIGGER,
+                 CATEGORY_DELETE_TRIGGER):
+    event.listen(CategoryClosure.__table__,
+                 'after_create',
+                 sa.DDL(_trigger).execute_if(dialect='sqlite'))
+
+
 class DisplayName(Base):
     """
     DisplayName
@@ -362,8 +573,22 @@ class Transaction(Base):
     Contains the transaction_id, account_id, date, enter_date, check_num,
     amount, payee_id, category_id, transaction_label_id, memo_id, and fitid.
 
+    The ledger is filtered by account and sorted by date, and imports check
+    for duplicate FITIDs, so those columns (and the foreign keys the ledger
+    view joins on) are indexed. A FITID is only unique within an account.
+    Transactions that weren't downloaded have a ``NULL`` fitid, which never
+    conflicts.
+
     """
     __tablename__ = 'transaction'
+    __table_args__ = (
+        sa.Index('ix_transaction_account_date', 'account_id', 'date'),
+        sa.Index('ix_transaction_date', 'date'),
+        sa.Index('ix_transaction_payee_id', 'payee_id'),
+        sa.Index('ix_transaction_category_id', 'category_id'),
+        sa.Index('ux_transaction_account_fitid', 'account_id', 'fitid',
+                 unique=True),
+    )
 
     transaction_id = sa.Column(sa.Integer, primary_key=True)
     account_id = sa.Column(sa.Integer, sa.ForeignKey('account.account_id'))
@@ -421,3 +646,6 @@ class LedgerView(Base):
 Base.metadata.create_all(engine)
 Session = sessionmaker(bind=engine)
 session = Session()
+
+change_tracker = ChangeTracker()
+change_tracker.listen(Session)
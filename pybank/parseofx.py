@@ -61,14 +61,21 @@ Other Items:
 # Standard Library
 import io
 import re
+import codecs
+import sys
 import datetime
 import decimal
 import logging
+import functools
+import itertools
+import threading
+import collections
 import os.path as osp
 from enum import Enum
 
 # Third-Party
 from bs4 import BeautifulSoup
+from lxml import etree
 
 # Package / Application
 
@@ -82,6 +89,77 @@ DEFAULT_APP_VERSION = '2200'
 DEFAULT_OFX_VERSION = '102'
 LINE_ENDING = "\r\n"
 
+# The number of characters read and handed to the XML parser at a time.
+CHUNK_SIZE = 64 * 1024
+
+# Opening and closing tags      <t_.x> or </t_.x>   groups: "/", t_.x
+# then comments and processing tags, which have no groups.
+TAG_RE = re.compile(r"<(/?)([\w\.]+)>|<!--.*?-->|<[!?][^>]*>", re.DOTALL)
+
+# An "&" that doesn't start an entity or character reference. SGML allows
+# them, as in "AT&T", but XML doesn't.
+BARE_AMPERSAND_RE = re.compile(r"&(?!#?\w+;)")
+
+# OFX 1.x elements: tags that hold a value rather than other tags, so they
+# never have closing tags, even when the value is empty. From the OFX 1.6
+# spec: signon, account info, bank, credit card and investment statements
+# and the security list.
+ELEMENT_TAGS = frozenset("""
+    ACCESSKEY ACCRDINT ACCTID ACCTKEY ACCTTYPE ADDR1 ADDR2 ADDR3 APPID APPVER
+    ASSETCLASS AUTHTOKEN AVAILCASH AVGCOSTBASIS BALAMT BALTYPE BANKID
+    BRANCHID BROKERID BUYPOWER BUYTYPE CALLPRICE CALLTYPE CHECKNUM CHKANDDEB
+    CITY CLIENTUID CLTCOOKIE CODE COMMISSION CORRECTACTION CORRECTFITID
+    COUNTRY COUPONFREQ COUPONRT CURDEF CURRATE CURSYM DEBTCLASS DEBTTYPE
+    DENOMINATOR DESC DTACCTUP DTASOF DTAVAIL DTCALL DTCLIENT DTCOUPON DTEND
+    DTEXPIRE DTMAT DTPOSTED DTPRICEASOF DTPROFUP DTSERVER DTSETTLE DTSTART
+    DTTRADE DTUSER DTYIELDASOF EXTDNAME FEES FI.ASSETCLASS FID FITID
+    FRACCASH GAIN GENUSERKEY HELDINACCT INCLUDE INCOMETYPE INTU.BID
+    INTU.BROKERID INTU.USERID INV401KSOURCE INVACCTTYPE LANGUAGE LOAD MARGIN
+    MARGINBALANCE MARKDOWN MARKUP MEMO MESSAGE MFTYPE MKTGINFO MKTVAL NAME
+    NEWUNITS NUMERATOR OLDUNITS OPTBUYTYPE OPTSELLTYPE OPTTYPE ORG PARVALUE
+    PAYEEID PERCENT PHONE POSTALCODE POSTYPE RATING REFNUM RELFITID RELTYPE
+    SECNAME SECURED SELLREASON SELLTYPE SESSCOOKIE SEVERITY SHORTBALANCE
+    SHPERCTRCT SIC SRVRTID STATE STOCKTYPE STRIKEPRICE SUBACCTFROM
+    SUBACCTFUND SUBACCTSEC SUBACCTTO SUPTXDL SVCSTATUS TAN TAXES
+    TAXEXEMPT TFERACTION TICKER TOTAL TRNAMT TRNTYPE TRNUID TSKEYEXPIRE
+    UNIQUEID UNIQUEIDTYPE UNITPRICE UNITS UNITTYPE USERID USERKEY USERPASS
+    VALUE WITHHOLDING XFERDEST XFERSRC YIELD YIELDTOCALL YIELDTOMAT
+    """.split())
+
+# OFX datetimes: YYYYMMDD[HHMMSS[.XXX]][[gmt offset[:tz name]]]
+# groups: year, month, day, hour, minute, second, milliseconds, offset
+# Nothing else is allowed, so anything unexpected is an error rather than
+# being quietly ignored.
+DATETIME_RE = re.compile(r"""
+    ^(\d{4})(\d\d)(\d\d)
+    (?:(\d\d)(\d\d)(\d\d)(?:\.(\d{3}))?)?
+    (?:\[([-+]?\d+(?:\.\d+)?)(?::\w+)?\])?$
+    """, re.VERBOSE)
+
+# The number of distinct datetime and amount strings to remember the
+# conversion of.
+DATETIME_CACHE_SIZE = 4096
+AMOUNT_CACHE_SIZE = 4096
+
+# Every transaction must have these; one without them means the file (or
+# the closing of its tags) is broken.
+REQUIRED_TRANSACTION_TAGS = ('FITID', 'TRNAMT', 'DTPOSTED')
+
+# Statement transaction responses and the statement objects they're
+# parsed into.
+STATEMENT_TAGS = {'STMTTRNRS': 'BankStatement',
+                  'CCSTMTTRNRS': 'CreditCardStatement',
+                  'INVSTMTTRNRS': 'InvestmentStatement',
+                  }
+
+# Statement account aggregates: the statement attribute they're parsed into
+ACCOUNT_FROM_TAGS = {'BANKACCTFROM': 'bank_acct_from',
+                     'CCACCTFROM': 'cc_acct_from',
+                     'INVACCTFROM': 'inv_acct_from',
+                     }
+
+TRANSACTION_LIST_TAGS = ('BANKTRANLIST', 'INVTRANLIST')
+
 
 class ParseOFX(object):
     """
@@ -108,6 +186,14 @@ class ParseOFX(object):
 
     ParseOFX does *not* close any streams (# XXX: is this what I want?)
 
+    The data is read in a single pass with an lxml pull parser. Each
+    transaction is built when its closing tag is reached and its elements
+    are then thrown away, so memory doesn't grow with the number of
+    transactions. Use :meth:`iter_transactions` (with ``parse=False``) to
+    handle transactions one at a time without keeping them, or
+    :meth:`iter_statements` to handle each statement in the response on
+    its own.
+
     Attributes:
     ------------------
     stuff
@@ -125,7 +211,7 @@ class ParseOFX(object):
     None
 
     """
-    def __init__(self, ofx_data, newline=LINE_ENDING):
+    def __init__(self, ofx_data, newline=LINE_ENDING, parse=True):
         self.newline = newline
         self.insitution = None
         self.accounts = []
@@ -136,28 +222,21 @@ class ParseOFX(object):
         self.sonrs = None
         self.sonrq = None
         self.statement = None
+        self.statements = []
         self.fi = None
+        self._reader = None
+        self._lock = threading.Lock()
 
-        # convert ofx_data to a stream
+        # convert ofx_data to a stream. Open files are read from directly,
+        # a chunk at a time, rather than copied into memory first.
         # TODO: Handle closing of opened streams
         logging.debug(type(ofx_data))
         if type(ofx_data) == str:
             ofx_data = io.StringIO(ofx_data, newline=self.newline)
         elif type(ofx_data) == bytes:
-            ofx_data = str(ofx_data, encoding='utf-8')
-            ofx_data = io.StringIO(ofx_data, newline=self.newline)
-        elif type(ofx_data) == io.BufferedReader:
-            try:
-                ofx_data = io.StringIO(ofx_data.read(),
-                                       newline=self.newline)
-            except TypeError:
-                ofx_data = io.StringIO(ofx_data.read().decode("utf-8"),
-                                       newline=self.newline)
-#            pass
-        elif type(ofx_data) == io.StringIO:
+            ofx_data = io.BytesIO(ofx_data)
+        elif isinstance(ofx_data, io.IOBase):
             pass
-        elif type(ofx_data) == io.TextIOWrapper:
-            ofx_data = io.StringIO(ofx_data.read(), newline=self.newline)
         else:
             error_text = ("Arguement `ofx_data` must be a string, opened",
                           " file stream, or StringIO stream.",
@@ -169,13 +248,16 @@ class ParseOFX(object):
         self.insitution = None
         self.accounts = []
 
+        self._start = ofx_data.tell() if ofx_data.seekable() else None
+
         # TODO: decide if I want the file preprocessing to happen here
         #       or within parse().
         #       Advantage of within parse() is that then others can call
         #       parse on unclean files
 
         # Start the parsing.
-        self.parse()
+        if parse:
+            self.parse()
 
     def parse_accounts(self):
         """ Temporary parser, will delete later """
@@ -191,179 +273,259 @@ class ParseOFX(object):
     def parse(self):
         """
         Parses the entire file or string
-        """
-        # Process the file to make it valid XML for BeautifulSoup
-        self.ofx_data, self.header = strip_header(self.ofx_data)
-        self.ofx_data = close_tags(self.ofx_data)
-
-        # Parse it with BeautifulSoup
-        self.soup = BeautifulSoup(self.ofx_data, "xml")
 
-        # raise an error if the file's empty
-        if len(self.soup.contents) == 0:
-            raise EOFError("The OFX file was empty, I guess?")
+        The transactions are kept on the statement they belong to.
+        """
+        for statement, transaction in self._iter_parse():
+            if transaction is None:
+                self.statements.append(statement)
+            else:
+                statement.transactions.append(transaction)
 
-        self._find_ofx_items()
+        return self
 
-        return self.soup
+    def iter_statements(self):
+        """
+        Parse the file or string, yielding each statement as it's reached.
+
+        There's one statement for each statement transaction response
+        (STMTTRNRS, CCSTMTTRNRS or INVSTMTTRNRS). A statement is yielded
+        once its account details are read, before its transactions; the
+        balances come after the transactions and are filled in when the
+        statement has been read to the end.
+
+        Each statement's transactions are read with its
+        ``iter_transactions()`` and aren't kept. The statements share a
+        single pass over the data: transactions that are read while getting
+        to those of another statement wait on their own statement until
+        they're asked for. The statements can be handled in separate
+        threads.
+
+        Yields:
+        -------
+        statement : OFXStatement object
+        """
+        self._reader = self._iter_parse()
+        index = 0
+        while index < len(self.statements) or self._read_more():
+            if index < len(self.statements):
+                yield self.statements[index]
+                index += 1
+
+    def _read_more(self):
+        """
+        Read the next statement or transaction for `iter_statements`.
 
-    def _find_ofx_items(self):
+        Returns:
+        --------
+        bool :
+            False if there's nothing left to read.
         """
-        Searches for and saves all of the OFX items
+        with self._lock:
+            try:
+                statement, transaction = next(self._reader)
+            except StopIteration:
+                for statement in self.statements:
+                    statement._complete = True
+                return False
+
+            if transaction is None:
+                statement._reader = self._read_more
+                self.statements.append(statement)
+            else:
+                statement._pending.append(transaction)
+            return True
+
+    def iter_transactions(self):
         """
-        # TODO: Add request items
-        # TODO: Refactor the following code
-        #       Looks like I could make one or two generic functions
-        #       and then just pass the tag string (and perhaps the method).
+        Parse the file or string, yielding each transaction as it's read.
 
+        The sign on, financial institution, account and statement details
+        are set on this object as they're reached. Transactions aren't
+        added to :attr:`statement`.
 
-        ### Sign On Message Responses #######################################
+        Yields:
+        -------
+        transaction : BankTransaction object
+        """
+        for _, transaction in self._iter_parse():
+            if transaction is not None:
+                yield transaction
+
+    def _iter_parse(self):
+        """
+        Run the parse engine over the data.
+
+        Yields:
+        -------
+        (statement, transaction) : (OFXStatement, BankTransaction)
+            Each transaction and the statement that it's in. Each statement
+            first comes with a transaction of None once it's ready to
+            be read.
+        """
+        self.accounts = []
+        self.statement = None
+        self.statements = []
+
+        # Process the file to make it valid XML
+        if self._start is not None:
+            self.ofx_data.seek(self._start)
+        chunks = iter_text(self.ofx_data)
+        self.header, chunks = _split_header(chunks)
+
+        # Recover from things like a missing </OFX> at the end, which real
+        # files have. Broken structure inside a transaction shows up as it
+        # missing its required tags; see `_transaction`.
+        parser = etree.XMLPullParser(events=('start', 'end'), recover=True)
+        statement = None
+        ready = False
+        found_root = False
+        for chunk in _close_tags(chunks):
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                found_root = True
+                if event == 'start':
+                    if elem.tag in STATEMENT_TAGS:
+                        statement = self._start_statement(elem.tag)
+                        ready = False
+                    elif elem.tag in TRANSACTION_LIST_TAGS and not ready:
+                        if statement is not None:
+                            ready = True
+                            yield statement, None
+                    continue
+
+                if elem.tag == 'STMTTRN':
+                    if statement is not None:
+                        yield statement, _transaction(elem)
+                    _discard(elem)
+                elif elem.tag in STATEMENT_TAGS and statement is not None:
+                    if not ready:
+                        yield statement, None
+                    statement._complete = True
+                    statement = None
+                    _discard(elem)
+                else:
+                    self._end_element(elem, statement)
 
-        # Find the single Sign On Response
-        self.sonrs_soup = self.soup.find("SONRS")
-        if self.sonrs_soup is not None:
-            self._parse_sonrs()
+        # raise an error if the file's empty
+        if not found_root:
+            raise EOFError("The OFX file was empty, I guess?")
+        parser.close()
 
-        # Find the single Sign On Request
-        self.sonrq_soup = self.soup.find("SONRQ")
-        if self.sonrq_soup is not None:
-            self._parse_sonrq()
+    def _start_statement(self, tag):
+        """ Start a new statement; the first one is :attr:`statement` """
+        statement = globals()[STATEMENT_TAGS[tag]]()
+        statement.transactions = []
+        if self.statement is None:
+            self.statement = statement
+        return statement
 
-        # Find the Financial Institution
-        self.fi_soup = self.soup.find("FI")
-        if self.fi_soup is not None:
-            self._parse_financial_institution()
+    def _end_element(self, elem, statement):
+        """
+        Handle a closing tag of anything other than a transaction.
+        """
+        # TODO: Add request items
+        tag = elem.tag
+        parent = elem.getparent()
+        parent_tag = None if parent is None else parent.tag
+        grandparent = None if parent is None else parent.getparent()
+        in_statement = (grandparent is not None
+                        and grandparent.tag in STATEMENT_TAGS)
 
+        ### Sign On Message Responses #######################################
+        if tag == 'SONRS':
+            self._parse_sonrs(elem)
+        elif tag == 'SONRQ':
+            self._parse_sonrq(elem)
+        elif tag == 'FI' and self.fi is None:
+            self._parse_financial_institution(elem)
 
         ### Statements ######################################################
-
-        # Find the Account Info Response
-        self.acctinfors_soup = self.soup.find("ACCTINFORS")
-        if self.acctinfors_soup is not None:
-            self._parse_acct_info_response()
-
-        # Find all of the Bank Statement Responses
-        # Note: Could use soup("STMTRS"); its the same as soup.findAll()
-        self.stmttrnsrs_soup = self.soup.find("STMTTRNRS")
-        if (self.stmttrnsrs_soup is not None
-            and len(self.stmttrnsrs_soup) != 0):        # I prefer explicit
-            self._parse_bank_statement_response()
-
-        # Find all of the Credit Card Statement Responses
-        self.ccstmtrs_soup = self.soup.findAll("CCSTMTRS")
-        if len(self.ccstmtrs_soup) != 0:
-            self._parse_cc_statement_response()
-
-        # Find all of the Investment Statement Responses
-        self.invstmtrs_soup = self.soup.findAll("INVSTMTRS")
-        if len(self.invstmtrs_soup) != 0:
-            self._parse_inv_statement_response()
-
-    def _parse_sonrs(self):
+        elif tag == 'ACCTINFORS':
+            self._parse_acct_info_response(elem)
+        elif statement is None:
+            pass
+        elif (tag in ('DTSTART', 'DTEND')
+                and parent_tag in TRANSACTION_LIST_TAGS):
+            setattr(statement, tag.lower(), convert_datetime(elem.text))
+        elif not in_statement:
+            pass
+        elif tag == 'CURDEF':
+            # TODO: enum?
+            statement.curdef = elem.text
+        elif tag in ACCOUNT_FROM_TAGS:
+            setattr(statement, ACCOUNT_FROM_TAGS[tag], _account_from(elem))
+        elif tag == 'LEDGERBAL':
+            statement.ledger_balance = _balance(elem)
+        elif tag == 'AVAILBAL':
+            statement.available_balance = _balance(elem)
+
+    def _parse_sonrs(self, elem):
         """
         Parses the Sign On Response (SONRS)
         """
         self.sonrs = SignOnResponse()
-        self.sonrs.status = parse_status(self.sonrs_soup)
-        self.sonrs.dt_server = parse_datetime(self.sonrs_soup)
-        self.sonrs.language = self.soup.find("LANGUAGE").contents[0]
+        self.sonrs.status = _status(elem)
+        self.sonrs.dt_server = _datetime(elem, "DTSERVER")
+        self.sonrs.language = elem.findtext("LANGUAGE")
 #        self.sonrs.fi = self._parse_financial_institution()
 
-    def _parse_sonrq(self):
+    def _parse_sonrq(self, elem):
         """
         Parses the Sign On Request (SONRQ)
         """
         self.sonrq = SignOnRequest()
-        self.sonrq.dt_client = parse_datetime(self.sonrq_soup)
-        self.sonrq.user_id = self.soup.find("USERID").contents[0]
-        self.sonrq.user_password = self.soup.find("USERPASS").contents[0]
-        self.sonrq.language = self.soup.find("LANGUAGE").contents[0]
-        self.sonrq.app_id = self.soup.find("APPID").contents[0]
-        self.sonrq.app_version = self.soup.find("APPVER").contents[0]
-
-    def _parse_bank_statement_response(self):
-        """
-        Parses the Statement Response (STMTRS)
-        """
-        stmt = OFXStatement()
-        stmt.dtstart = parse_datetime(self.stmttrnsrs_soup, "DTSTART")
-        stmt.dtend = parse_datetime(self.stmttrnsrs_soup, "DTEND")
-
-        # TODO: enum?
-        stmt.curdef = self.stmttrnsrs_soup.find("CURDEF").contents[0]
-
-        # TODO: decimal.Decimal
-        ledger_bal_soup = self.stmttrnsrs_soup.find("LEDGERBAL")
-        stmt.ledger_balance = parse_balance(ledger_bal_soup)
-        avail_bal_soup = self.stmttrnsrs_soup.find("AVAILBAL")
-        stmt.available_balance = parse_balance(avail_bal_soup)
-
-        # Find every transaction
-        trans = OFXTransaction()
-        stmt.transactions = []
-        for transaction_soup in self.stmttrnsrs_soup.findAll("STMTTRN"):
-            #
-            trans = parse_transaction(transaction_soup)
-            stmt.transactions.append(trans)
-
-        self.statement = stmt
-
-
-    def _parse_cc_statement_response(self):
-        """
-        Parses the Credit Card Statement Response (CCSTMTRS)
-        """
-        pass
-
-    def _parse_inv_statement_response(self):
-        """
-        Parses the Investment Statement Response (INVSTMTRS)
-        """
-        pass
-
-    def _parse_acct_info_response(self):
+        self.sonrq.dt_client = _datetime(elem, "DTCLIENT")
+        self.sonrq.user_id = elem.findtext("USERID")
+        self.sonrq.user_password = elem.findtext("USERPASS")
+        self.sonrq.language = elem.findtext("LANGUAGE")
+        self.sonrq.app_id = elem.findtext("APPID")
+        self.sonrq.app_version = elem.findtext("APPVER")
+
+    def _parse_acct_info_response(self, elem):
         """
         Parses the Account Info Response (ACCTINFORS)
         """
-        dt = parse_datetime(self.acctinfors_soup)
-
-        for _acct_info in self.acctinfors_soup.findAll("ACCTINFO"):
-            acct = Account()
+        dt = _datetime(elem, "DTACCTUP")
 
-            # TODO: optimize
-            if _acct_info.find("INVACCTINFO"):
+        for _acct_info in elem.iterfind("ACCTINFO"):
+            if _acct_info.find("INVACCTINFO") is not None:
                 acct = InvestmentAccount()
                 acct.account_type = AccountType.investment
                 # TODO: more investment account items
-            elif _acct_info.find("CCACCTINFO"):
+            elif _acct_info.find("CCACCTINFO") is not None:
                 acct = CreditCardAccount()
-                acct.account_type = AccountType.creditcard
-            elif _acct_info.find("BANKACCTINFO"):
+                acct.account_type = AccountType.creditcrd
+            elif _acct_info.find("BANKACCTINFO") is not None:
                 acct = BankAccount()
-                acct.account_type = AccountType.bank
-                acct.bank_id = _acct_info.find("BANKID").contents[0]
+                acct_type = _acct_info.findtext(".//ACCTTYPE", "").lower()
+                try:
+                    acct.account_type = AccountType[acct_type]
+                except KeyError:
+                    acct.account_type = AccountType.unknown
+                acct.bank_id = _acct_info.findtext(".//BANKID")
             else:
                 raise TypeError("Unknown Account Type")
 
             # Items in every Account
-            acct.desc = _acct_info.find("DESC").contents[0]
-            acct.account_id = _acct_info.find("ACCTID").contents[0]
-            acct.suptxdl = _acct_info.find("SUPTXDL").contents[0]
-            acct.xfersrc = _acct_info.find("XFERSRC").contents[0]
-            acct.xferdest = _acct_info.find("XFERDEST").contents[0]
-            acct.svcstatus = _acct_info.find("SVCSTATUS").contents[0]
+            acct.desc = _acct_info.findtext("DESC")
+            acct.account_id = _acct_info.findtext(".//ACCTID")
+            acct.suptxdl = _acct_info.findtext(".//SUPTXDL")
+            acct.xfersrc = _acct_info.findtext(".//XFERSRC")
+            acct.xferdest = _acct_info.findtext(".//XFERDEST")
+            acct.svcstatus = _acct_info.findtext(".//SVCSTATUS")
 
             acct.dt_acct_up = dt
 
             self.accounts.append(acct)
 
-    def _parse_financial_institution(self):
+    def _parse_financial_institution(self, elem):
         """
         Parses the Financial Institution (FI)
         """
         self.fi = FinancialInstitution()
-        self.fi.org = self.fi_soup.find('ORG').contents[0]
-        self.fi.fid = self.fi_soup.find('FID').contents[0]
+        self.fi.org = elem.findtext('ORG')
+        self.fi.fid = elem.findtext('FID')
 
 
 def parse_status(soup):
@@ -445,7 +607,8 @@ def convert_datetime(ofx_dt):
     Converts an OXF datetime string to a Python datetime object.
 
     Raises error if the string is ont a recognized format (such as missing
-    seconds). Raises error if the conversion to datetime fails.
+    seconds, a timezone offset with no number or anything after the
+    timezone). Raises error if the conversion to datetime fails.
         XXX: But if I've verified the string with regex, why would it fail?
 
     Parameters:
@@ -462,42 +625,34 @@ def convert_datetime(ofx_dt):
     ------
     See OFX Standard 2.1.1, section 3.2.8 for more information.
 
+    Conversions are cached, as many transactions share a date.
+
     """
-    # Get the time zone
-    tz_type = re.search(r"\[(?P<tz>[-+]?\d+\.?\d*)\:\w*\]$", ofx_dt)
-    if tz_type is not None:
-        tz = float(tz_type.group('tz'))
-    else:
-        tz = 0
+    # A cache holding on to bs4 strings would keep their whole tree alive.
+    return _convert_datetime(str(ofx_dt).strip())
 
-    tz_offset = datetime.timedelta(hours=tz)
 
-    strptime = datetime.datetime.strptime
+@functools.lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _convert_datetime(ofx_dt):
+    """ The cached part of `convert_datetime` """
+    match = DATETIME_RE.match(ofx_dt)
+    if match is None:
+        raise ValueError("Unknown OFX datetime format")
 
-    # Parse the string, falling back on various formats
-    # TODO: Change logic to use regex instead.
-    #       1st, match string to re. if no match, then raise ValueError
-    #       2nd, parse string to datetime object. If fail, raise.
+    year, month, day, hour, minute, second, fraction, tz = match.groups()
     try:
-        fmt = "%Y%m%d%H%M%S.%f[%z:%Z]"
-        local_dt = strptime(ofx_dt, fmt)
+        local_dt = datetime.datetime(int(year), int(month), int(day),
+                                     int(hour or 0),
+                                     int(minute or 0),
+                                     int(second or 0),
+                                     int((fraction or "").ljust(6, "0")),
+                                     )
     except ValueError:
-        try:
-            fmt = "%Y%m%d%H%M%S.%f"
-            local_dt = strptime(ofx_dt[:18], fmt)
-        except ValueError:
-            try:
-                fmt = "%Y%m%d%H%M%S"
-                local_dt = strptime(ofx_dt[:14], fmt)
-            except ValueError:
-                try:
-                    fmt = "%Y%m%d"
-                    local_dt = strptime(ofx_dt[:8], fmt)
-                except ValueError:
-                    raise ValueError("Unknown OFX datetime format")
+        raise ValueError("Unknown OFX datetime format")
 
-    timestamp = local_dt - tz_offset
-    return timestamp
+    if tz:
+        local_dt -= datetime.timedelta(hours=float(tz))
+    return local_dt
 
 
 def parse_transaction(soup):
@@ -511,29 +666,30 @@ def parse_transaction(soup):
 
     Returns:
     --------
-    transaction : OFXTransaction object
+    transaction : BankTransaction object
         The parsed transaction object.
 
     """
-    transaction = OFXTransaction()
     transaction = BankTransaction()
 
-    transaction.trntype = soup.find("TRNTYPE").contents[0]     # TODO: Enum?
+    # str() the contents so that the transaction doesn't keep the soup.
+    trntype = str(soup.find("TRNTYPE").contents[0])
+    transaction.trntype = _transaction_type(trntype)
     transaction.dtposted = parse_datetime(soup, "DTPOSTED")
     try:
         transaction.dtuser = parse_datetime(soup, "DTUSER")
     except AttributeError:
         transaction.dtuser = None
-    transaction.trnamt = soup.find("TRNAMT").contents[0]    # TODO: Decimal
-    transaction.fitid = soup.find("FITID").contents[0]      # TODO: int?
+    transaction.trnamt = _amount(str(soup.find("TRNAMT").contents[0]))
+    transaction.fitid = str(soup.find("FITID").contents[0])      # TODO: int?
     try:
-        transaction.checknum = soup.find("CHECKNUM").contents[0]    # TODO: int?
+        transaction.checknum = str(soup.find("CHECKNUM").contents[0])
     except AttributeError:
         transaction.checknum = None
 
-    transaction.name = soup.find("NAME").contents[0]
+    transaction.name = _intern(str(soup.find("NAME").contents[0]))
     try:
-        transaction.memo = soup.find("MEMO").contents[0]
+        transaction.memo = _intern(str(soup.find("MEMO").contents[0]))
     except AttributeError:
         transaction.memo = None
 
@@ -559,6 +715,118 @@ def parse_balance(soup):
     balance.as_of_date = parse_datetime(soup, "DTASOF")
     return balance
 
+def _status(elem):
+    """ Like `parse_status`, for an lxml element """
+    status = Status()
+    try:
+        status.code = int(elem.find('.//CODE').text)
+        status.severity = elem.find('.//SEVERITY').text
+    except AttributeError:
+        raise AttributeError("Could not find 'CODE' or 'SEVERITY' tag.")
+    status.message = elem.findtext('.//MESSAGE')
+    return status
+
+
+def _datetime(elem, tag):
+    """ Like `parse_datetime`, for an lxml element; None if missing """
+    text = elem.findtext(tag)
+    if text is None:
+        return None
+    return convert_datetime(text)
+
+
+def _balance(elem):
+    """ Like `parse_balance`, for an lxml element """
+    balance = OFXBalance()
+    balance.balance = decimal.Decimal(elem.findtext("BALAMT"))
+    balance.as_of_date = _datetime(elem, "DTASOF")
+    return balance
+
+
+def _account_from(elem):
+    """
+    Parse a statement's BANKACCTFROM, CCACCTFROM or INVACCTFROM element.
+    """
+    if elem.tag == 'BANKACCTFROM':
+        acct_from = BankAccountFrom()
+        acct_from.bank_id = elem.findtext("BANKID")
+        try:
+            acct_from.acct_type = AccountType[
+                elem.findtext("ACCTTYPE", "").lower()]
+        except KeyError:
+            acct_from.acct_type = AccountType.unknown
+    elif elem.tag == 'CCACCTFROM':
+        acct_from = CreditCardAccountFrom()
+    else:
+        acct_from = InvestmentAccountFrom()
+        acct_from.broker_id = elem.findtext("BROKERID")
+    acct_from.acct_id = elem.findtext("ACCTID")
+    return acct_from
+
+
+def _transaction(elem):
+    """
+    Like `parse_transaction`, for an lxml element.
+
+    Raises ValueError if any of REQUIRED_TRANSACTION_TAGS is missing or
+    empty.
+    """
+    missing = [tag for tag in REQUIRED_TRANSACTION_TAGS
+               if not elem.findtext(tag)]
+    if missing:
+        msg = "Transaction {!r} is missing {}".format(elem.findtext("FITID"),
+                                                      ", ".join(missing))
+        raise ValueError(msg)
+
+    transaction = BankTransaction()
+
+    transaction.trntype = _transaction_type(elem.findtext("TRNTYPE"))
+    transaction.dtposted = _datetime(elem, "DTPOSTED")
+    transaction.dtuser = _datetime(elem, "DTUSER")
+    transaction.trnamt = _amount(elem.findtext("TRNAMT"))
+    transaction.fitid = elem.findtext("FITID")      # TODO: int?
+    transaction.checknum = elem.findtext("CHECKNUM")    # TODO: int?
+    transaction.name = _intern(elem.findtext("NAME"))
+    transaction.memo = _intern(elem.findtext("MEMO"))
+
+    return transaction
+
+
+def _transaction_type(trntype):
+    """ The TransactionType for a TRNTYPE value """
+    if trntype is None:
+        return TransactionType.unknown
+    return TRANSACTION_TYPES.get(trntype.strip().upper(),
+                                 TransactionType.unknown)
+
+
+@functools.lru_cache(maxsize=AMOUNT_CACHE_SIZE)
+def _amount(amount):
+    """ The Decimal for an amount string; equal amounts share one object """
+    if amount is None:
+        return None
+    return decimal.Decimal(amount)
+
+
+def _intern(text):
+    """ Intern a string that's likely to repeat, such as a payee name """
+    if text is None:
+        return None
+    return sys.intern(text)
+
+
+def _discard(elem):
+    """
+    Free a fully parsed element, and anything before it, from the tree
+    the pull parser is building.
+    """
+    elem.clear()
+    parent = elem.getparent()
+    if parent is not None:
+        while elem.getprevious() is not None:
+            del parent[0]
+
+
 def strip_header(ofx_stream):
     """
     Strips and saves the header from the OFX data.
@@ -578,14 +846,20 @@ def strip_header(ofx_stream):
         A dictionary containing the header.
 
     """
-    header = {}
-
     # Read subset of the file in case it's huge; find where the header ends
     header_str = ofx_stream.read(2048)
     header_end = header_str.find('<')
-    header_str = header_str[:header_end]
+    header = _parse_header(header_str[:header_end])
+
+    # Seek back to the end of the header.
+    ofx_stream.seek(header_end, 0)
+
+    return ofx_stream, header
+
 
-    # iterate though the header, saving key-value pairs and skipping blanks
+def _parse_header(header_str):
+    """ The header's key-value pairs as a dict, skipping blank lines """
+    header = {}
     for line in header_str.splitlines():
         if line.strip() == "":
             continue
@@ -597,26 +871,77 @@ def strip_header(ofx_stream):
 
         header[key] = value
 
-    # Seek back to the end of the header and overwrite the original stream.
-    ofx_stream.seek(header_end, 0)
-    ofx_stream = io.StringIO(ofx_stream.read())
+    return header
 
-    return ofx_stream, header
+
+def _split_header(chunks):
+    """
+    Split the header off the front of the OFX data.
+
+    Parameters:
+    -----------
+    chunks : iterator of str
+        The OFX data, a chunk at a time.
+
+    Returns:
+    --------
+    header : dict
+        A dictionary containing the header.
+
+    chunks : iterator of str
+        The rest of the OFX data, a chunk at a time.
+    """
+    header_str = ""
+    for chunk in chunks:
+        header_str += chunk
+        header_end = header_str.find('<')
+        if header_end != -1:
+            rest = header_str[header_end:]
+            header = _parse_header(header_str[:header_end])
+            return header, itertools.chain([rest], chunks)
+    return _parse_header(header_str), iter(())
+
+
+def iter_text(ofx_stream, encoding='utf-8'):
+    """
+    Read a stream of OFX data a chunk at a time.
+
+    Parameters:
+    -----------
+    ofx_stream : io.IOBase object
+        The opened file object stream or StringIO stream of OFX data.
+        Binary streams are decoded as they're read.
+
+    encoding : str
+        The encoding of binary streams.
+
+    Yields:
+    -------
+    chunk : str
+        Up to CHUNK_SIZE characters of the stream.
+    """
+    decoder = None
+    while True:
+        chunk = ofx_stream.read(CHUNK_SIZE)
+        if not isinstance(chunk, str):
+            if decoder is None:
+                decoder = codecs.getincrementaldecoder(encoding)()
+            final = not chunk
+            chunk = decoder.decode(chunk, final)
+            if final:
+                if chunk:
+                    yield chunk
+                return
+        elif chunk == "":
+            return
+        if chunk:
+            yield chunk
 
 
-# TODO: close_tags fails if there are no closing tags already
-#       Example:
-#       >>> close_tags("<CODE>0<SEVERITY>INFO")
-#       <CODE>0</CODE><SEVERITY>INFO
-#       # Should be:
-#       <CODE>0</CODE><SEVERITY>INFO</SEVERITY>
 def close_tags(ofx_stream):
     """
     Closes any open tags, thus turning ofx_data into a valid XML stream.
 
-    Also removes any processing tags "<?Processing_tag>" and comments
-    "<!-- comment -->".
-
     Parameters:
     -----------
     ofx_stream : io.IOBase object
@@ -627,59 +952,142 @@ def close_tags(ofx_stream):
     new_stream : io.IOBase object
         A new stream with the same OFX data, but now with closed tags.
 
+    See Also:
+    ---------
+    iter_close_tags : The same, a chunk at a time.
+    """
+    new_stream = ChunkReader(iter_close_tags(ofx_stream))
+    return new_stream
+
+
+def iter_close_tags(ofx_stream):
+    """
+    Closes any open tags, yielding the valid XML a chunk at a time.
+
+    OFX 1.x is SGML: elements (tags holding a value) don't need closing
+    tags but aggregates (tags holding other tags) do. So an opening tag
+    followed by text is an element and is closed at the next tag, unless
+    that tag is its own closing tag. An opening tag followed directly by
+    another tag is an aggregate, unless it's one of the known
+    :data:`ELEMENT_TAGS`, in which case it's an empty element and is
+    closed too.
+
+    Whitespace around the tags is removed, as are any processing tags
+    "<?Processing_tag>" and comments "<!-- comment -->". Bare "&"s in the
+    text are escaped.
+
+    Parameters:
+    -----------
+    ofx_stream : io.IOBase object
+        The opened file object stream or StringIO stream of OFX data
+
+    Yields:
+    -------
+    chunk : str
+        The closed-up XML for about CHUNK_SIZE characters of the stream.
+
     Notes:
     ------
-    This was taken from Jerry's ofxparse.OfxPreprocessedFile.__init__ code
-    and modified to be cleaner and easier to read. The core algorithm remains
-    the same.
-    """
-    # Read the file and create a new stream.
-    ofx_string = ofx_stream.read()
-    new_stream = io.StringIO()
-
-    # We'll need some regex...
-    opening_tag_re = re.compile(r"<([\w\.]+)>")     # <t_.x>   group: t_.x
-    closing_tag_re = re.compile(r"</([\w\.]+)>")    # </t_.x>  group: t_.x
-    token_re = re.compile(r"(</?[\w\.]+>)")         # <t_.x>   group: <t_.x>
-
-    # Find all the closing tags
-    closing_tags = [tag.upper()
-                    for tag
-                    in re.findall(closing_tag_re, ofx_string)]
-
-    # Read all of the tokens
-    tag_tokens = re.split(token_re, ofx_string)
-
-    # Iterate through the tokens, writing them to the new string and adding
-    # closing tags as needed.
-    last_open_tag = None
-    for num, token in enumerate(tag_tokens):
-        # Determine what type of tag it is
-        is_closing_tag = token.startswith("</")
-        is_processing_tag = token.startswith("<?")
-        is_cdata = token.startswith("<!")           # comment?
-        is_tag = token.startswith("<") and not is_cdata
-        is_open_tag = is_tag and not is_closing_tag and not is_processing_tag
-
-        # if it's a tag
-        if is_tag:
+    The stream is read once, CHUNK_SIZE characters at a time, so only the
+    current chunk is held in memory.
+    """
+    return _close_tags(iter_text(ofx_stream))
+
+
+def _close_tags(chunks):
+    """ :func:`iter_close_tags`, from an iterator of text chunks """
+    last_open_tag = None        # The last opening tag, if nothing's after it
+    has_text = False            # Whether it's been followed by text
+    buffer = ""
+    while True:
+        chunk = next(chunks, "")
+        buffer += chunk
+
+        # Tags and comments may be split across chunks: only look before
+        # the last "<" and any unfinished comment until the stream is done.
+        if chunk == "":
+            end = len(buffer)
+        else:
+            end = buffer.rfind("<")
+            comment = buffer.rfind("<!--")
+            if comment > buffer.rfind("-->"):
+                end = comment
+
+        new_chunk = []
+        pos = 0
+        for match in TAG_RE.finditer(buffer, 0, end):
+            text = buffer[pos:match.start()].strip()
+            if text:
+                new_chunk.append(BARE_AMPERSAND_RE.sub("&amp;", text))
+                if last_open_tag is not None:
+                    has_text = True
+
+            pos = match.end()
+            closing, tag_name = match.groups()
+            if tag_name is None:
+                continue
+            if last_open_tag is not None:
+                is_element = has_text or last_open_tag.upper() in ELEMENT_TAGS
+                closes_itself = closing and tag_name == last_open_tag
+                if is_element and not closes_itself:
+                    new_chunk.append("</{}>".format(last_open_tag))
+            last_open_tag = None if closing else tag_name
+            has_text = False
+
+            new_chunk.append(match.group(0))
+        buffer = buffer[pos:]
+
+        if chunk == "":
+            # Whatever's left is the text of the last tag, if anything
+            text = buffer.strip()
+            if text:
+                new_chunk.append(BARE_AMPERSAND_RE.sub("&amp;", text))
             if last_open_tag is not None:
-                new_stream.write("</{}>".format(last_open_tag.strip()))
-                last_open_tag = None
-        if is_open_tag:
-            tag_name = re.findall(opening_tag_re, token)[0]
-            if tag_name.upper() not in closing_tags:
-                last_open_tag = tag_name
-        new_stream.write(token.strip())
-    new_stream.seek(0)
+                if text or last_open_tag.upper() in ELEMENT_TAGS:
+                    new_chunk.append("</{}>".format(last_open_tag))
+            if new_chunk:
+                yield "".join(new_chunk)
+            return
 
-    return new_stream
+        if new_chunk:
+            yield "".join(new_chunk)
+
+
+class ChunkReader(io.TextIOBase):
+    """
+    A read-only text stream over an iterator of text chunks.
+
+    The chunks are only pulled from the iterator as they're read.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = ""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            text = self._buffer + "".join(self._chunks)
+            self._buffer = ""
+            return text
+
+        while len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        text, self._buffer = self._buffer[:size], self._buffer[size:]
+        return text
 
 
 class Header(object):
     """
     An OFX Header object
     """
+    __slots__ = ('ofxheader', 'data', 'version', 'security', 'encoding',
+                 'charset', 'compression', 'old_file_uid', 'new_file_uid')
+
     def __init__(self, header_dict=None):
         self.ofxheader = None
         self.data = None
@@ -730,6 +1138,8 @@ class SignOnResponse(object):
         "Every response must contain exactly one <SONRS> record."
             -- OFX Standard 2.1.1, Section 2.5.1
     """
+    __slots__ = ('status', 'dt_server', 'language', 'fi')
+
     def __init__(self):
         self.status = Status()
         self.dt_server = None
@@ -746,6 +1156,9 @@ class SignOnRequest(object):
         Every Open Financial Exchange block contains exactly one <SONRQ>.
             -- OFX Standard 2.1.1, Section 2.5.1
     """
+    __slots__ = ('dt_client', 'user_id', 'user_password', 'language', 'fi',
+                 'app_id', 'app_version')
+
     def __init__(self):
         self.dt_client = None
         self.user_id = None
@@ -769,6 +1182,8 @@ class AccountInfoTranscationResponse(object):
     """
     An OFX AccountInfoTranscationResponse (ACCTINFOTRNRS) object
     """
+    __slots__ = ('trnuid', 'status', 'clt_cookie', 'acct_info_rs')
+
     def __init__(self):
         self.trnuid = None
         self.status = Status()
@@ -780,6 +1195,8 @@ class AccountInfoResponse(object):
     """
     An OFX AccountInfoResponse (ACCTINFORS) object
     """
+    __slots__ = ('dt_acct_up', 'account_info')
+
     def __init__(self):
         self.dt_acct_up = None
         self.account_info = []
@@ -789,6 +1206,8 @@ class AccountInfo(object):
     """
     An OFX AccountInfo (ACCTINFO) object
     """
+    __slots__ = ('desc', 'bank_account_info', 'payment_acct_info')
+
     def __init__(self):
         self.desc = None
         self.bank_account_info = BankAccountInfo()
@@ -799,6 +1218,9 @@ class BankAccountInfo(object):
     """
     An OFX BankAccountInfo (BANKACCTINFO) object
     """
+    __slots__ = ('bank_acct_from', 'suptxdl', 'xfersrc', 'xferdest',
+                 'svcstatus')
+
     def __init__(self):
         self.bank_acct_from = BankAccountFrom()
         self.suptxdl = None
@@ -811,6 +1233,8 @@ class BankAccountFrom(object):
     """
     An OFX BankAccountFrom (BANKACCTFROM) object
     """
+    __slots__ = ('bank_id', 'acct_id', 'acct_type')
+
     def __init__(self):
         self.bank_id = None         # Routing number
         self.acct_id = None         # Account number
@@ -821,6 +1245,8 @@ class BankPaymentAccountInfo(object):
     """
     An OFX BankPaymentAccountInfo (BPACCTINFO) object
     """
+    __slots__ = ('bank_acct_from', 'svcstatus')
+
     def __init__(self):
         self.bank_acct_from = BankAccountFrom()
         self.svcstatus = SVCStatus.unknown
@@ -830,6 +1256,8 @@ class CreditCardAccountInfo(object):
     """
     An OFX CreditCardAccountInfo (CCACCTINFO) object
     """
+    __slots__ = ('cc_acct_from', 'suptxdl', 'xfersrc', 'xferdest', 'svcstatus')
+
     def __init__(self):
         self.cc_acct_from = CreditCardAccountFrom()
         self.suptxdl = None
@@ -842,7 +1270,20 @@ class CreditCardAccountFrom(object):
     """
     An OFX CreditCardAccountFrom (CCACCTFROM) object
     """
+    __slots__ = ('acct_id',)
+
+    def __init__(self):
+        self.acct_id = None
+
+
+class InvestmentAccountFrom(object):
+    """
+    An OFX InvestmentAccountFrom (INVACCTFROM) object
+    """
+    __slots__ = ('broker_id', 'acct_id')
+
     def __init__(self):
+        self.broker_id = None
         self.acct_id = None
 
 # ---------------------------------------------------------------------------
@@ -853,6 +1294,8 @@ class Status(object):
     """
     An OFX Status object
     """
+    __slots__ = ('code', 'severity', 'message')
+
     def __init__(self):
         self.code = None
         self.severity = None
@@ -906,6 +1349,8 @@ class OFXBalance(object):
     balance : decimal.Decimal or None
     as_of_date : datetime.datetime or None
     """
+    __slots__ = ('balance', 'as_of_date')
+
     def __init__(self):
         self.balance = None
         self.as_of_date = None
@@ -943,6 +1388,10 @@ class Account(object):
     """
     An OFX account object.
     """
+    __slots__ = ('statement', 'routing_number', 'branch_id', 'account_type',
+                 'institution', 'type', 'desc', 'account_id', 'suptxdl',
+                 'xfersrc', 'xferdest', 'svcstatus', 'warnings', 'dt_acct_up')
+
     def __init__(self):
         self.statement = None
         self.routing_number = ''
@@ -957,6 +1406,7 @@ class Account(object):
         self.xfersrc = None
         self.xferdest = None
         self.svcstatus = None
+        self.dt_acct_up = None
         # Used for error tracking
         self.warnings = []
 
@@ -965,6 +1415,8 @@ class InvestmentAccount(Account):
     """
     An OFX Investment Account object
     """
+    __slots__ = ('brokerid',)
+
     def __init__(self):
 #        super(InvestmentAccount, self).__init__()
         super().__init__()
@@ -974,6 +1426,8 @@ class BankAccount(Account):
     """
     An OFX Bank Account object
     """
+    __slots__ = ('bank_id', 'bank_account_type')
+
     def __init__(self):
         super().__init__()
         self.bank_id = None
@@ -984,6 +1438,8 @@ class CreditCardAccount(Account):
     """
     And OFX Credit Card Account object
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -996,6 +1452,10 @@ class OFXStatement(object):
     """
     An OFX Statement object
     """
+    __slots__ = ('transactions', 'curdef', 'bank_acct_from', 'dtstart',
+                 'dtend', 'ledger_balance', 'available_balance', '_reader',
+                 '_pending', '_complete')
+
     def __init__(self):
         self.transactions = None
         self.curdef = None
@@ -1005,11 +1465,41 @@ class OFXStatement(object):
         self.ledger_balance = None
         self.available_balance = None
 
+        # Used by ParseOFX.iter_statements
+        self._reader = None
+        self._pending = collections.deque()
+        self._complete = False
+
+    def iter_transactions(self):
+        """
+        Yield the transactions of the statement.
+
+        For statements from `ParseOFX.iter_statements` they're read as
+        they're asked for.
+        """
+        if self._reader is None:
+            yield from self.transactions or []
+            return
+
+        while True:
+            # Check this first: another thread may add the last of the
+            # transactions and then mark the statement complete between
+            # looking at the two.
+            complete = self._complete
+            if self._pending:
+                yield self._pending.popleft()
+            elif complete:
+                return
+            else:
+                self._reader()
+
 
 class BankStatement(OFXStatement):
     """
     An OFX Bank (standard) Statement object
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -1018,16 +1508,25 @@ class CreditCardStatement(OFXStatement):
     """
     An OFX Credit Card Statement Object
     """
+    __slots__ = ('cc_acct_from',)
+
     def __init__(self):
         super().__init__()
+        self.cc_acct_from = None
 
 
 class InvestmentStatement(OFXStatement):
     """
     An OFX Investment Statement object
+
+    Only the bank transactions (INVBANKTRAN) of investment statements are
+    parsed for now.
     """
+    __slots__ = ('inv_acct_from',)
+
     def __init__(self):
         super().__init__()
+        self.inv_acct_from = None
 
 
 # ---------------------------------------------------------------------------
@@ -1055,17 +1554,49 @@ class TransactionType(Enum):
     Other = 17
 
 
+# TRNTYPE values, from OFX Standard 2.1.1, Section 11.4.4.3
+TRANSACTION_TYPES = {'CREDIT': TransactionType.Credit,
+                     'DEBIT': TransactionType.Debit,
+                     'INT': TransactionType.Interest,
+                     'DIV': TransactionType.Dividend,
+                     'FEE': TransactionType.Fee,
+                     'SRVCHG': TransactionType.ServiceCharge,
+                     'DEP': TransactionType.Deposit,
+                     'ATM': TransactionType.ATM,
+                     'POS': TransactionType.PointOfSale,
+                     'XFER': TransactionType.Transfer,
+                     'CHECK': TransactionType.Check,
+                     'PAYMENT': TransactionType.Payment,
+                     'CASH': TransactionType.Cash,
+                     'DIRECTDEP': TransactionType.DirectDeposit,
+                     'DIRECTDEBIT': TransactionType.DirectDebit,
+                     'REPEATPMT': TransactionType.RepeatPayment,
+                     'OTHER': TransactionType.Other,
+                     }
+
+
 class OFXTransaction(object):
     """
     An OFX Tranaction object
     """
-    pass
+    __slots__ = ()
 
 
 class BankTransaction(OFXTransaction):
     """
     An OFX Bank (checking, savings, other?) Transaction object.
+
+    Attributes:
+    -----------
+    trntype : TransactionType
+    dtposted, dtuser : datetime.datetime or None
+    trnamt : decimal.Decimal or None
+    fitid, checknum, name, memo : str or None
+        Names and memos are interned, as they repeat a lot.
     """
+    __slots__ = ('trntype', 'dtposted', 'dtuser', 'trnamt', 'fitid',
+                 'checknum', 'name', 'memo')
+
     def __init__(self):
         super().__init__()
         self.trntype = TransactionType.unknown
@@ -1082,6 +1613,8 @@ class CreditCardTransaction(OFXTransaction):
     """
     An OFX Credit Card Transaction object
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -1089,6 +1622,8 @@ class InvestmentTransaction(OFXTransaction):
     """
     An OFX Investment Transaction object
     """
+    __slots__ = ()
+
     def __init__(self):
         super().__init__()
 
@@ -1099,6 +1634,8 @@ class FinancialInstitution(object):
 
     Gets filled in by `FI.ORG` and `FI.FID`
     """
+    __slots__ = ('org', 'fid')
+
     def __init__(self):
         self.org = None
         self.fid = None
@@ -33,6 +33,9 @@ import numpy as np
 
 # Package / Application
 from . import utils
+from . import orm
+from . import queries
+from . import ledger
 
 
 # ---------------------------------------------------------------------------
@@ -70,9 +73,131 @@ MB_LEFT = 1
 MB_MIDDLE = 2
 MB_RIGHT = 3
 
+# The ordinal of the NumPy datetime64 epoch, 1970-01-01.
+EPOCH_ORDINAL = 719163
+
+# Line plots with more points than this many per pixel of width are
+# decimated before drawing. See `decimate`.
+MAX_POINTS_PER_PIXEL = 4
+
 # ---------------------------------------------------------------------------
 ### Classes
 # ---------------------------------------------------------------------------
+class PlotData(object):
+    """
+    Plot-ready NumPy arrays, aggregated by the database.
+
+    Each result is cached until the data version in ``tracker`` changes,
+    so redrawing a plot when nothing has changed doesn't query anything,
+    and when something has, the cost depends on the number of periods or
+    categories rather than the number of transactions.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`, optional
+        The session to query. Defaults to :data:`pybank.orm.session`.
+    tracker : :class:`pybank.orm.ChangeTracker`, optional
+        Defaults to :data:`pybank.orm.change_tracker`.
+    opening_balance : :class:`decimal.Decimal`, optional
+        The balance before the first transaction.
+    """
+    def __init__(self, session=None, tracker=None,
+                 opening_balance=ledger.OPENING_BALANCE):
+        self.session = orm.session if session is None else session
+        self.tracker = orm.change_tracker if tracker is None else tracker
+        self.opening_balance = opening_balance
+
+        self._cache = {}
+        self._version = None
+
+    def balance(self, period='month'):
+        """
+        Return the balance at the end of each period.
+
+        Parameters
+        ----------
+        period : str, optional
+            One of :data:`pybank.queries.PERIODS`.
+
+        Returns
+        -------
+        dates : ndarray of datetime64[D]
+            The first day of each period that has transactions.
+        cents : ndarray of int64
+            The balance at the end of each period. Undated transactions
+            are counted in the first period, as in the ledger.
+        """
+        return self._cached(('balance', period), self._balance, period)
+
+    def totals(self, period='month'):
+        """
+        Return the number and total of the transactions in each period.
+
+        Returns
+        -------
+        dates : ndarray of datetime64[D]
+            The first day of each period that has dated transactions.
+        counts : ndarray of int64
+        cents : ndarray of int64
+        """
+        return self._cached(('totals', period), self._totals, period)
+
+    def category_totals(self, rollup=False):
+        """
+        Return the number and total of the transactions in each category.
+
+        Parameters
+        ----------
+        rollup : bool, optional
+            If True, include each category's descendants in its totals.
+
+        Returns
+        -------
+        category_ids : ndarray of int32
+            :data:`pybank.ledger.MISSING` for uncategorized transactions.
+        counts : ndarray of int64
+        cents : ndarray of int64
+        """
+        return self._cached(('categories', rollup),
+                            self._category_totals, rollup)
+
+    def _cached(self, key, func, *args):
+        """ Return ``func(*args)``, calculating it only when needed. """
+        if self._version != self.tracker.version:
+            self._cache.clear()
+            self._version = self.tracker.version
+        try:
+            return self._cache[key]
+        except KeyError:
+            logging.debug("querying plot data %s", key)
+            result = self._cache[key] = func(*args)
+            return result
+
+    def _totals(self, period):
+        rows = queries.query_period_totals(self.session, period)
+        days, counts, cents = _columns(rows, 3)
+        dated = days > 0
+        return (_to_datetime64(days[dated]), counts[dated], cents[dated])
+
+    def _balance(self, period):
+        rows = queries.query_period_totals(self.session, period)
+        days, _, cents = _columns(rows, 3)
+        opening = int(self.opening_balance * 100)
+        balances = np.cumsum(cents) + opening
+        if len(days) and days[0] == 0:
+            # Undated rows come first in the ledger; fold them into the
+            # first period.
+            days, balances = days[1:], balances[1:]
+        return _to_datetime64(days), balances
+
+    def _category_totals(self, rollup):
+        rows = queries.query_category_totals(self.session, rollup)
+        rows = [(ledger.MISSING if category_id is None else category_id,
+                 count, cents) for category_id, count, cents in rows]
+        category_ids, counts, cents = _columns(rows, 3)
+        return category_ids.astype(np.int32), counts, cents
+
+
 class wxLinePlot(wxplot.PlotCanvas):
     """
     A Simple line graph with points.
@@ -80,12 +205,56 @@ class wxLinePlot(wxplot.PlotCanvas):
     `data` must be a list, tuple, or numpy array of (x, y) pairs or a list
     of (y1, y2, y3, ..., yn) values. In this case, the x-values are
     assumed to be (1, 2, 3, ..., n)
+
+    The x-values must be in increasing order. Every time the plot is drawn
+    (including on zoom, resize, scroll and reset) only the points needed for
+    the visible x-range at the current width are handed to the canvas; see
+    :func:`decimate`.
     """
     # TODO: Add linear fit
     #       +
     def __init__(self, parent, data, *args, **wkargs):
         wxplot.PlotCanvas.__init__(self, parent=parent, size=(400, 300))
 
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim == 1:
+            self._xdata = np.arange(1, len(data) + 1, dtype=np.float64)
+            self._ydata = data
+        else:
+            self._xdata, self._ydata = data[:, 0], data[:, 1]
+
+        self.GridPen = wx.Pen(wx.Colour(230, 230, 230, 255))
+        self.EnableGrid = (True, True)
+        self.Draw(self._graphics(None))
+
+
+        self.canvas.Bind(wx.EVT_LEFT_DOWN, self._on_click)
+
+    def _Draw(self, graphics, xAxis=None, yAxis=None, dc=None):
+        """
+        Draw the plot, decimated for the visible range and width.
+
+        Override Method. PlotCanvas.Draw and the redraws on zoom, resize,
+        scroll and reset all come through here, so ``graphics`` is rebuilt
+        from the full data every time.
+        """
+        x_range = _axis_range(xAxis)
+        if x_range is not None and self.logScale[0]:
+            # Draw hands log axes over already in log10.
+            x_range = (10 ** x_range[0], 10 ** x_range[1])
+        new_graphics = self._graphics(x_range)
+        new_graphics.logScale = self.logScale
+        wxplot.PlotCanvas._Draw(self, new_graphics, xAxis, yAxis, dc)
+
+    def _graphics(self, x_range):
+        """
+        Build the line and markers for the points to draw in ``x_range``,
+        or all of them if it's ``None``.
+        """
+        width = max(self.GetClientSize()[0], 1)
+        x, y = decimate(self._xdata, self._ydata, width, x_range)
+        data = np.column_stack((x, y))
+
         # Then set up how we're presenting the data. Lines? Point? Color?
         # XXX: Note that wxplot.PolyLine has been changed by me!
         line = wxplot.PolyLine(data,
@@ -101,19 +270,12 @@ class wxLinePlot(wxplot.PlotCanvas):
                                     marker='square',
                                     )
 
-        plot = wxplot.PlotGraphics([line, markers],
+        return wxplot.PlotGraphics([line, markers],
                                    title="Title",
                                    xLabel="X label",
                                    yLabel="Monies",
                                    )
 
-        self.GridPen = wx.Pen(wx.Colour(230, 230, 230, 255))
-        self.EnableGrid = (True, True)
-        self.Draw(plot)
-
-
-        self.canvas.Bind(wx.EVT_LEFT_DOWN, self._on_click)
-
     def _on_click(self, event):
         print("click")
         pass
@@ -154,12 +316,12 @@ class wxParetoPlot(wxplot.PlotCanvas):
     #       + On double-click of a box, break down into subgroups?
     #       + On-Pick event that gets the closest point. This needed?
 
-    def __init__(self, parent, data):
+    def __init__(self, parent, data, weights=None):
         wxplot.PlotCanvas.__init__(self, parent=parent, size=(400, 300))
 
 
         # create the cumulative % data
-        counts, categories = calc_pareto_data(data)
+        counts, categories = calc_pareto_data(data, weights)
         num_categories = len(categories)
 
         # Fake the cumulative line - make it use the left axis
@@ -283,7 +445,7 @@ def linear_regression(x, y, rsq=False):
 
 
 @utils.logged
-def calc_pareto_data(data):
+def calc_pareto_data(data, weights=None):
     """
     Calculates Pareto data (histogram bins in decending order).
 
@@ -292,20 +454,33 @@ def calc_pareto_data(data):
     data : array-like
         1D array of discrete values.
 
+    weights : array-like, optional
+        A weight for each value in `data`, such as the transaction amount.
+        If given, each category's total weight is used instead of its count
+        so that the Pareto is by dollars rather than by number of
+        transactions. Only the size of each weight is used: negative
+        weights, such as money spent, count as positive so that the
+        cumulative line never falls.
+
     Returns:
     --------
     counts : array
-        The counts for each category, in decending order
+        The counts (or total weights) for each category, in decending order
 
     categories : array
         The categories that the data falls in, in decending count order.
 
     """
+    if weights is not None:
+        weights = np.abs(np.asarray(weights, dtype=np.float64))
+
     # Get the histogram information
-    labels, counts = np.unique(data, return_counts=True)
+    labels, inverse = np.unique(data, return_inverse=True)
+    counts = np.bincount(inverse.ravel(), weights=weights,
+                         minlength=len(labels))
 
-    # re-order in descending order
-    sort_order = np.argsort(counts, kind='heapsort')[::-1]
+    # re-order in descending order; a stable sort keeps ties in label order
+    sort_order = np.argsort(-counts, kind='mergesort')
     counts = counts[sort_order]
     categories = labels[sort_order]
 
@@ -315,16 +490,22 @@ def calc_pareto_data(data):
 def calc_pareto_cum_line(counts):
     """
     Calculates the cumulative line for pareto data
-    """
-    # create cumulative line data
-    line_data = [0.0] * len(counts)
-    total_data = float(sum(counts))
-    for i, d in enumerate(counts):
-        # TODO: this loop seems wonky. Is there a better way?
-        if i == 0:
-            line_data[i] = d/total_data
-        else: line_data[i] = sum(counts[:i + 1])/total_data
 
+    Parameters:
+    -----------
+    counts : array-like
+        The bin counts (or weights) for the pareto, in decending order.
+
+    Returns:
+    --------
+    line_data : array
+        The fraction of the total that each bin and all bins before it
+        account for.
+
+    """
+    line_data = np.cumsum(counts, dtype=np.float64)
+    if len(line_data):
+        line_data /= line_data[-1]
     return line_data
 
 
@@ -355,7 +536,7 @@ def trim_pareto_data(limit, counts, categories, cumulative_data=None):
 
     Returns:
     --------
-    counts, categories, cumulative_data : array-like
+    counts, categories, cumulative_data : array
         each input, trimmed so that any values that have cumulative_data
         greater than limit are excluded.
 
@@ -366,20 +547,118 @@ def trim_pareto_data(limit, counts, categories, cumulative_data=None):
     if cumulative_data is None:
         cumulative_data = calc_pareto_cum_line(counts)
 
-    # trimming
-    ltcount = 0
-    for _x in cumulative_data:
-        if _x < limit:
-            ltcount += 1
-    limit_loc = range(ltcount + 1)
+    # Keep everything up to and including the first bin at or over the
+    # limit. Unlike a binary search, this doesn't need the cumulative data
+    # to be sorted. If no bin reaches the limit, keep them all.
+    cumulative_data = np.asarray(cumulative_data)
+    reached = cumulative_data >= limit
+    if reached.any():
+        stop = np.argmax(reached) + 1
+    else:
+        stop = len(cumulative_data)
 
-    counts = [counts[i] for i in limit_loc]
-    categories = [categories[i] for i in limit_loc]
-    cumulative_data = [cumulative_data[i] for i in limit_loc]
+    counts = np.asarray(counts)[:stop]
+    categories = np.asarray(categories)[:stop]
+    cumulative_data = cumulative_data[:stop]
 
     return counts, categories, cumulative_data
 
 
+def decimate(x, y, width, x_range=None,
+             points_per_pixel=MAX_POINTS_PER_PIXEL):
+    """
+    Reduce a line to the points that can be seen at a given width.
+
+    The visible x-range is split into one bucket per pixel and, for each
+    bucket, only the first, last, lowest and highest points are kept
+    (min/max or "M4" decimation). Those are the only points that decide
+    which pixels a line through the bucket touches, so the drawn shape is
+    the same as drawing every point, but never more than ``4 * width``
+    points are drawn.
+
+    Parameters:
+    -----------
+    x, y : array-like
+        The data. `x` must be in increasing order.
+
+    width : int
+        The plot width, in pixels.
+
+    x_range : (float, float), optional
+        The visible x-range. Points outside it are dropped, except the
+        nearest one on each side so that the line runs off the edges.
+        If `None`, all of the data is visible.
+
+    points_per_pixel : int, optional
+        Data with no more points than this per pixel is returned as is.
+
+    Returns:
+    --------
+    x, y : array
+        The points to draw, in order.
+
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+
+    if x_range is not None:
+        start = max(np.searchsorted(x, x_range[0], side='left') - 1, 0)
+        stop = np.searchsorted(x, x_range[1], side='right') + 1
+        x, y = x[start:stop], y[start:stop]
+
+    if len(x) <= width * points_per_pixel:
+        return x, y
+
+    low, high = (x[0], x[-1]) if x_range is None else x_range
+    span = (high - low) or 1
+    buckets = np.floor((x - low) / span * width).astype(np.int64)
+    buckets = np.clip(buckets, -1, width)
+
+    # x is sorted, so each bucket is a contiguous run of points.
+    starts = np.flatnonzero(np.diff(buckets)) + 1
+    firsts = np.concatenate(([0], starts))
+    lasts = np.concatenate((starts - 1, [len(x) - 1]))
+
+    # The first point in each bucket that equals the bucket's extreme.
+    sizes = lasts - firsts + 1
+    lows = _first_in_bucket(y == np.repeat(np.minimum.reduceat(y, firsts),
+                                           sizes), firsts)
+    highs = _first_in_bucket(y == np.repeat(np.maximum.reduceat(y, firsts),
+                                            sizes), firsts)
+
+    keep = np.unique(np.concatenate((firsts, lasts, lows, highs)))
+    return x[keep], y[keep]
+
+
+def _first_in_bucket(mask, firsts):
+    """ Return the first index in each bucket where ``mask`` is True. """
+    found = np.flatnonzero(mask)
+    return found[np.searchsorted(found, firsts)]
+
+
+def _axis_range(axis):
+    """
+    The (low, high) of a PlotCanvas axis argument, or ``None`` if it's
+    unset. The canvas hands back axes from its last draw as arrays.
+    """
+    if axis is None:
+        return None
+    axis = np.asarray(axis)
+    if axis.shape != (2, ):
+        return None
+    return float(axis[0]), float(axis[1])
+
+
+def _columns(rows, num_cols):
+    """ Split query rows into ``int64`` arrays, one per column. """
+    return np.array(rows, dtype=np.int64).reshape(-1, num_cols).T
+
+
+def _to_datetime64(ordinals):
+    """ Convert date ordinals to ``datetime64[D]``. """
+    return (ordinals - EPOCH_ORDINAL).astype('datetime64[D]')
+
+
 def main():
     # Just some example data and usage
     dlen = 15
@@ -6,12 +6,17 @@ Queries used by PyBank.
 ### Imports
 # ---------------------------------------------------------------------------
 # Standard Library
+import ast
 import logging
 from decimal import Decimal
 import datetime
+import re
+import sqlite3
 
 # Third Party
+import sqlalchemy as sa
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.schema import CreateIndex
 from sqlalchemy.schema import CreateTable
 from sqlalchemy import text as saText
 
@@ -23,6 +28,7 @@ from .orm import (          # Tables
     Account,
     AccountGroup,
     Category,
+    CategoryClosure,
     DisplayName,
     Institution,
     LedgerView,
@@ -33,6 +39,52 @@ from .orm import (          # Tables
 )
 
 
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+# The number of primary keys to put in a single DELETE when dumping changes.
+DELTA_CHUNK_SIZE = 250
+
+# The number of rows fetched at a time while dumping.
+DUMP_BATCH_SIZE = 1000
+
+# sqlite3.Connection.serialize() and .deserialize() are new in Python 3.11
+HAS_SERIALIZE = hasattr(sqlite3.Connection, 'serialize')
+
+# How often, in statements, `copy_to_sa` calls its progress callback.
+PROGRESS_INTERVAL = 5000
+
+# See `query_category_index`
+_category_index = None
+
+# The most levels `rebuild_category_closure` will follow.
+MAX_CATEGORY_DEPTH = 64
+
+# julianday() modifiers that move a date to the start of its period.
+# Weeks start on Monday.
+PERIODS = {'day': (),
+           'week': ('-6 days', 'weekday 1'),
+           'month': ('start of month', ),
+           }
+
+# julianday() is this much more than the date's ordinal.
+JULIANDAY_OFFSET = 1721424.5
+
+# Matches the statements that `_insert_statement` writes.
+_INSERT_RE = re.compile(r'INSERT INTO "?(?P<table>\w+)"?\s*VALUES\s*'
+                        r'(?P<values>\(.*\))\s*;?\s*$',
+                        re.DOTALL)
+
+# Matches one value of a ``VALUES`` tuple, plus the comma or parenthesis
+# after it. Only the literals that `_insert_statement` writes are handled.
+_VALUE_RE = re.compile(r"""\s*(?:
+      (?P<null>None)
+    | (?P<num>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+    | '(?P<sq>[^'\\]*(?:\\.[^'\\]*)*)'
+    | "(?P<dq>[^"\\]*(?:\\.[^"\\]*)*)"
+    )\s*(?P<end>,\s*\)$|,|\)$)""", re.VERBOSE | re.DOTALL)
+
+
 @utils.logged
 def query_ledger_view():
     logging.info("Quering Ledger View")
@@ -45,6 +97,240 @@ def query_category():
     return session.query(Category).all()
 
 
+def query_category_index():
+    """
+    Return the :class:`pybank.utils.CategoryIndex` of every category.
+
+    The index is built on first use and kept until
+    :func:`invalidate_category_index` is called, which
+    :func:`insert_category` does.
+    """
+    global _category_index
+    if _category_index is None:
+        logging.info("Building category index")
+        data = [(row.category_id, row.name, row.parent)
+                for row in query_category()]
+        _category_index = utils.CategoryIndex(data)
+    return _category_index
+
+
+def category_subtree(category_id):
+    """
+    Return a subquery of the IDs of a category and everything under it.
+
+    For use in filters, such as
+    ``Transaction.category_id.in_(category_subtree(5))``.
+    """
+    query = sa.select([CategoryClosure.descendant_id])
+    return query.where(CategoryClosure.ancestor_id == category_id)
+
+
+def query_category_total(session, category_id):
+    """
+    Return the number and total of the transactions under a category.
+
+    Includes the category itself and all of its descendants, using a
+    single join through :class:`pybank.orm.CategoryClosure`.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to query.
+    category_id : int
+
+    Returns
+    -------
+    count : int
+    cents : int
+        The sum of the amounts, in integer cents.
+    """
+    cents = _cents(Transaction.amount)
+    query = session.query(sa.func.count(Transaction.transaction_id),
+                          sa.func.coalesce(sa.func.sum(cents), 0),
+                          )
+    query = query.join(CategoryClosure,
+                       CategoryClosure.descendant_id == Transaction.category_id)
+    query = query.filter(CategoryClosure.ancestor_id == category_id)
+    return query.one()
+
+
+def invalidate_category_index():
+    """ Rebuild the category index the next time it's used. """
+    global _category_index
+    _category_index = None
+
+
+def query_ledger_page(session, after=None, limit=None, offset=0):
+    """
+    Return ledger rows in ledger order, starting after a given row.
+
+    The ledger is ordered by ``(date, transaction_id)``, with undated
+    transactions first. Paging by the last row seen (keyset pagination)
+    rather than by ``OFFSET`` means each page is an index range scan.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to query.
+    after : tuple of (date, int), optional
+        The ``(date, transaction_id)`` of the row before the first one to
+        return. If ``None``, start at the beginning of the ledger.
+    limit : int, optional
+        The maximum number of rows to return.
+    offset : int, optional
+        The number of rows to skip after ``after``.
+
+    Returns
+    -------
+    rows : list of :class:`pybank.orm.LedgerView`
+    """
+    query = session.query(LedgerView)
+    if after is not None:
+        query = query.filter(
+            _sorts_after(LedgerView.date, LedgerView.transaction_id, after))
+
+    query = query.order_by(LedgerView.date, LedgerView.transaction_id)
+    return query.offset(offset).limit(limit).all()
+
+
+def query_ledger_count(session):
+    """ Return the number of rows in the ledger. """
+    return session.query(sa.func.count(Transaction.transaction_id)).scalar()
+
+
+def query_ledger_amounts(session):
+    """
+    Return every ledger amount, in ledger order.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to query.
+
+    Returns
+    -------
+    rows : list of (int, int, int)
+        ``(day, transaction_id, cents)`` for each row, where ``day`` is
+        the date's proleptic Gregorian ordinal (see
+        :meth:`datetime.date.toordinal`) or 0 for undated rows.
+    """
+    # Converting the date in SQL saves parsing every date string in Python.
+    day = _ordinal(Transaction.date)
+    cents = _cents(Transaction.amount)
+    query = session.query(sa.func.coalesce(day, 0),
+                          Transaction.transaction_id,
+                          cents,
+                          )
+    query = query.order_by(Transaction.date, Transaction.transaction_id)
+
+    # Every row is needed, so skip building a result object for each one.
+    connection = session.connection()
+    sql = query.statement.compile(dialect=connection.dialect,
+                                  compile_kwargs={"literal_binds": True})
+    cursor = connection.connection.cursor()
+    try:
+        return cursor.execute(str(sql)).fetchall()
+    finally:
+        cursor.close()
+
+
+def query_period_totals(session, period='month'):
+    """
+    Return the number and total of the transactions in each period.
+
+    The grouping is done by SQLite, so only one row per period comes back
+    however long the ledger is.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to query.
+    period : str, optional
+        One of :data:`PERIODS`.
+
+    Returns
+    -------
+    rows : list of (int, int, int)
+        ``(day, count, cents)`` in date order, where ``day`` is the ordinal
+        of the first day of the period. Undated transactions are grouped
+        first, with a ``day`` of 0.
+    """
+    try:
+        modifiers = PERIODS[period]
+    except KeyError:
+        raise ValueError("Unknown period: {!r}".format(period))
+
+    day = sa.func.coalesce(_ordinal(Transaction.date, *modifiers), 0)
+    query = session.query(day,
+                          sa.func.count(Transaction.transaction_id),
+                          sa.func.sum(_cents(Transaction.amount)),
+                          )
+    return query.group_by(day).order_by(day).all()
+
+
+def query_category_totals(session, rollup=False):
+    """
+    Return the number and total of the transactions in each category.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to query.
+    rollup : bool, optional
+        If True, each category's totals include all of its descendants,
+        through :class:`pybank.orm.CategoryClosure`.
+
+    Returns
+    -------
+    rows : list of (int, int, int)
+        ``(category_id, count, cents)`` for each category that has
+        transactions. Uncategorized transactions have a ``category_id``
+        of ``None``, unless ``rollup`` is True, in which case they're left
+        out.
+    """
+    if rollup:
+        category_id = CategoryClosure.ancestor_id
+    else:
+        category_id = Transaction.category_id
+
+    query = session.query(category_id,
+                          sa.func.count(Transaction.transaction_id),
+                          sa.func.sum(_cents(Transaction.amount)),
+                          )
+    if rollup:
+        query = query.join(
+            CategoryClosure,
+            CategoryClosure.descendant_id == Transaction.category_id)
+    return query.group_by(category_id).order_by(category_id).all()
+
+
+def _cents(amount):
+    """ SQL for an amount in integer cents. """
+    return sa.cast(sa.func.round(sa.cast(amount, sa.Float) * 100),
+                   sa.Integer)
+
+
+def _ordinal(date, *modifiers):
+    """ SQL for the ordinal of a date, after any julianday() modifiers. """
+    return sa.cast(sa.func.julianday(date, *modifiers) - JULIANDAY_OFFSET,
+                   sa.Integer)
+
+
+def _sorts_after(date_col, id_col, key):
+    """
+    Filter for rows that come after ``key`` in ledger order.
+
+    ``NULL`` dates sort first, as they do in SQLite.
+    """
+    date, trans_id = key
+    if date is None:
+        return sa.or_(date_col.isnot(None),
+                      sa.and_(date_col.is_(None), id_col > trans_id))
+
+    return sa.or_(date_col > date,
+                  sa.and_(date_col == date, id_col > trans_id))
+
+
 def insert_account_group(name):
     """
     Insert a new account group.
@@ -111,6 +397,7 @@ def insert_category(name, parent):
     logging.debug("inserting '{}' to Category".format(name))
     cat = Category(name=name, parent=parent)
     session.add(cat)
+    invalidate_category_index()
 
 
 def insert_display_name(name):
@@ -213,7 +500,9 @@ def insert_transaction(insert_dict):
 
     Returns
     -------
-    None
+    trans : :class:`pybank.orm.Transaction`
+        The new transaction. It has no ``transaction_id`` until the session
+        is flushed.
     """
     logging.info("inserting item to Transaction")
 
@@ -234,6 +523,7 @@ def insert_transaction(insert_dict):
 
     trans = Transaction(**insert_dict)
     session.add(trans)
+    return trans
 
 
 def insert_transaction_label(value):
@@ -315,7 +605,152 @@ def create_database():
 
 
 @utils.logged
-def copy_to_sa(engine, session, dump):
+def drop_indexes(engine):
+    """
+    Drop the indexes declared on the ORM tables.
+
+    Loading is faster without them; :func:`create_indexes` puts them back.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+
+    Returns
+    -------
+    None
+    """
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                conn.execute('DROP INDEX IF EXISTS "{}"'.format(index.name))
+
+
+@utils.logged
+def create_indexes(engine):
+    """
+    Create any indexes declared on the ORM tables that the database lacks.
+
+    Files written before an index was declared get it when they're loaded.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+
+    Returns
+    -------
+    missing : list of str
+        The names of any unique indexes that couldn't be created because
+        the data already has duplicates.
+    """
+    inspector = sa.inspect(engine)
+    missing = []
+    for table in Base.metadata.sorted_tables:
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            if index.name in existing:
+                continue
+            logging.info("creating index %s", index.name)
+            try:
+                index.create(engine)
+            except sa.exc.IntegrityError:
+                logging.warning("Duplicate values; not creating unique"
+                                " index %s", index.name)
+                missing.append(index.name)
+
+    return missing
+
+
+@utils.logged
+def rebuild_category_closure(engine):
+    """
+    Rebuild :class:`pybank.orm.CategoryClosure` from the ``category`` table.
+
+    The triggers keep it up to date one category at a time. This is for
+    when the categories are replaced wholesale, such as when loading.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+
+    Returns
+    -------
+    None
+    """
+    logging.info("rebuilding category closure table")
+    # The depth limit stops a loop in the parents from running forever.
+    sql = """
+        INSERT OR IGNORE INTO category_closure
+            (ancestor_id, descendant_id, depth)
+        WITH RECURSIVE tree (ancestor_id, descendant_id, depth) AS (
+            SELECT category_id, category_id, 0 FROM category
+            UNION ALL
+            SELECT tree.ancestor_id, category.category_id, tree.depth + 1
+            FROM tree
+            JOIN category ON category.parent = tree.descendant_id
+            WHERE category.parent != category.category_id
+              AND tree.depth < {}
+        )
+        SELECT ancestor_id, descendant_id, depth FROM tree
+    """.format(MAX_CATEGORY_DEPTH)
+    with engine.begin() as conn:
+        conn.execute("DELETE FROM category_closure")
+        conn.execute(sql)
+
+
+@utils.logged
+def clear_manual_fitids(engine):
+    """
+    Replace the ``-1`` fitid of manually entered transactions with NULL.
+
+    Older versions of PyBank gave every transaction that wasn't downloaded
+    a fitid of -1, which would stop ``ux_transaction_account_fitid`` from
+    being created on any account with more than one of them. NULLs never
+    conflict.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+
+    Returns
+    -------
+    None
+    """
+    with engine.begin() as conn:
+        conn.execute('UPDATE "transaction" SET fitid = NULL WHERE fitid = -1')
+
+
+@utils.logged
+def upgrade_schema(engine):
+    """
+    Bring a freshly loaded database up to date with the ORM.
+
+    Creates any tables and indexes that the file predates, after fixing up
+    any data that older versions wrote and that the indexes don't allow,
+    and rebuilds the tables that are derived from others rather than saved.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+
+    Returns
+    -------
+    missing : list of str
+        See :func:`create_indexes`.
+    """
+    Base.metadata.create_all(engine)
+    clear_manual_fitids(engine)
+    missing = create_indexes(engine)
+    rebuild_category_closure(engine)
+    return missing
+
+
+@utils.logged
+def copy_to_sa(engine, session, dump, progress=None):
     """
     Copy...
 
@@ -333,20 +768,169 @@ def copy_to_sa(engine, session, dump):
         The session to work on.
     dump : iterable
         A list or generator object that contains strings for table creation
-        and data. Typically the result of :func:`sqlite_iterdump()` or
-        ``sqlite3.iterdump()``.
+        and data. Typically the result of :func:`sqlite_iterdump()`,
+        :func:`sqlite_iterdelta()` or ``sqlite3.iterdump()``.
+    progress : callable, optional
+        Called as ``progress(done, total)`` every :data:`PROGRESS_INTERVAL`
+        statements and once at the end. ``total`` is ``None`` if ``dump``
+        has no length.
 
     Returns
     -------
     None
+
+    Notes
+    -----
+    Rather than executing each ``INSERT`` on its own, the values are parsed
+    out of the statement and consecutive rows for the same table are
+    inserted with a single parameterized ``executemany``. Everything runs
+    in one transaction with ``synchronous=OFF`` and ``journal_mode=MEMORY``.
+    Table and view creation statements are skipped because the tables
+    already exist.
     """
     logging.info('Starting copy to in-memory database')
-    for sql in dump:
-        if sql.startswith("INSERT"):
-            # "None" is not recognized by SQLite when executing SQL, so we
-            # need to repalce it with NULL.
-            sql = sql.replace("None", "NULL")
-            engine.execute(saText(sql))
+    total = len(dump) if hasattr(dump, '__len__') else None
+
+    raw = engine.raw_connection()
+    cursor = raw.cursor()
+    old_sync = cursor.execute("PRAGMA synchronous").fetchone()[0]
+    old_journal = cursor.execute("PRAGMA journal_mode").fetchone()[0]
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+
+    table = None        # the table that `rows` belong to
+    rows = []
+    num = 0
+    try:
+        for num, sql in enumerate(dump, 1):
+            sql = sql.strip()
+            values = None
+            if sql.startswith("INSERT"):
+                match = _INSERT_RE.match(sql)
+                values = match and _literal_row(match.group('values'))
+
+            if values is not None and match.group('table') == table:
+                rows.append(values)
+            else:
+                _insert_many(cursor, table, rows)
+                table, rows = None, []
+                if values is not None:
+                    table, rows = match.group('table'), [values]
+                elif sql.startswith(("INSERT", "DELETE")):
+                    # Not our format (such as sqlite3's iterdump); let
+                    # SQLite parse it.
+                    cursor.execute(sql)
+
+            if progress is not None and num % PROGRESS_INTERVAL == 0:
+                progress(num, total)
+
+        _insert_many(cursor, table, rows)
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        cursor.execute("PRAGMA synchronous={}".format(old_sync))
+        cursor.execute("PRAGMA journal_mode={}".format(old_journal))
+        cursor.close()
+        raw.close()
+
+    # The database changed underneath the session.
+    session.expire_all()
+
+    if progress is not None:
+        progress(num, total)
+
+
+def split_statements(sql):
+    """
+    Split SQL text into statements on semicolons that aren't quoted.
+
+    Parameters
+    ----------
+    sql : str
+        Typically a dump from :func:`sqlite_iterdump` joined together.
+
+    Returns
+    -------
+    statements : iterator of str
+        Each statement, including its semicolon.
+    """
+    start = 0
+    quote = None
+    escaped = False
+    for pos, char in enumerate(sql):
+        if escaped:
+            escaped = False
+        elif quote is not None:
+            if char == "\\":
+                escaped = True
+            elif char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == ";":
+            yield sql[start:pos + 1]
+            start = pos + 1
+
+    if sql[start:].strip():
+        yield sql[start:]
+
+
+def _literal_row(values):
+    """
+    Parse the ``VALUES`` tuple written by :func:`_insert_statement`.
+
+    This is a tuple's ``repr``, so it could be parsed with
+    ``ast.literal_eval``, but matching the handful of literals it can
+    contain is about twice as fast. ``ast.literal_eval`` is only used for
+    strings with escape sequences.
+
+    Returns
+    -------
+    row : tuple or None
+        ``None`` if ``values`` isn't in that format, such as SQL written by
+        ``sqlite3.iterdump()``.
+    """
+    row = []
+    pos = 1
+    while True:
+        match = _VALUE_RE.match(values, pos)
+        if match is None:
+            return None
+
+        null, num, single, double, end = match.group('null', 'num', 'sq',
+                                                     'dq', 'end')
+        if null is not None:
+            row.append(None)
+        elif num is not None:
+            is_int = num.lstrip('-').isdigit()
+            row.append(int(num) if is_int else float(num))
+        elif single is not None:
+            row.append(_unescape(single, "'"))
+        else:
+            row.append(_unescape(double, '"'))
+
+        pos = match.end()
+        if end != ",":
+            return tuple(row)
+
+
+def _unescape(text, quote):
+    """ Undo the escaping that ``repr`` does to a string """
+    if "\\" not in text:
+        return text
+    return ast.literal_eval(quote + text + quote)
+
+
+def _insert_many(cursor, table, rows):
+    """ Insert ``rows`` into ``table`` with a single ``executemany``. """
+    if not rows:
+        return
+    logging.debug("inserting %d rows into %s", len(rows), table)
+    sql = 'INSERT INTO "{}" VALUES ({})'.format(
+        table, ", ".join("?" * len(rows[0])))
+    cursor.executemany(sql, rows)
 
 
 @utils.logged
@@ -359,6 +943,12 @@ def sqlite_iterdump(engine, session):
     The only (known) difference is that row data values have spaces
     between columns while sqlite's ``iterdump()`` does not.
 
+    Rows are fetched :data:`DUMP_BATCH_SIZE` at a time and each statement
+    is yielded as soon as it's formatted, so memory use doesn't depend on
+    the size of the database as long as the caller consumes the iterator
+    as it goes (for example by passing it to
+    :func:`pybank.crypto.encrypt_stream`) rather than joining it.
+
     .. warning::
        This function is specialized for PyBank and the single view that
        it contains. It will most likely not work for a generic database.
@@ -395,18 +985,13 @@ def sqlite_iterdump(engine, session):
             logging.debug("dumping table %s", name)
             yield str(CreateTable(table).compile(engine)).strip() + ";"
 
-            data = session.query(table).all()
-            for row in data:
-                row = list(row)     # needs to be mutable
+            # Derived tables are rebuilt on load rather than saved.
+            if not table.info.get('derived'):
+                for row in _iter_rows(session, table):
+                    yield _insert_statement(name, row)
 
-                row = [str(x) if isinstance(x, Decimal)
-                       else x.isoformat() if isinstance(x, datetime.date)
-#                       else "" if x is None
-                       else x for x in row]
-
-                row = tuple(row)    # back to tuple because I use its parens
-                                    # instead of adding my own parentheses.
-                yield 'INSERT INTO "{}" VALUES{};'.format(name, row)
+            for index in sorted(table.indexes, key=lambda ix: ix.name):
+                yield str(CreateIndex(index).compile(engine)).strip() + ";"
         n = 2
 
     # end by yielding the view and commit statements.
@@ -416,6 +1001,243 @@ def sqlite_iterdump(engine, session):
         yield str(view.compile(engine)) + ";COMMIT;"
 
 
+@utils.logged
+def sqlite_iterdelta(engine, session, rows, tables):
+    """
+    Dump only the changed rows of the database in an SQL text format.
+
+    The output uses the same statement format as :func:`sqlite_iterdump`
+    and can be applied on top of a loaded dump with :func:`copy_to_sa`.
+    Every changed row is first deleted and then, if it still exists,
+    re-inserted with its current values.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to work on.
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to work on.
+    rows : dict
+        ``{table_name: set(primary_key_tuple)}`` of the changed rows.
+    tables : set
+        Names of tables that need to be dumped in their entirety.
+
+    Returns
+    -------
+    sql : iterator
+        The SQL needed to bring a previous dump up to date.
+
+    See Also
+    --------
+    :class:`pybank.orm.ChangeTracker`
+    """
+    logging.info("dumping changed rows")
+    all_tables = Base.metadata.tables
+
+    yield "BEGIN TRANSACTION;"
+
+    for name in sorted(set(rows) | tables):
+        table = all_tables[name]
+        if table.info.get('derived'):
+            continue
+        logging.debug("dumping changes to table %s", name)
+
+        if name in tables:
+            yield 'DELETE FROM "{}";'.format(name)
+            for row in _iter_rows(session, table):
+                yield _insert_statement(name, row)
+            continue
+
+        pk_cols = list(table.primary_key.columns)
+        keys = sorted(rows[name])
+
+        # SQLite limits the expression depth, so work in chunks.
+        for start in range(0, len(keys), DELTA_CHUNK_SIZE):
+            chunk = keys[start:start + DELTA_CHUNK_SIZE]
+            where = sa.or_(*(sa.and_(*(c == v for c, v in zip(pk_cols, pk)))
+                             for pk in chunk))
+
+            yield 'DELETE FROM "{}" WHERE {};'.format(
+                name,
+                " OR ".join(_pk_condition(pk_cols, pk) for pk in chunk),
+            )
+
+            for row in _iter_rows(session, table, where):
+                yield _insert_statement(name, row)
+
+    yield "COMMIT;"
+
+
+@utils.logged
+def sqlite_snapshot(engine, session):
+    """
+    Take a read-consistent copy of the database.
+
+    Uses the SQLite online backup API to copy the database, page by page,
+    into a new in-memory connection. No SQL is generated or parsed.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to copy.
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to copy. Any pending changes are committed first.
+
+    Returns
+    -------
+    snapshot : :class:`sqlite3.Connection`
+        An in-memory copy of the database. The caller must close it.
+    """
+    logging.info("taking database snapshot")
+    session.commit()
+
+    snapshot = sqlite3.connect(":memory:", check_same_thread=False)
+    raw = engine.raw_connection()
+    try:
+        raw.connection.backup(snapshot)
+    finally:
+        raw.close()
+
+    return snapshot
+
+
+@utils.logged
+def sqlite_serialize(engine, session):
+    """
+    Return the database as a native SQLite image.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to serialize.
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to serialize. Any pending changes are committed first.
+
+    Returns
+    -------
+    image : bytes
+        The contents of an SQLite database file.
+    """
+    snapshot = sqlite_snapshot(engine, session)
+    try:
+        return snapshot.serialize()
+    finally:
+        snapshot.close()
+
+
+@utils.logged
+def sqlite_deserialize(engine, session, image):
+    """
+    Replace the contents of the database with a native SQLite image.
+
+    The counterpart to :func:`sqlite_serialize`.
+
+    Parameters
+    ----------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to load into.
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to load into. All loaded instances are expired.
+    image : bytes
+        The contents of an SQLite database file.
+    """
+    logging.info("loading database image")
+    session.expire_all()
+
+    raw = engine.raw_connection()
+    try:
+        raw.connection.deserialize(image)
+    finally:
+        raw.close()
+
+
+def snapshot_engine(snapshot):
+    """
+    Wrap a connection from :func:`sqlite_snapshot` in an engine.
+
+    This lets the snapshot be dumped with :func:`sqlite_iterdump`, on any
+    thread, while the main database carries on being edited.
+
+    Parameters
+    ----------
+    snapshot : :class:`sqlite3.Connection`
+
+    Returns
+    -------
+    engine : :class:`SQLAlchemy.engine.Engine`
+        Disposing of the engine does not close ``snapshot``.
+    """
+    return sa.create_engine('sqlite://',
+                            creator=lambda: snapshot,
+                            poolclass=sa.pool.StaticPool,
+                            )
+
+
+def _iter_rows(session, table, where=None):
+    """
+    Iterate over the rows of ``table`` without loading them all at once.
+
+    Parameters
+    ----------
+    session : :class:`SQLAlchemy.orm.session.Session`
+    table : :class:`sqlalchemy.Table`
+    where : SQL expression, optional
+
+    Returns
+    -------
+    rows : iterator of tuple
+    """
+    query = session.query(table)
+    if where is not None:
+        query = query.filter(where)
+    return query.yield_per(DUMP_BATCH_SIZE)
+
+
+def _insert_statement(name, row):
+    """
+    Format a single row as an ``INSERT`` statement.
+
+    Parameters
+    ----------
+    name : str
+        The table name.
+    row : sequence
+        The row values, in column order.
+
+    Returns
+    -------
+    sql : str
+    """
+    row = [str(x) if isinstance(x, Decimal)
+           else x.isoformat() if isinstance(x, datetime.date)
+#           else "" if x is None
+           else x for x in row]
+
+    row = tuple(row)    # back to tuple because I use its parens
+                        # instead of adding my own parentheses.
+    return 'INSERT INTO "{}" VALUES{};'.format(name, row)
+
+
+def _pk_condition(pk_cols, pk):
+    """
+    Format the ``WHERE`` condition that matches a single primary key.
+
+    Parameters
+    ----------
+    pk_cols : list of :class:`sqlalchemy.Column`
+        The primary key columns.
+    pk : tuple
+        The primary key values, in the same order as ``pk_cols``.
+
+    Returns
+    -------
+    sql : str
+    """
+    conditions = ('"{}" = {!r}'.format(col.name, val)
+                  for col, val in zip(pk_cols, pk))
+    return "({})".format(" AND ".join(conditions))
+
+
 def _test_iterdump_loop(dump_file):
     """
     Test the iterdump -> load -> iterdump loop.
@@ -427,23 +1249,19 @@ def _test_iterdump_loop(dump_file):
 
     with open(dump_file, 'r') as openf:
         data = openf.read()
-        data = data.split(';')
+        data = list(split_statements(data))
         copy_to_sa(engine, session, data)
 
-    dump = "".join(line for line in sqlite_iterdump(engine, session))
-    dump = dump.encode('utf-8')
-    with open("C:\\WinPython34\\projects\\github\\PyBank\\pybank\\tests\\data\\_TestDB_generated_dump.txt", 'wb') as openf:
-        openf.write(dump)
+    dump_to_file(engine, session, "C:\\WinPython34\\projects\\github\\PyBank\\pybank\\tests\\data\\_TestDB_generated_dump.txt")
 
     session.close()
     engine.dispose()
 
 
 def dump_to_file(engine, session, file):
-    """ """
-    dump = list(sqlite_iterdump(engine, session))
-    dump = "".join(line for line in dump)
-    dump = dump.encode('utf-8')
-
+    """
+    Write the SQL text dump to ``file``, one statement at a time.
+    """
     with open(file, 'wb') as openf:
-        openf.write(dump)
+        for line in sqlite_iterdump(engine, session):
+            openf.write(line.encode('utf-8'))
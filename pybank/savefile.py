@@ -0,0 +1,610 @@
+# -*- coding: utf-8 -*-
+"""
+Reading and writing of PyBank files.
+
+A PyBank file is a journal of encrypted records, one after the other. The
+first record is a *checkpoint*: a full dump of the database. Every record
+after that is a *delta* which holds only the rows that changed since the
+record before it. Each record is a stream in the chunked container of
+:func:`pybank.crypto.encrypt_stream`, so records are encrypted and
+decrypted a frame at a time.
+
+Saving appends a delta when possible, so the cost of an autosave depends on
+how much was edited rather than on how big the ledger is. Every so often the
+journal is compacted by writing a new checkpoint over the whole file.
+
+The checkpoint is a native SQLite image of the in-memory database, taken
+with the SQLite backup API, prefixed with a small header::
+
+    b"PYBANKDB" + version (1 byte) + image
+
+Deltas, and checkpoints written by older versions of PyBank (or by a Python
+without ``sqlite3.Connection.serialize``), are SQL text instead. Anything
+that does not start with the header is treated as SQL text. SQL text
+checkpoints are dumped from the snapshot a statement at a time, straight
+into the compression and encryption stream.
+
+Older files are Fernet tokens separated by newlines (Fernet tokens are
+url-safe base64, so they never contain the separator). Files written before
+the journal existed are a single Fernet token, which reads back as a
+checkpoint with no deltas. These are detected by not starting with the
+container's magic bytes, and are rewritten in the current format on the
+next save.
+
+Checkpoints are written to a temporary file which then replaces the old
+file, so a crash mid-save never leaves a truncated file behind.
+:class:`BackgroundSaver` moves everything but the snapshot off of the GUI
+thread.
+"""
+# ---------------------------------------------------------------------------
+### Imports
+# ---------------------------------------------------------------------------
+# Standard Library
+import logging
+import os
+import os.path
+import tempfile
+import threading
+
+# Third Party
+import sqlalchemy as sa
+
+# Package / Application
+from . import crypto
+from . import orm
+from . import queries
+from . import utils
+
+
+# ---------------------------------------------------------------------------
+### Module Constants
+# ---------------------------------------------------------------------------
+# Separates the Fernet tokens of older files.
+RECORD_SEP = b"\n"
+
+# Header for checkpoints that contain a native SQLite image.
+IMAGE_MAGIC = b"PYBANKDB"
+IMAGE_VERSION = 1
+
+# Compact the journal once either of these is exceeded.
+MAX_DELTAS = 25                 # number of delta records
+MAX_DELTA_RATIO = 1.0           # size of all deltas / size of the checkpoint
+
+# Open files, keyed by absolute path. See `get_file()`.
+_files = {}
+
+
+# ---------------------------------------------------------------------------
+### Classes
+# ---------------------------------------------------------------------------
+class PyBankFile(object):
+    """
+    An encrypted, journaled PyBank file.
+
+    Parameters
+    ----------
+    path : str
+        The file to read from and write to.
+
+    Attributes
+    ----------
+    num_deltas : int
+        The number of delta records after the checkpoint.
+    checkpoint_size : int
+        The size, in bytes, of the checkpoint record.
+    delta_size : int
+        The combined size, in bytes, of all delta records.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.num_deltas = 0
+        self.checkpoint_size = 0
+        self.delta_size = 0
+
+        # Only append to a file whose contents we know match the database.
+        self._synced = False
+
+    @property
+    def needs_compaction(self):
+        """ ``True`` if the next save should write a new checkpoint. """
+        if self.num_deltas >= MAX_DELTAS:
+            return True
+        return self.delta_size > self.checkpoint_size * MAX_DELTA_RATIO
+
+    @utils.logged
+    def load(self, key, engine, session, progress=None):
+        """
+        Read the file and copy its contents into the database.
+
+        Indexes are dropped while the records are applied and created
+        afterwards, which also adds any that the file predates. See
+        :func:`pybank.queries.upgrade_schema`.
+
+        Parameters
+        ----------
+        key : str
+            The encryption key.
+        engine : :class:`SQLAlchemy.engine.Engine`
+            The engine to load into.
+        session : :class:`SQLAlchemy.orm.session.Session`
+            The session to load into.
+        progress : callable, optional
+            Called as ``progress(done, total)`` while each record loads.
+            See :func:`pybank.queries.copy_to_sa`.
+        """
+        logging.info("reading PyBank file `%s`", self.path)
+        queries.drop_indexes(engine)
+        try:
+            with open(self.path, 'rb') as openf:
+                if crypto.is_stream(openf):
+                    sizes, complete = _load_streams(key, openf, engine,
+                                                    session, progress)
+                else:
+                    logging.info("Reading Fernet file; it will be converted")
+                    sizes, _ = _load_tokens(key, openf.read(), engine,
+                                            session, progress)
+                    complete = False
+        finally:
+            queries.upgrade_schema(engine)
+            queries.invalidate_category_index()
+            orm.change_tracker.touch()
+
+        self.checkpoint_size = sizes[0]
+        self.num_deltas = len(sizes) - 1
+        self.delta_size = sum(sizes[1:])
+
+        # What we just loaded is, by definition, already saved. If the file
+        # had a bad record at the end (or is an older format) we can't
+        # append to it, so the next save will write a checkpoint instead.
+        orm.change_tracker.reset()
+        self._synced = complete
+
+    @utils.logged
+    def save(self, key, engine, session, compact=False):
+        """
+        Save any changes, appending a delta or writing a checkpoint.
+
+        Parameters
+        ----------
+        key : str
+            The encryption key.
+        engine : :class:`SQLAlchemy.engine.Engine`
+            The engine to save.
+        session : :class:`SQLAlchemy.orm.session.Session`
+            The session to save.
+        compact : bool, optional
+            If True, replace any deltas with a new checkpoint.
+        """
+        write = self.prepare_save(engine, session, compact)
+        if write is not None:
+            write(key)
+
+    @utils.logged
+    def prepare_save(self, engine, session, compact=False):
+        """
+        Do the part of a save that needs the database.
+
+        This must be called from the thread that owns ``session``. What is
+        left - serializing, encrypting and writing - is returned so that it
+        can be run on any thread.
+
+        Parameters
+        ----------
+        engine : :class:`SQLAlchemy.engine.Engine`
+        session : :class:`SQLAlchemy.orm.session.Session`
+        compact : bool, optional
+            If True, replace any deltas with a new checkpoint.
+
+        Returns
+        -------
+        write : callable or None
+            ``write(key)`` finishes the save. ``None`` if there is nothing
+            to save.
+        """
+        tracker = orm.change_tracker
+        has_deltas = self.num_deltas > 0
+
+        if not (self._synced and os.path.exists(self.path)):
+            return self.prepare_checkpoint(engine, session)
+        elif compact and (has_deltas or tracker.has_changes):
+            return self.prepare_checkpoint(engine, session)
+        elif self.needs_compaction:
+            return self.prepare_checkpoint(engine, session)
+        elif tracker.has_changes:
+            return self.prepare_delta(engine, session)
+        else:
+            logging.info("No changes to save")
+            return None
+
+    @utils.logged
+    def write_checkpoint(self, key, engine, session):
+        """
+        Dump the entire database and overwrite the file with it.
+        """
+        self.prepare_checkpoint(engine, session)(key)
+
+    @utils.logged
+    def append_delta(self, key, engine, session):
+        """
+        Dump the rows that changed since the last save and append them.
+        """
+        self.prepare_delta(engine, session)(key)
+
+    def prepare_checkpoint(self, engine, session):
+        """
+        Snapshot the database for :meth:`write_checkpoint`.
+
+        Returns
+        -------
+        write : callable
+            ``write(key)`` encrypts the snapshot and replaces the file.
+        """
+        self._synced = False
+        orm.change_tracker.reset()
+        snapshot = _take_checkpoint(engine, session)
+
+        def write(key):
+            logging.info("Writing checkpoint to `%s`", self.path)
+            chunks = crypto.encrypt_stream(key, _checkpoint_payload(snapshot))
+            size = _atomic_write(self.path, chunks)
+
+            self.checkpoint_size = size
+            self.num_deltas = 0
+            self.delta_size = 0
+            self._synced = True
+
+        return write
+
+    def prepare_delta(self, engine, session):
+        """
+        Dump the changed rows for :meth:`append_delta`.
+
+        Returns
+        -------
+        write : callable
+            ``write(key)`` encrypts the dump and appends it to the file.
+        """
+        self._synced = False
+        rows, tables = orm.change_tracker.reset()
+        dump = "".join(queries.sqlite_iterdelta(engine, session, rows, tables))
+
+        def write(key):
+            logging.info("Appending changes to `%s`", self.path)
+            chunks = crypto.encrypt_stream(key, [dump.encode('utf-8')])
+            size = 0
+            with open(self.path, 'ab') as openf:
+                for chunk in chunks:
+                    openf.write(chunk)
+                    size += len(chunk)
+
+            self.num_deltas += 1
+            self.delta_size += size
+            self._synced = True
+
+        return write
+
+
+class BackgroundSaver(object):
+    """
+    Runs saves on a worker thread so that the GUI doesn't freeze.
+
+    The database is snapshotted on the calling thread, which must be the
+    one that owns ``session``. Serializing, encrypting and writing happen
+    on the worker. Only one save runs at a time: requests made while a save
+    is running are coalesced into a single follow-up save.
+
+    Parameters
+    ----------
+    pybank_file : :class:`PyBankFile`
+        The file to save to.
+    engine : :class:`SQLAlchemy.engine.Engine`
+        The engine to save.
+    session : :class:`SQLAlchemy.orm.session.Session`
+        The session to save.
+    get_key : callable
+        Returns the encryption key. Called on the calling thread.
+    dispatch : callable
+        ``dispatch(func, *args)`` must call ``func(*args)`` on the thread
+        that owns ``session``, such as :func:`wx.CallAfter`.
+    on_done : callable, optional
+        Called with ``None`` after a successful save or with the exception
+        after a failed one.
+    """
+    def __init__(self, pybank_file, engine, session, get_key, dispatch,
+                 on_done=None):
+        self.pybank_file = pybank_file
+        self.engine = engine
+        self.session = session
+        self.get_key = get_key
+        self.dispatch = dispatch
+        self.on_done = on_done
+
+        self._thread = None
+        self._pending = None    # `compact` of the coalesced request
+
+    @property
+    def busy(self):
+        """ ``True`` while a save is running. """
+        return self._thread is not None
+
+    @utils.logged
+    def request(self, compact=False):
+        """
+        Start a save, or queue one if a save is already running.
+
+        Parameters
+        ----------
+        compact : bool, optional
+            If True, replace any deltas with a new checkpoint.
+        """
+        if self.busy:
+            logging.debug("Save already running; coalescing request")
+            self._pending = bool(self._pending) or compact
+            return
+
+        try:
+            write = self.pybank_file.prepare_save(self.engine,
+                                                  self.session,
+                                                  compact)
+            key = self.get_key() if write is not None else None
+        except Exception as err:
+            logging.exception("Unable to start save")
+            self._report(err)
+            return
+
+        if write is None:
+            self._report(None)
+            return
+
+        self._thread = threading.Thread(target=self._run,
+                                        args=(write, key),
+                                        name="PyBankSave",
+                                        )
+        self._thread.start()
+
+    def shutdown(self):
+        """
+        Wait for a running save to finish and drop any queued request.
+
+        No more callbacks are made after this returns.
+        """
+        self.on_done = None
+        self._pending = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self, write, key):
+        """ Worker thread: finish the save and report back. """
+        try:
+            write(key)
+            error = None
+        except Exception as err:
+            logging.exception("Background save failed")
+            error = err
+        self.dispatch(self._finish, error)
+
+    def _finish(self, error):
+        """ Back on the session's thread: report and start any queued save. """
+        if self._thread is None:
+            # shutdown() already took care of things.
+            return
+        self._thread.join()
+        self._thread = None
+        self._report(error)
+
+        if self._pending is not None:
+            compact, self._pending = self._pending, None
+            self.request(compact)
+
+    def _report(self, error):
+        if self.on_done is not None:
+            self.on_done(error)
+
+
+# ---------------------------------------------------------------------------
+### Functions
+# ---------------------------------------------------------------------------
+def _take_checkpoint(engine, session):
+    """
+    Copy the entire database for a checkpoint record.
+
+    Returns
+    -------
+    snapshot : :class:`sqlite3.Connection`
+        An in-memory copy of the database. Pass it to
+        :func:`_checkpoint_payload`.
+    """
+    return queries.sqlite_snapshot(engine, session)
+
+
+def _checkpoint_payload(snapshot):
+    """
+    Turn the result of :func:`_take_checkpoint` into a checkpoint record.
+
+    Safe to call from any thread. Closes the snapshot.
+
+    Returns
+    -------
+    chunks : iterable of bytes
+        A header plus SQLite image or, if SQLite images are not supported,
+        the SQL text dump, generated a statement at a time.
+    """
+    if not queries.HAS_SERIALIZE:
+        logging.warning("SQLite images not supported; writing SQL text")
+        return _iterdump_snapshot(snapshot)
+
+    try:
+        image = snapshot.serialize()
+    finally:
+        snapshot.close()
+    return [IMAGE_MAGIC + bytes([IMAGE_VERSION]), image]
+
+
+def _iterdump_snapshot(snapshot):
+    """
+    Yield the SQL text dump of a snapshot, encoded, then close it.
+    """
+    engine = queries.snapshot_engine(snapshot)
+    session = sa.orm.Session(bind=engine)
+    try:
+        for sql in queries.sqlite_iterdump(engine, session):
+            yield sql.encode('utf-8')
+    finally:
+        session.close()
+        engine.dispose()
+        snapshot.close()
+
+
+def _atomic_write(path, chunks):
+    """
+    Replace the contents of ``path`` without ever leaving it half-written.
+
+    The data is written to a temporary file in the same directory which is
+    then moved over ``path``.
+
+    Parameters
+    ----------
+    path : str
+    chunks : iterable of bytes
+
+    Returns
+    -------
+    size : int
+        The number of bytes written.
+    """
+    dirname = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=dirname)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as openf:
+            for chunk in chunks:
+                openf.write(chunk)
+                size += len(chunk)
+            openf.flush()
+            os.fsync(openf.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return size
+
+
+def _load_streams(key, openf, engine, session, progress=None):
+    """
+    Load every record of a file in the streaming format.
+
+    Returns
+    -------
+    sizes : list of int
+        The size, in bytes, of each record that was loaded.
+    complete : bool
+        ``False`` if an incomplete final record was discarded.
+    """
+    end = os.fstat(openf.fileno()).st_size
+    sizes = []
+    while openf.tell() < end:
+        start = openf.tell()
+        try:
+            payload = b"".join(crypto.decrypt_stream(key, openf))
+        except crypto.InvalidToken:
+            # A bad checkpoint means a bad key (or file) so we can't
+            # continue. A bad *last* delta is what an interrupted append
+            # leaves behind; everything before it is still good.
+            if not sizes or openf.tell() < end:
+                raise
+            logging.error("Discarding incomplete final record")
+            return sizes, False
+
+        _load_payload(payload, engine, session, progress)
+        sizes.append(openf.tell() - start)
+
+    return sizes, True
+
+
+def _load_tokens(key, data, engine, session, progress=None):
+    """
+    Load every record of a file made of newline-separated Fernet tokens.
+
+    Returns
+    -------
+    sizes : list of int
+        The size, in bytes, of each record that was loaded.
+    complete : bool
+        ``False`` if an incomplete final record was discarded.
+    """
+    records = [r for r in data.split(RECORD_SEP) if r]
+    sizes = []
+    for num, token in enumerate(records):
+        try:
+            payload = crypto.decrypt(key, token)
+        except crypto.InvalidToken:
+            if num == 0 or num != len(records) - 1:
+                raise
+            logging.error("Discarding incomplete final record")
+            return sizes, False
+
+        _load_payload(payload, engine, session, progress)
+        sizes.append(len(token) + (len(RECORD_SEP) if num else 0))
+
+    return sizes, True
+
+
+def _load_payload(payload, engine, session, progress=None):
+    """
+    Apply a single decrypted record to the database.
+
+    Parameters
+    ----------
+    payload : bytes
+        Either a header plus SQLite image or an SQL text dump.
+    engine : :class:`SQLAlchemy.engine.Engine`
+    session : :class:`SQLAlchemy.orm.session.Session`
+    progress : callable, optional
+
+    Raises
+    ------
+    ValueError
+        If the image was written by a newer version of PyBank.
+    RuntimeError
+        If the image can't be loaded by this version of Python.
+    """
+    if not payload.startswith(IMAGE_MAGIC):
+        dump = list(queries.split_statements(payload.decode('utf-8')))
+        queries.copy_to_sa(engine, session, dump, progress)
+        return
+
+    version = payload[len(IMAGE_MAGIC)]
+    if version > IMAGE_VERSION:
+        msg = "Unsupported PyBank image version {}".format(version)
+        raise ValueError(msg)
+
+    if not queries.HAS_SERIALIZE:
+        raise RuntimeError("Loading this file requires Python 3.11 or newer")
+
+    image = payload[len(IMAGE_MAGIC) + 1:]
+    queries.sqlite_deserialize(engine, session, image)
+    if progress is not None:
+        progress(1, 1)
+
+
+def get_file(path):
+    """
+    Return the :class:`PyBankFile` for ``path``, creating it if needed.
+
+    The same object is returned for the same file so that the journal
+    bookkeeping survives between saves.
+    """
+    path = os.path.abspath(path)
+    try:
+        return _files[path]
+    except KeyError:
+        _files[path] = PyBankFile(path)
+        return _files[path]
+
+
+if __name__ == "__main__":
+    pass
@@ -81,6 +81,96 @@ class LedgerCols(Enum):
         self.width = width
 
 
+class CategoryIndex(object):
+    """
+    Lookup tables between category IDs and their full category strings.
+
+    Every string is built once, walking up the tree with dict lookups, so
+    building the index is O(n * depth) and each lookup is a single dict
+    access. Use this instead of calling :func:`build_cat_string` for every
+    cell.
+
+    Parameters:
+    -----------
+    data : list
+        The adjacency list in the format of [(pk, name, parent_pk), ...]
+
+    delimiter : string, default colon ':'
+        The string to separate the nesting levels with
+
+    max_nest : int, default 10
+        The maximum number of nesting levels to traverse.
+
+    Attributes:
+    -----------
+    paths : dict
+        ``{pk: category_string}``
+    ids : dict
+        ``{category_string: pk}``
+    choices : list
+        The category strings in the same order as ``data``.
+
+    Examples:
+    ---------
+
+    >>> data = [(1, "Expense", 1), (2, "Income", 2), (3, "Auto", 1)]
+    >>> index = CategoryIndex(data)
+    >>> index.path(3)
+    'Expense:Auto'
+    >>> index.ids['Expense:Auto']
+    3
+    """
+    def __init__(self, data, delimiter=":", max_nest=10):
+        self.delimiter = delimiter
+        self.max_nest = max_nest
+        self._rows = {pk: (name, parent) for pk, name, parent in data}
+
+        self.paths = {}
+        for pk in self._rows:
+            self._build(pk)
+        self.ids = {path: pk for pk, path in self.paths.items()
+                    if path != "!! None !!"}
+        self.choices = [self.path(row[0]) for row in data]
+
+    def __len__(self):
+        return len(self.paths)
+
+    def path(self, item):
+        """
+        Return the category string of ``item``.
+
+        Matches :func:`build_cat_string`: ``''`` if ``item`` is empty and
+        ``'!! None !!'`` if it isn't found.
+        """
+        if not item:
+            return ''
+        try:
+            return self.paths[item]
+        except KeyError:
+            logging.warning("item not found.")
+            return "!! None !!"
+
+    def _build(self, item):
+        """ Walk up the tree from ``item``, one dict lookup per level. """
+        pk = item
+        values = []
+        for _ in range(self.max_nest):
+            try:
+                name, parent = self._rows[item]
+            except KeyError:
+                self.paths[pk] = "!! None !!"
+                return
+
+            values.append(name)
+            if parent == item:
+                break
+            item = parent
+        else:
+            logging.warning("Maximum number of nesting levels reached")
+
+        self.paths[pk] = self.delimiter.join(reversed(values))
+
+
 # ---------------------------------------------------------------------------
 ### Functions
 # ---------------------------------------------------------------------------
@@ -287,9 +377,11 @@ def build_cat_string(item, data, delimiter=":", max_nest=10):
 
 def build_cat_strings(data, delimiter=":", max_nest=10):
     """
+    Builds the category string of every item in an Adjacency List.
+
+    See :class:`CategoryIndex`.
     """
-    return list(build_cat_string(item[0], data, delimiter, max_nest)
-                for item in data)
+    return CategoryIndex(data, delimiter, max_nest).choices
 
 
 # ---------------------------------------------------------------------------
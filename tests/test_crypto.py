@@ -16,8 +16,10 @@ Options:
 import unittest
 import unittest.mock as mock
 import os
+import io
 import os.path as osp
 import logging
+import time
 
 # Third-Party
 import keyring
@@ -402,3 +404,213 @@ class TestGetSalt_FileExists(unittest.TestCase):
     def test_get_salt_file_already_exists(self):
         result = crypto.get_salt(self.file)
         self.assertEqual(result, self.salt)
+
+
+class TestKeyManager(unittest.TestCase):
+    """
+    """
+    service = "PyBank_UnitTests"
+    user = "test_runner"
+    password = "secret"
+
+    def setUp(self):
+        crypto.create_password(self.password, self.service, self.user)
+        self.manager = crypto.KeyManager(service=self.service, user=self.user)
+
+    def tearDown(self):
+        self.manager.lock()
+
+    def test_key_matches_get_key(self):
+        expected = crypto.get_key(self.service, self.user)
+        self.assertEqual(self.manager.get_key(), expected)
+
+    def test_key_context_zeroes_copy(self):
+        expected = crypto.get_key(self.service, self.user)
+        with self.manager.key() as key:
+            self.assertEqual(bytes(key), expected)
+            self.assertIsNot(key, self.manager._buf)
+            token = crypto.encrypt(key, b"data")
+        self.assertEqual(key, bytearray(len(key)))
+        self.assertEqual(crypto.decrypt(self.manager.get_key(), token),
+                         b"data")
+        self.assertEqual(self.manager.derivations, 1)
+
+    def test_key_derived_once(self):
+        self.manager.unlock()
+        for _ in range(5):
+            self.manager.get_key()
+        self.assertEqual(self.manager.derivations, 1)
+
+    def test_lock_zeroes_buffer(self):
+        self.manager.unlock()
+        buf = self.manager._buf
+        self.manager.lock()
+        self.assertFalse(self.manager.unlocked)
+        self.assertEqual(buf, bytearray(len(buf)))
+
+    def test_idle_timeout_evicts_key(self):
+        self.manager.timeout = 0.05
+        self.manager.unlock()
+        self.assertTrue(self.manager.unlocked)
+        time.sleep(0.2)
+        self.assertIsNone(self.manager._buf)
+
+    def test_key_derived_again_after_eviction(self):
+        self.manager.unlock()
+        self.manager.lock()
+        self.manager.get_key()
+        self.assertEqual(self.manager.derivations, 2)
+
+
+class TestEncryptStream(unittest.TestCase):
+    """
+    """
+    key = crypto.create_key(b"secret", b"salt")
+    data = os.urandom(1000)
+
+    def _encrypt(self, data, frame_size=100):
+        chunks = [data[i:i + 37] for i in range(0, len(data), 37)]
+        return b"".join(crypto.encrypt_stream(self.key, chunks, frame_size))
+
+    def _decrypt(self, stream, key=None):
+        openf = io.BytesIO(stream)
+        return b"".join(crypto.decrypt_stream(key or self.key, openf))
+
+    def test_round_trip(self):
+        for size in (0, 1, 100, 1000, 1001):
+            with self.subTest(size=size):
+                data = self.data[:size] + b"x" * max(0, size - 1000)
+                self.assertEqual(self._decrypt(self._encrypt(data)), data)
+
+    def test_frames_are_bounded(self):
+        frames = list(crypto.encrypt_stream(self.key, [self.data], 100,
+                                            codec=crypto.CODEC_NONE))
+        self.assertEqual(len(frames), 1 + 10)
+        self.assertTrue(all(len(f) <= 100 + 21 for f in frames[1:]))
+
+    def test_wrong_key_raises(self):
+        stream = self._encrypt(self.data)
+        other = crypto.create_key(b"other", b"salt")
+        with self.assertRaises(crypto.InvalidToken):
+            self._decrypt(stream, other)
+
+    def test_truncated_raises(self):
+        stream = self._encrypt(self.data)
+        # Dropping whole frames must be caught just like partial ones.
+        for cut in (1, 121, len(stream) - crypto.STREAM_HEADER_SIZE):
+            with self.subTest(cut=cut):
+                with self.assertRaises(crypto.InvalidToken):
+                    self._decrypt(stream[:-cut])
+
+    def test_tampered_frame_raises(self):
+        stream = bytearray(self._encrypt(self.data))
+        stream[-1] ^= 0x01
+        with self.assertRaises(crypto.InvalidToken):
+            self._decrypt(bytes(stream))
+
+    def test_tampered_header_raises(self):
+        stream = bytearray(self._encrypt(self.data))
+        stream[20] ^= 0x01
+        with self.assertRaises(crypto.InvalidToken):
+            self._decrypt(bytes(stream))
+
+    def test_streams_read_back_to_back(self):
+        openf = io.BytesIO(self._encrypt(b"first") + self._encrypt(b"second"))
+        first = b"".join(crypto.decrypt_stream(self.key, openf))
+        second = b"".join(crypto.decrypt_stream(self.key, openf))
+        self.assertEqual((first, second), (b"first", b"second"))
+
+    def test_parallel_matches_serial(self):
+        stream = b"".join(crypto.encrypt_stream(self.key, [self.data], 100,
+                                                workers=4))
+        openf = io.BytesIO(stream)
+        result = b"".join(crypto.decrypt_stream(self.key, openf, workers=1))
+        self.assertEqual(result, self.data)
+
+        openf = io.BytesIO(self._encrypt(self.data))
+        result = b"".join(crypto.decrypt_stream(self.key, openf, workers=4))
+        self.assertEqual(result, self.data)
+
+    def test_no_pool_by_default(self):
+        """ The thread pool is opt-in """
+        with mock.patch.object(crypto.concurrent.futures,
+                               "ThreadPoolExecutor") as pool:
+            stream = self._encrypt(self.data)
+            result = self._decrypt(stream)
+        self.assertEqual(result, self.data)
+        pool.assert_not_called()
+
+    def test_parallel_tampered_frame_raises(self):
+        stream = bytearray(self._encrypt(self.data))
+        stream[crypto.STREAM_HEADER_SIZE + 10] ^= 0x01
+        openf = io.BytesIO(bytes(stream))
+        with self.assertRaises(crypto.InvalidToken):
+            b"".join(crypto.decrypt_stream(self.key, openf, workers=4))
+
+    def test_decompression_bounded(self):
+        """ A small stream can't expand past max_size, or all at once """
+        data = bytes(4 * crypto.FRAME_SIZE)
+        for codec in (crypto.CODEC_ZLIB, crypto.CODEC_LZMA):
+            with self.subTest(codec=codec):
+                stream = b"".join(crypto.encrypt_stream(self.key, [data],
+                                                        codec=codec))
+                self.assertLess(len(stream), crypto.FRAME_SIZE)
+
+                openf = io.BytesIO(stream)
+                chunks = list(crypto.decrypt_stream(self.key, openf))
+                self.assertEqual(b"".join(chunks), data)
+                self.assertLessEqual(max(map(len, chunks)),
+                                     crypto.DECOMPRESS_CHUNK)
+
+                openf = io.BytesIO(stream)
+                with self.assertRaises(ValueError):
+                    b"".join(crypto.decrypt_stream(self.key, openf,
+                                                   max_size=len(data) - 1))
+
+    def test_codecs_round_trip(self):
+        data = b"INSERT INTO \"transaction\" VALUES(1, '2016-01-01');" * 500
+        for codec in (crypto.CODEC_NONE, crypto.CODEC_ZLIB, crypto.CODEC_LZMA):
+            with self.subTest(codec=codec):
+                stream = b"".join(crypto.encrypt_stream(self.key, [data],
+                                                        codec=codec))
+                self.assertEqual(stream[9], codec)
+                self.assertEqual(self._decrypt(stream), data)
+
+    def test_compression_shrinks_output(self):
+        data = b"INSERT INTO \"transaction\" VALUES(1, '2016-01-01');" * 500
+        stream = b"".join(crypto.encrypt_stream(self.key, [data]))
+        self.assertLess(len(stream), len(data) / 10)
+
+    def test_unknown_codec_raises(self):
+        with self.assertRaises(ValueError):
+            b"".join(crypto.encrypt_stream(self.key, [b""], codec=99))
+
+    def test_is_stream(self):
+        self.assertTrue(crypto.is_stream(io.BytesIO(self._encrypt(b""))))
+        token = crypto.encrypt(self.key, b"")
+        self.assertFalse(crypto.is_stream(io.BytesIO(token)))
+
+
+class TestEncryptedReadFernet(unittest.TestCase):
+    """
+    Files written before the streaming format are still readable.
+    """
+    file = "temp.crypto"
+    contents = b"Lorem ipsum dolor sit amet, consectetur adipiscing elit"
+    key = crypto.create_key(b"secret", b"salt")
+
+    @classmethod
+    def setUpClass(cls):
+        with open(cls.file, 'wb') as openf:
+            openf.write(crypto.encrypt(cls.key, cls.contents))
+
+    @classmethod
+    def tearDownClass(cls):
+        try:
+            os.remove(cls.file)
+        except OSError:
+            pass
+
+    def test_encrypted_read_fernet(self):
+        result = crypto.encrypted_read(self.file, self.key)
+        self.assertEqual(result, self.contents)
@@ -0,0 +1,307 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the ledger data models.
+"""
+# Standard Library
+import unittest
+import datetime
+from decimal import Decimal
+
+# Third-Party
+import numpy as np
+import sqlalchemy as sa
+
+# Package / Application
+from pybank import orm
+from pybank import ledger
+
+
+def _new_database():
+    """ Create a new, empty in-memory database and a tracked session """
+    engine = sa.create_engine('sqlite:///:memory:')
+    orm.Base.metadata.create_all(engine)
+    return engine, orm.Session(bind=engine)
+
+
+class LedgerTestCase(unittest.TestCase):
+    """ A ledger of 47 transactions, two of them undated """
+    num_rows = 47
+
+    def setUp(self):
+        self.engine, self.session = _new_database()
+        start = datetime.date(2017, 1, 1)
+        for num in range(self.num_rows - 2):
+            # Insert out of date order, with some dates shared.
+            date = start + datetime.timedelta(days=(num * 7) % 30)
+            amount = Decimal(num * 37 % 200 - 100) + Decimal("0.25")
+            self.session.add(orm.Transaction(account_id=1, date=date,
+                                             amount=amount))
+        self.session.add(orm.Transaction(account_id=1, amount=Decimal("1")))
+        self.session.add(orm.Transaction(account_id=1, amount=Decimal("2")))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def _expected(self):
+        """ Rows and balances calculated the slow way """
+        trans = self.session.query(orm.Transaction).all()
+        trans.sort(key=lambda t: (t.date is not None,
+                                  t.date or datetime.date.min,
+                                  t.transaction_id))
+        balance = ledger.OPENING_BALANCE
+        expected = []
+        for t in trans:
+            balance += t.amount
+            expected.append((t.transaction_id, t.amount, balance))
+        return expected
+
+    def _window(self, **kwargs):
+        kwargs.setdefault('page_size', 10)
+        kwargs.setdefault('cache_pages', 2)
+        return ledger.LedgerWindow(self.session, **kwargs)
+
+
+class TestLedgerWindow(LedgerTestCase):
+    """ Rows are served a page at a time """
+    def test_len(self):
+        self.assertEqual(len(self._window()), self.num_rows)
+
+    def test_rows_in_order_with_balance(self):
+        window = self._window()
+        actual = [(row[0], row[-2], row[-1]) for row in window]
+        self.assertEqual(actual, self._expected())
+
+    def test_random_access(self):
+        """ Jumping straight to a page gives the same rows """
+        expected = self._expected()
+        window = self._window()
+        for row in (44, 3, -1, 21, 20, 19, 46):
+            with self.subTest(row=row):
+                actual = window[row]
+                self.assertEqual((actual[0], actual[-2], actual[-1]),
+                                 expected[row])
+
+    def test_out_of_range(self):
+        window = self._window()
+        with self.assertRaises(IndexError):
+            window[self.num_rows]
+        with self.assertRaises(IndexError):
+            window[-self.num_rows - 1]
+
+    def test_cache_is_bounded(self):
+        window = self._window()
+        list(window)
+        self.assertEqual(len(window._pages), 2)
+
+    def test_reset(self):
+        window = self._window()
+        window[0]
+        self.session.add(orm.Transaction(account_id=1, amount=Decimal("5")))
+        self.session.commit()
+        self.assertEqual(len(window), self.num_rows)
+
+        window.reset()
+        self.assertEqual(len(window), self.num_rows + 1)
+        self.assertEqual([row[0] for row in window],
+                         [t[0] for t in self._expected()])
+
+    def test_empty(self):
+        self.session.query(orm.Transaction).delete()
+        self.session.commit()
+        window = self._window()
+        self.assertEqual(len(window), 0)
+        self.assertEqual(list(window), [])
+
+    def test_patch_amount(self):
+        window = self._window()
+        list(window)
+        row = 30
+        old = window[row][-2]
+        trans_id = window[row][0]
+        trans = self.session.query(orm.Transaction).get(trans_id)
+        trans.amount = Decimal(old) + Decimal("10.50")
+        self.session.commit()
+
+        first, last, delta = window.patch(row, window.columns.amount.index,
+                                          old, str(trans.amount))
+        self.assertEqual((first, last, delta),
+                         (row, self.num_rows - 1, Decimal("10.50")))
+        actual = [(row[0], row[-2], row[-1]) for row in window]
+        self.assertEqual(actual, self._expected())
+
+    def test_patch_other_column(self):
+        window = self._window()
+        window[5]
+        col = window.columns.check_num.index
+        self.assertEqual(window.patch(5, col, None, 1234),
+                         (5, 5, Decimal(0)))
+        self.assertEqual(window[5][col], 1234)
+
+    def test_text_check_numbers(self):
+        """ Blank and non-numeric check numbers don't break the page """
+        window = self._window()
+        col = window.columns.check_num.index
+        rows = window[3], window[4]
+        for row, check_num in zip(rows, ("", "ATM")):
+            trans = self.session.query(orm.Transaction).get(row[0])
+            trans.check_num = check_num
+        self.session.commit()
+        window.reset()
+        self.assertEqual(window[3][col], "")
+        self.assertEqual(window[4][col], "ATM")
+
+        window.patch(4, col, "ATM", "")
+        self.assertIsNone(window[4][col])
+        window.patch(5, col, None, "Debit card")
+        self.assertEqual(window[5][col], "Debit card")
+
+    def test_insert(self):
+        window = self._window()
+        list(window)
+        trans = orm.Transaction(account_id=1, date=datetime.date(2017, 1, 9),
+                                amount=Decimal("-3.10"))
+        self.session.add(trans)
+        self.session.commit()
+
+        row = window.insert((trans.date, trans.transaction_id), "-3.10")
+        self.assertEqual(window[row][0], trans.transaction_id)
+        self.assertEqual(len(window), self.num_rows + 1)
+        actual = [(row[0], row[-2], row[-1]) for row in window]
+        self.assertEqual(actual, self._expected())
+
+    def test_insert_after_reset(self):
+        """ Balances rebuilt from the database already have the new row """
+        self.session.query(orm.Transaction).delete()
+        for _ in range(5):
+            self.session.add(orm.Transaction(account_id=1, amount="10.00",
+                                             date=datetime.date(2017, 1, 1)))
+        self.session.commit()
+        window = self._window()
+        self.assertEqual(len(window.balances), 5)
+        window.reset()
+
+        trans = orm.Transaction(account_id=1, date=datetime.date(2017, 1, 2),
+                                amount=Decimal("5.00"))
+        self.session.add(trans)
+        self.session.commit()
+        row = window.insert((trans.date, trans.transaction_id), "5.00")
+
+        self.assertEqual(row, 5)
+        self.assertEqual(len(window), 6)
+        self.assertEqual(len(window.balances), 6)
+        self.assertEqual(window.current_balance,
+                         ledger.OPENING_BALANCE + Decimal("55.00"))
+        actual = [(row[0], row[-2], row[-1]) for row in window]
+        self.assertEqual(actual, self._expected())
+
+    def test_current_balance(self):
+        window = self._window()
+        self.assertEqual(window.current_balance, self._expected()[-1][2])
+
+    def test_typed_values(self):
+        """ Values come back as Python objects, NULLs as None """
+        window = self._window()
+        cols = window.columns
+        self.assertIsNone(window.value(0, cols.date.index))
+        self.assertIsInstance(window.value(5, cols.date.index),
+                              datetime.date)
+        self.assertIsNone(window.value(5, cols.check_num.index))
+        self.assertIsInstance(window.value(5, cols.amount.index), Decimal)
+        for row in (0, 5, 46):
+            with self.subTest(row=row):
+                self.assertEqual(
+                    [window.value(row, item.index) for item in cols],
+                    window[row])
+
+    def test_strings_are_shared(self):
+        memo = orm.Memo(text="Groceries")
+        self.session.add(memo)
+        self.session.commit()
+        self.session.query(orm.Transaction).update(
+            {orm.Transaction.memo_id: memo.memo_id})
+        self.session.commit()
+
+        window = self._window()
+        list(window)
+        col = window.columns.memo.index
+        self.assertEqual(window.value(30, col), "Groceries")
+        self.assertEqual(window.strings.strings, [None, "Groceries"])
+        for page in window._pages.values():
+            self.assertEqual(page.columns[col].dtype, np.int32)
+
+
+class TestFenwickTree(unittest.TestCase):
+    """ Prefix sums with point updates """
+    values = [5, -3, 0, 12, 7, -1, 4, 9, 2, -8, 6]
+
+    def test_prefix(self):
+        tree = ledger.FenwickTree.from_values(self.values)
+        for stop in range(len(self.values) + 1):
+            with self.subTest(stop=stop):
+                self.assertEqual(tree.prefix(stop), sum(self.values[:stop]))
+
+    def test_add(self):
+        tree = ledger.FenwickTree(len(self.values))
+        for index, value in enumerate(self.values):
+            tree.add(index, value)
+        tree.add(4, 100)
+        values = list(self.values)
+        values[4] += 100
+        for stop in range(len(values) + 1):
+            with self.subTest(stop=stop):
+                self.assertEqual(tree.prefix(stop), sum(values[:stop]))
+
+
+class TestRunningBalance(LedgerTestCase):
+    """ Balances in cents, looked up by ledger row """
+    def _balances(self):
+        return ledger.RunningBalance.from_session(self.session, 20000)
+
+    def _expected_cents(self):
+        return [int(balance * 100) for _, _, balance in self._expected()]
+
+    def test_balance(self):
+        balances = self._balances()
+        expected = self._expected_cents()
+        self.assertEqual([balances.balance(row) for row in range(47)],
+                         expected)
+        self.assertEqual(balances.balances(0, 47), expected)
+        self.assertEqual(balances.balances(10, 20), expected[10:20])
+        self.assertEqual(balances.total, expected[-1])
+
+    def test_update(self):
+        balances = self._balances()
+        expected = self._expected_cents()
+        balances.update(12, int(balances.cents[12]) + 250)
+        self.assertEqual(balances.balances(0, 47),
+                         expected[:12] + [c + 250 for c in expected[12:]])
+
+    def test_insert(self):
+        balances = self._balances()
+        for date in (datetime.date(2017, 1, 15),     # in the middle
+                     datetime.date(2016, 6, 1),      # before the start
+                     datetime.date(2019, 6, 1),      # past the headroom
+                     None):
+            with self.subTest(date=date):
+                trans = orm.Transaction(account_id=1, date=date,
+                                        amount=Decimal("7.77"))
+                self.session.add(trans)
+                self.session.commit()
+                day = 0 if date is None else date.toordinal()
+                row = balances.insert(day, trans.transaction_id, 777)
+
+                expected = self._expected()
+                ids = [trans_id for trans_id, _, _ in expected]
+                self.assertEqual(row, ids.index(trans.transaction_id))
+                self.assertEqual(balances.balances(0, len(expected)),
+                                 self._expected_cents())
+
+    def test_empty(self):
+        self.session.query(orm.Transaction).delete()
+        self.session.commit()
+        balances = self._balances()
+        self.assertEqual(balances.total, 20000)
+        self.assertEqual(balances.insert(0, 1, 5), 0)
+        self.assertEqual(balances.total, 20005)
@@ -17,6 +17,7 @@ import unittest
 import os.path as osp
 
 # Third-Party
+import sqlalchemy as sa
 
 # Package / Application
 from pybank import orm
@@ -48,4 +49,117 @@ class TestDumpToFile(ORMTestCase):
         pass
 
 
+class TestChangeTracker(unittest.TestCase):
+    """ Check that session events record the changed rows """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        self.tracker = orm.change_tracker
+        self.tracker.reset()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_insert_and_update(self):
+        memo = orm.Memo(text="a")
+        self.session.add(memo)
+        self.session.commit()
+        self.assertEqual(self.tracker.rows, {'memo': {(memo.memo_id, )}})
+
+        self.tracker.reset()
+        memo.text = "b"
+        self.session.commit()
+        self.assertEqual(self.tracker.rows, {'memo': {(memo.memo_id, )}})
+
+    def test_bulk_update_by_primary_key(self):
+        self.session.add_all([orm.Memo(text="a"), orm.Memo(text="b")])
+        self.session.commit()
+        self.tracker.reset()
+
+        query = self.session.query(orm.Memo).filter_by(memo_id=2)
+        query.update({'text': "c"})
+        self.assertEqual(self.tracker.rows, {'memo': {(2, )}})
+        self.assertEqual(self.tracker.tables, set())
+
+    def test_bulk_update_on_filtered_column(self):
+        self.session.add(orm.Memo(text="a"))
+        self.session.commit()
+        self.tracker.reset()
+
+        query = self.session.query(orm.Memo).filter_by(text="a")
+        query.update({'text': "c"})
+        self.assertEqual(self.tracker.tables, {'memo'})
+
+    def test_version_increases(self):
+        version = self.tracker.version
+        self.session.add(orm.Memo(text="a"))
+        self.session.commit()
+        self.assertGreater(self.tracker.version, version)
+
+
+class TestCategoryClosure(unittest.TestCase):
+    """ Triggers keep the closure table in step with the categories """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        # Expense:Auto:Gas, Expense:Auto:Fees, Expense:Bank Fees, Income
+        self.session.add_all([orm.Category(category_id=1, name="Expense",
+                                           parent=1),
+                              orm.Category(category_id=2, name="Income",
+                                           parent=2),
+                              orm.Category(category_id=3, name="Auto",
+                                           parent=1),
+                              orm.Category(category_id=4, name="Gas",
+                                           parent=3),
+                              orm.Category(category_id=5, name="Fees",
+                                           parent=3),
+                              orm.Category(category_id=6, name="Bank Fees",
+                                           parent=1),
+                              ])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def _closure(self):
+        query = self.session.query(orm.CategoryClosure.ancestor_id,
+                                   orm.CategoryClosure.descendant_id,
+                                   orm.CategoryClosure.depth)
+        return set(query.all())
+
+    def _subtree(self, category_id):
+        query = self.session.query(orm.CategoryClosure.descendant_id)
+        query = query.filter_by(ancestor_id=category_id)
+        return {row.descendant_id for row in query}
+
+    def test_insert(self):
+        self.assertEqual(self._subtree(1), {1, 3, 4, 5, 6})
+        self.assertEqual(self._subtree(3), {3, 4, 5})
+        self.assertEqual(self._subtree(2), {2})
+        self.assertIn((1, 4, 2), self._closure())
+
+    def test_move(self):
+        auto = self.session.query(orm.Category).get(3)
+        auto.parent = 2
+        self.session.commit()
+        self.assertEqual(self._subtree(1), {1, 6})
+        self.assertEqual(self._subtree(2), {2, 3, 4, 5})
+        self.assertIn((2, 5, 2), self._closure())
+
+    def test_move_to_top_level(self):
+        auto = self.session.query(orm.Category).get(3)
+        auto.parent = 3
+        self.session.commit()
+        self.assertEqual(self._subtree(1), {1, 6})
+        self.assertEqual(self._subtree(3), {3, 4, 5})
+
+    def test_delete(self):
+        gas = self.session.query(orm.Category).get(4)
+        self.session.delete(gas)
+        self.session.commit()
+        self.assertEqual(self._subtree(1), {1, 3, 5, 6})
 
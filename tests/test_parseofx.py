@@ -14,11 +14,17 @@ Options:
 """
 
 # Standard Library
+import gc
 import unittest
+import tracemalloc
 import unittest.mock as mock
 import os.path as osp
 import io
 import datetime
+import threading
+import collections
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
 # Third-Party
 from bs4 import BeautifulSoup
@@ -146,9 +152,6 @@ class TestCloseTags(unittest.TestCase):
         result = parseofx.close_tags(open_tags).read()
         self.assertEqual(result, actual)
 
-    # TODO: Look into what's going on here
-#    @unittest.skip("Need to fix.")
-    @unittest.expectedFailure
     def test_close_tags_ok2(self):
         """ Check that tags get closed also """
         open_tags = io.StringIO("""
@@ -159,6 +162,52 @@ class TestCloseTags(unittest.TestCase):
         result = parseofx.close_tags(open_tags).read()
         self.assertEqual(result, actual)
 
+    def test_already_closed(self):
+        """ Elements that are closed aren't closed again """
+        open_tags = io.StringIO("<STMTTRN><NAME>a b</NAME><MEMO>c</STMTTRN>")
+        actual = "<STMTTRN><NAME>a b</NAME><MEMO>c</MEMO></STMTTRN>"
+        result = parseofx.close_tags(open_tags).read()
+        self.assertEqual(result, actual)
+
+    def test_bare_ampersand_escaped(self):
+        open_tags = io.StringIO("<NAME>AT&T &amp; &#38; Co&")
+        actual = "<NAME>AT&amp;T &amp; &#38; Co&amp;</NAME>"
+        result = parseofx.close_tags(open_tags).read()
+        self.assertEqual(result, actual)
+
+    def test_comments_removed(self):
+        open_tags = io.StringIO("<?xml a?><A> <!-- a <B>comment -->\n"
+                                "<B>b</A>")
+        actual = "<A><B>b</B></A>"
+        result = parseofx.close_tags(open_tags).read()
+        self.assertEqual(result, actual)
+
+    def test_empty_element(self):
+        """ Known elements are closed when empty, even the first time """
+        open_tags = io.StringIO("<A><MEMO><CHECKNUM><NAME>y</A><A><MEMO>x</A>")
+        actual = ("<A><MEMO></MEMO><CHECKNUM></CHECKNUM><NAME>y</NAME></A>"
+                  "<A><MEMO>x</MEMO></A>")
+        result = parseofx.close_tags(open_tags).read()
+        self.assertEqual(result, actual)
+
+    def test_unknown_empty_tag(self):
+        """ Unknown tags with no value are taken to be aggregates """
+        open_tags = io.StringIO("<A><B><C>1</B></A>")
+        actual = "<A><B><C>1</C></B></A>"
+        result = parseofx.close_tags(open_tags).read()
+        self.assertEqual(result, actual)
+
+    def test_chunks(self):
+        """ Tags and values split across chunks are kept whole """
+        ofx = ("<STATUS> <!-- <X>a -->\n  <CODE>10\n  <SEVERITY>INFO\n"
+               "</STATUS>\n")
+        expected = parseofx.close_tags(io.StringIO(ofx)).read()
+        for size in range(1, len(ofx) + 1):
+            with self.subTest(size=size):
+                with mock.patch.object(parseofx, "CHUNK_SIZE", size):
+                    chunks = list(parseofx.iter_close_tags(io.StringIO(ofx)))
+                self.assertEqual("".join(chunks), expected)
+
 
 @unittest.skip("Not implemented")
 class TestStripHeader(unittest.TestCase):
@@ -166,10 +215,298 @@ class TestStripHeader(unittest.TestCase):
     pass
 
 
-@unittest.skip("Not implemented")
+def _statements_ofx(counts):
+    """ OFX text with a bank statement of counts[i] transactions for each i """
+    statements = []
+    for num, count in enumerate(counts):
+        transactions = "".join(
+            "<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20150518<TRNAMT>-{}.00"
+            "<FITID>{}-{}<NAME>Payee {}</STMTTRN>\n".format(n % 50, num, n,
+                                                            n % 20)
+            for n in range(count))
+        statements.append(
+            "<STMTTRNRS><TRNUID>{0}<STMTRS><CURDEF>USD\n"
+            "<BANKACCTFROM><BANKID>1<ACCTID>acct{0}<ACCTTYPE>SAVINGS"
+            "</BANKACCTFROM>\n<BANKTRANLIST><DTSTART>20150101"
+            "<DTEND>20150522\n{1}</BANKTRANLIST>\n"
+            "<LEDGERBAL><BALAMT>{0}.00<DTASOF>20150522</LEDGERBAL>"
+            "</STMTRS></STMTTRNRS>\n".format(num, transactions))
+    return ("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\n\n"
+            "<OFX><BANKMSGSRSV1>\n" + "".join(statements)
+            + "</BANKMSGSRSV1></OFX>\n")
+
+
+def _fields(transaction):
+    return [getattr(transaction, name) for name in transaction.__slots__]
+
+
 class TestParseOFX(unittest.TestCase):
     """ Tests the ParseOFX class """
-    pass
+    data_dir = osp.join(osp.dirname(__file__), "data")
+
+    def _open(self, name):
+        return open(osp.join(self.data_dir, name), 'r')
+
+    def test_statement(self):
+        with self._open("rs_2credit_1checkdebit.ofx") as openf:
+            result = parseofx.ParseOFX(openf)
+        self.assertEqual(result.fi.org, "MYBANK")
+        self.assertEqual(result.sonrs.status.code, 0)
+        self.assertEqual(result.sonrs.dt_server,
+                         datetime.datetime(2007, 10, 15, 10, 15, 29))
+        self.assertEqual(result.statement.curdef, "USD")
+        self.assertEqual(result.statement.dtstart,
+                         datetime.datetime(2007, 1, 1))
+        self.assertEqual(str(result.statement.ledger_balance.balance),
+                         "5250.00")
+
+        transactions = result.statement.transactions
+        self.assertEqual([t.trnamt for t in transactions],
+                         [Decimal("200.00"), Decimal("150.00"),
+                          Decimal("-100.00")])
+        self.assertEqual([t.trntype for t in transactions],
+                         [parseofx.TransactionType.Credit,
+                          parseofx.TransactionType.Credit,
+                          parseofx.TransactionType.Payment])
+        self.assertEqual(transactions[1].memo, "Transfer from checking")
+        self.assertEqual(transactions[2].checknum, "1025")
+        self.assertIsNone(transactions[0].checknum)
+
+    def test_iter_transactions(self):
+        with self._open("rs_checking.ofx") as openf:
+            expected = parseofx.ParseOFX(openf).statement.transactions
+            openf.seek(0)
+            result = parseofx.ParseOFX(openf, parse=False)
+            self.assertIsNone(result.statement)
+            transactions = list(result.iter_transactions())
+        self.assertEqual([_fields(t) for t in transactions],
+                         [_fields(t) for t in expected])
+        self.assertEqual(result.statement.transactions, [])
+        self.assertEqual(result.fi.fid, "1234")
+
+    def test_small_chunks(self):
+        """ Tags split across chunks are put back together """
+        with self._open("rs_checking.ofx") as openf:
+            expected = parseofx.ParseOFX(openf).statement.transactions
+            openf.seek(0)
+            with mock.patch.object(parseofx, "CHUNK_SIZE", 7):
+                result = parseofx.ParseOFX(openf)
+        self.assertEqual([_fields(t) for t in result.statement.transactions],
+                         [_fields(t) for t in expected])
+
+    def test_file_read_in_chunks(self):
+        """ Files are parsed as they're read, not read in full first """
+        sizes = []
+
+        class Reader(io.FileIO):
+            def read(self, size=-1):
+                sizes.append(size)
+                return super().read(size)
+
+        with self._open("rs_checking.ofx") as openf:
+            expected = parseofx.ParseOFX(openf).statement.transactions
+        with mock.patch.object(parseofx, "CHUNK_SIZE", 64):
+            with Reader(osp.join(self.data_dir, "rs_checking.ofx")) as openf:
+                result = parseofx.ParseOFX(openf)
+        self.assertEqual([_fields(t) for t in result.statement.transactions],
+                         [_fields(t) for t in expected])
+        self.assertGreater(len(sizes), 10)
+        self.assertTrue(all(0 < size <= 64 for size in sizes), sizes)
+
+    def test_bytes_split_characters(self):
+        """ Multi-byte characters split across chunks are decoded """
+        ofx = _statements_ofx([3]).replace("Payee 1<", "Café 1<")
+        with mock.patch.object(parseofx, "CHUNK_SIZE", 7):
+            result = parseofx.ParseOFX(ofx.encode("utf-8"))
+        self.assertEqual([t.name for t in result.statement.transactions],
+                         ["Payee 0", "Café 1", "Payee 2"])
+
+    def test_empty_elements(self):
+        """ Empty elements don't swallow the rest of the transaction """
+        ofx = _statements_ofx([2]).replace(
+            "<FITID>0-0<NAME>Payee 0",
+            "<FITID>0-0<CHECKNUM><NAME>Payee 0<MEMO>")
+        result = parseofx.ParseOFX(ofx)
+        transactions = result.statement.transactions
+        self.assertEqual([t.fitid for t in transactions], ["0-0", "0-1"])
+        self.assertEqual([t.name for t in transactions],
+                         ["Payee 0", "Payee 1"])
+        self.assertEqual(transactions[0].checknum, "")
+        self.assertEqual(transactions[0].memo, "")
+
+    def test_bare_ampersand(self):
+        """ A bare "&" doesn't lose the transaction """
+        ofx = _statements_ofx([2]).replace("Payee 1<", "AT&T<")
+        result = parseofx.ParseOFX(ofx)
+        self.assertEqual([t.name for t in result.statement.transactions],
+                         ["Payee 0", "AT&T"])
+
+    def test_missing_required_tags(self):
+        """ Transactions missing FITID, TRNAMT or DTPOSTED are errors """
+        ofx = _statements_ofx([3])
+        for broken in (ofx.replace("<TRNAMT>-1.00", ""),
+                       ofx.replace("<FITID>0-1", "<FITID>"),
+                       ofx.replace("<DTPOSTED>20150518<TRNAMT>-1.00",
+                                   "<DTUSER>20150518<TRNAMT>-1.00")):
+            with self.subTest(broken=broken):
+                with self.assertRaises(ValueError):
+                    parseofx.ParseOFX(broken)
+
+    def test_account_list(self):
+        result = parseofx.ParseOFX(EXAMPLE_OFX_ACCOUNT_LIST.decode())
+        self.assertEqual([a.account_type for a in result.accounts],
+                         [parseofx.AccountType.checking,
+                          parseofx.AccountType.creditcrd])
+        self.assertEqual(result.accounts[0].bank_id,
+                         "bankid_bank_account_num")
+        self.assertIsNone(result.statement)
+
+    def test_statements(self):
+        """ Each account in the response gets its own statement """
+        with self._open("rs_checking_cc.ofx") as openf:
+            result = parseofx.ParseOFX(openf)
+        bank, credit_card = result.statements
+        self.assertIs(result.statement, bank)
+        self.assertIsInstance(bank, parseofx.BankStatement)
+        self.assertEqual(bank.bank_acct_from.acct_id, "acct_num")
+        self.assertEqual(bank.bank_acct_from.acct_type,
+                         parseofx.AccountType.checking)
+        self.assertEqual(len(bank.transactions), 16)
+
+        self.assertIsInstance(credit_card, parseofx.CreditCardStatement)
+        self.assertEqual(credit_card.cc_acct_from.acct_id, "cc_num")
+        self.assertEqual(str(credit_card.available_balance.balance),
+                         "9999.00")
+        self.assertEqual(credit_card.transactions, [])
+
+    def test_investment_statement(self):
+        with self._open("rs_investments.ofx") as openf:
+            statement, = parseofx.ParseOFX(openf).statements
+        self.assertIsInstance(statement, parseofx.InvestmentStatement)
+        self.assertEqual(statement.inv_acct_from.broker_id, "broker_id")
+        self.assertEqual(statement.dtstart, datetime.datetime(2015, 4, 22, 4))
+
+    def test_iter_statements(self):
+        """ Statements can be read in any order """
+        counts = [3, 0, 5]
+        result = parseofx.ParseOFX(_statements_ofx(counts), parse=False)
+        statements = list(result.iter_statements())
+        self.assertEqual([s.bank_acct_from.acct_id for s in statements],
+                         ["acct0", "acct1", "acct2"])
+
+        for num in (2, 1, 0):
+            with self.subTest(num=num):
+                transactions = list(statements[num].iter_transactions())
+                self.assertEqual(
+                    [t.fitid for t in transactions],
+                    ["{}-{}".format(num, n) for n in range(counts[num])])
+                self.assertEqual(str(statements[num].ledger_balance.balance),
+                                 "{}.00".format(num))
+                self.assertEqual(statements[num].transactions, [])
+
+    def test_iter_statements_lazily(self):
+        """ Statements are reached without reading later transactions """
+        result = parseofx.ParseOFX(_statements_ofx([2, 1000]), parse=False)
+        statements = result.iter_statements()
+        first = next(statements)
+        self.assertEqual(len(list(first.iter_transactions())), 2)
+        second = next(statements)
+        self.assertLess(len(second._pending), 10)
+        self.assertIsNone(second.ledger_balance)
+
+    def test_iter_statements_in_threads(self):
+        counts = [500, 300, 700]
+        result = parseofx.ParseOFX(_statements_ofx(counts), parse=False)
+
+        def count(statement):
+            return sum(1 for _ in statement.iter_transactions())
+
+        with ThreadPoolExecutor(3) as executor:
+            result = list(executor.map(count, result.iter_statements()))
+        self.assertEqual(result, counts)
+
+    def test_iter_statements_no_lost_transactions(self):
+        """ Two threads reading interleaved statements get every FITID """
+        counts = [37, 5, 120, 0, 64, 1, 90, 33]
+        result = parseofx.ParseOFX(_statements_ofx(counts), parse=False)
+        statements = result.iter_statements()
+        first = next(statements)
+
+        read = threading.Event()
+
+        def read_ahead():
+            while result._read_more():
+                pass
+            read.set()
+
+        # Have another thread read everything else just after the first
+        # statement finds it has nothing pending.
+        first._pending = _ReadAheadDeque(read_ahead)
+
+        def fitids(statements, wait=False):
+            if wait:
+                read.wait(10)
+            return [t.fitid
+                    for statement in statements
+                    for t in statement.iter_transactions()]
+
+        with ThreadPoolExecutor(2) as executor:
+            found_first = executor.submit(fitids, [first])
+            found_rest = executor.submit(fitids, statements, True)
+            found = found_first.result() + found_rest.result()
+
+        expected = ["{}-{}".format(num, n)
+                    for num, count in enumerate(counts)
+                    for n in range(count)]
+        self.assertEqual(sorted(found), sorted(expected))
+
+
+class _ReadAheadDeque(collections.deque):
+    """
+    A deque that runs `read_ahead` in another thread the first time it's
+    found to be empty, after that's been decided.
+    """
+    def __init__(self, read_ahead):
+        super().__init__()
+        self.read_ahead = read_ahead
+
+    def __bool__(self):
+        is_empty = len(self) == 0
+        if is_empty and self.read_ahead is not None:
+            thread = threading.Thread(target=self.read_ahead)
+            self.read_ahead = None
+            thread.start()
+            thread.join()
+        return not is_empty
+
+
+class TestMemory(unittest.TestCase):
+    """ tracemalloc benchmark of the memory kept for parsed transactions """
+    num_transactions = 2000
+    max_bytes_per_transaction = 250
+
+    def test_bytes_per_transaction(self):
+        ofx = _statements_ofx([self.num_transactions])
+        parseofx._convert_datetime.cache_clear()
+        parseofx._amount.cache_clear()
+
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            result = parseofx.ParseOFX(ofx)
+            result.ofx_data = None          # The copy of the input
+            gc.collect()
+            used = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+
+        transactions = result.statement.transactions
+        self.assertEqual(len(transactions), self.num_transactions)
+        self.assertIs(transactions[0].name, transactions[20].name)
+        self.assertIs(transactions[0].trnamt, transactions[50].trnamt)
+        self.assertLess(used / self.num_transactions,
+                        self.max_bytes_per_transaction)
 
 
 class TestParseStatus_OKAllTags(unittest.TestCase):
@@ -328,17 +665,37 @@ class TestConvertDatetime(unittest.TestCase):
                      datetime.datetime(2015, 3, 2, 16, 47, 11, 123000)),
                     ("19980101010101.123[-8:PDT]",
                      datetime.datetime(1998, 1, 1, 9, 1, 1, 123000)),
-
+                    ("20071015021529.000[-8:PST]",
+                     datetime.datetime(2007, 10, 15, 10, 15, 29)),
+                    ("20150302164711[+5.5:IST]",
+                     datetime.datetime(2015, 3, 2, 11, 17, 11)),
+                    ("20150302164711.500[-5]",
+                     datetime.datetime(2015, 3, 2, 21, 47, 11, 500000)),
+                    ("20150302[+1:CET]",
+                     datetime.datetime(2015, 3, 1, 23)),
+                    ("20150302",
+                     datetime.datetime(2015, 3, 2)),
+                    ("20150520232950.608[0:GMT]\n    ",
+                     datetime.datetime(2015, 5, 20, 23, 29, 50, 608000)),
                     ]
 
     malformed_fmts = [
                       "20001703",               # invalid month
                       "20150147",               # invalid day
-#                      "20151203262626",         # invalid hour
-#                      "20151203206226",         # invalid minute
-#                      "20151203201361",         # invalid second
-#                      "199807211237",           # missing seconds
+                      "20151203262626",         # invalid hour
+                      "20151203206226",         # invalid minute
+                      "20151203201361",         # invalid second
+                      "199807211237",           # missing seconds
                       "2015",                   # missing month, day
+                      "20150302164711.5",       # milliseconds not 3 digits
+                      "20150302164711.1234",    # milliseconds not 3 digits
+                      "20150302164711junk",     # trailing garbage
+                      "20150302164711[-5:EST]x",    # garbage after tz
+                      "20150302164711[:EST]",   # tz name with no offset
+                      "20150302164711[-5:EST",  # unclosed tz
+                      "20150302164711[-5.:EST]",    # no digits after "."
+                      "2015030216",             # hour with no min, sec
+                      "",                       # empty
                       ]
 
     def test_known_values(self):
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""
+Tests the plot data functions.
+"""
+# Standard Library
+import unittest
+import datetime
+from decimal import Decimal
+
+# Third-Party
+import numpy as np
+import sqlalchemy as sa
+
+# Package / Application
+from pybank import orm
+from pybank import plots
+
+
+class TestPareto(unittest.TestCase):
+    """ Pareto bins, cumulative line and trimming """
+    data = ["a", "b", "c", "d", "e", "e", "d", "d", "e", "e", "c"]
+
+    def test_calc_pareto_data(self):
+        counts, categories = plots.calc_pareto_data(self.data)
+        self.assertEqual(counts.tolist(), [4, 3, 2, 1, 1])
+        self.assertEqual(categories.tolist(), ["e", "d", "c", "a", "b"])
+
+    def test_calc_pareto_data_weighted(self):
+        weights = [100, 2, 3, 1, 1, 1, 1, 1, 1, 1, 3]
+        counts, categories = plots.calc_pareto_data(self.data, weights)
+        self.assertEqual(counts.tolist(), [100, 6, 4, 3, 2])
+        self.assertEqual(categories.tolist(), ["a", "c", "e", "d", "b"])
+
+    def test_calc_pareto_data_signed_weights(self):
+        """ Negative weights count by size, so the line only goes up """
+        weights = [-100, 2, -3, 1, -1, 1, -1, 1, 1, 1, 3]
+        counts, categories = plots.calc_pareto_data(self.data, weights)
+        self.assertEqual(counts.tolist(), [100, 6, 4, 3, 2])
+        self.assertEqual(categories.tolist(), ["a", "c", "e", "d", "b"])
+
+        line = plots.calc_pareto_cum_line(counts)
+        self.assertTrue(np.all(np.diff(line) > 0))
+        result = plots.trim_pareto_data(0.9, counts, categories, line)
+        self.assertEqual(result[1].tolist(), ["a", "c"])
+
+    def test_calc_pareto_cum_line(self):
+        counts = [4, 3, 2, 1]
+        expected = [0.4, 0.7, 0.9, 1.0]
+        np.testing.assert_allclose(plots.calc_pareto_cum_line(counts),
+                                   expected)
+        self.assertEqual(len(plots.calc_pareto_cum_line([])), 0)
+
+    def test_trim_pareto_data(self):
+        counts = [4, 3, 2, 1]
+        categories = ["e", "d", "c", "a"]
+        for limit, num in ((0.0, 1), (0.5, 2), (0.7, 2), (0.8, 3), (1.0, 4)):
+            with self.subTest(limit=limit):
+                result = plots.trim_pareto_data(limit, counts, categories)
+                self.assertEqual(result[0].tolist(), counts[:num])
+                self.assertEqual(result[1].tolist(), categories[:num])
+                self.assertEqual(len(result[2]), num)
+
+    def test_trim_pareto_data_unsorted(self):
+        """ The first bin at or over the limit ends it, sorted or not """
+        categories = ["a", "b", "c", "d"]
+        for cumulative, num in (([0.9, 0.2, 0.3, 1.0], 1),
+                                ([0.5, 1.2, 0.9, 1.0], 2),
+                                ([0.5, 0.4, 0.85, 1.0], 3),
+                                ([0.2, 0.3, 0.1, 0.4], 4)):
+            with self.subTest(cumulative=cumulative):
+                result = plots.trim_pareto_data(0.8, [1, 2, 3, 4],
+                                                categories, cumulative)
+                self.assertEqual(result[1].tolist(), categories[:num])
+                self.assertEqual(result[2].tolist(), cumulative[:num])
+
+    def test_trim_pareto_data_bad_limit(self):
+        with self.assertRaises(ValueError):
+            plots.trim_pareto_data(1.5, [1], ["a"])
+
+
+class TestDecimate(unittest.TestCase):
+    """ Min/max decimation keeps what each pixel column shows """
+    width = 50
+
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        self.x = np.cumsum(rand.randint(1, 4, 10000)).astype(np.float64)
+        self.y = np.cumsum(rand.normal(size=10000))
+
+    def _extremes(self, x, y, low, high):
+        """ (first, last, min, max) of y in each pixel column """
+        buckets = np.floor((x - low) / (high - low) * self.width)
+        result = {}
+        for bucket in np.unique(buckets):
+            values = y[buckets == bucket]
+            result[bucket] = (values[0], values[-1],
+                              values.min(), values.max())
+        return result
+
+    def test_shape_is_kept(self):
+        x, y = plots.decimate(self.x, self.y, self.width)
+        self.assertLessEqual(len(x), 4 * self.width)
+        self.assertTrue(np.all(np.diff(x) > 0))
+        low, high = self.x[0], self.x[-1]
+        self.assertEqual(self._extremes(x, y, low, high),
+                         self._extremes(self.x, self.y, low, high))
+
+    def test_visible_range(self):
+        low, high = 5000.0, 8000.0
+        x, y = plots.decimate(self.x, self.y, self.width, (low, high))
+        self.assertLessEqual(len(x), 4 * self.width + 2)
+        self.assertLess(x[0], low)
+        self.assertGreater(x[-1], high)
+
+        inside = (self.x >= low) & (self.x <= high)
+        shown = (x >= low) & (x <= high)
+        self.assertEqual(
+            self._extremes(x[shown], y[shown], low, high),
+            self._extremes(self.x[inside], self.y[inside], low, high))
+
+    def test_axis_range(self):
+        """ Axes come back from the canvas as arrays, or None if unset """
+        self.assertIsNone(plots._axis_range(None))
+        self.assertIsNone(plots._axis_range(np.array(None)))
+        self.assertEqual(plots._axis_range((1, 5)), (1.0, 5.0))
+        self.assertEqual(plots._axis_range(np.array([2.5, 3.5])), (2.5, 3.5))
+
+    def test_small_data_unchanged(self):
+        x, y = plots.decimate(self.x[:100], self.y[:100], self.width)
+        np.testing.assert_array_equal(x, self.x[:100])
+        np.testing.assert_array_equal(y, self.y[:100])
+
+    def test_zoomed_in_unchanged(self):
+        x, y = plots.decimate(self.x, self.y, self.width, (100.0, 130.0))
+        inside = (self.x >= 100) & (self.x <= 130)
+        self.assertEqual(len(x), inside.sum() + 2)
+
+
+class TestPlotData(unittest.TestCase):
+    """ Aggregates come from the database and are cached by data version """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        self.tracker = orm.ChangeTracker()
+        self.tracker.listen(self.session)
+        for date, amount, category_id in (
+                (datetime.date(2017, 1, 5), "-10.00", 1),
+                (datetime.date(2017, 1, 20), "-2.50", None),
+                (datetime.date(2017, 3, 1), "100.00", 2),
+                (None, "1.00", 1)):
+            self.session.add(orm.Transaction(date=date, amount=amount,
+                                             category_id=category_id))
+        self.session.commit()
+        self.data = plots.PlotData(self.session, self.tracker,
+                                   opening_balance=Decimal("200"))
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_balance(self):
+        dates, cents = self.data.balance()
+        self.assertEqual(dates.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(dates.tolist(), [datetime.date(2017, 1, 1),
+                                          datetime.date(2017, 3, 1)])
+        self.assertEqual(cents.tolist(), [18850, 28850])
+
+    def test_totals(self):
+        dates, counts, cents = self.data.totals('day')
+        self.assertEqual(len(dates), 3)
+        self.assertEqual(counts.tolist(), [1, 1, 1])
+        self.assertEqual(cents.tolist(), [-1000, -250, 10000])
+
+    def test_category_totals(self):
+        category_ids, counts, cents = self.data.category_totals()
+        self.assertEqual(category_ids.dtype, np.int32)
+        self.assertEqual(category_ids.tolist(), [-1, 1, 2])
+        self.assertEqual(counts.tolist(), [1, 2, 1])
+        self.assertEqual(cents.tolist(), [-250, -900, 10000])
+
+    def test_cached_until_changed(self):
+        first = self.data.balance()
+        self.assertIs(self.data.balance(), first)
+
+        self.session.add(orm.Transaction(date=datetime.date(2017, 3, 2),
+                                         amount="1.00"))
+        self.session.commit()
+        second = self.data.balance()
+        self.assertIsNot(second, first)
+        self.assertEqual(second[1].tolist(), [18850, 28950])
+
+    def test_empty(self):
+        self.session.query(orm.Transaction).delete()
+        self.session.commit()
+        dates, cents = self.data.balance()
+        self.assertEqual(len(dates), 0)
+        self.assertEqual(len(cents), 0)
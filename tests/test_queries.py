@@ -5,9 +5,12 @@ Tests queries for PyBank.
 
 # Standard Library
 import unittest
+import datetime
+import unittest.mock
 import os.path as osp
 
 # Third-Party
+import sqlalchemy as sa
 
 # Package / Application
 from pybank import orm
@@ -67,6 +70,286 @@ class TestCopyToSA(ORMTestCase):
             self.fail("copy_to_sa raised exception: {}".format(err))
 
 
+class TestBulkCopyToSA(unittest.TestCase):
+    """ copy_to_sa loads dumps with executemany """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def _memos(self):
+        return self.session.query(orm.Memo.memo_id, orm.Memo.text).all()
+
+    def test_round_trip(self):
+        texts = ["plain", "None of your business", "semi;colon", "it's",
+                 'say "hi"', "back\\slash", None]
+        for text in texts:
+            self.session.add(orm.Memo(text=text))
+        self.session.commit()
+        expected = self._memos()
+        dump = "".join(queries.sqlite_iterdump(self.engine, self.session))
+
+        self.session.query(orm.Memo).delete()
+        self.session.commit()
+        statements = list(queries.split_statements(dump))
+        queries.copy_to_sa(self.engine, self.session, statements)
+        self.assertEqual(self._memos(), expected)
+
+    def test_sqlite3_format(self):
+        dump = ["INSERT INTO \"memo\" VALUES(1,'a;b');",
+                "INSERT INTO \"memo\" VALUES(2,NULL);",
+                "INSERT INTO \"memo\" VALUES(3,'it''s');",
+                ]
+        queries.copy_to_sa(self.engine, self.session, dump)
+        self.assertEqual(self._memos(),
+                         [(1, "a;b"), (2, None), (3, "it's")])
+
+    def test_delete(self):
+        dump = ['INSERT INTO "memo" VALUES(1, \'a\');',
+                'INSERT INTO "memo" VALUES(2, \'b\');',
+                'DELETE FROM "memo" WHERE ("memo_id" = 1);',
+                'INSERT INTO "memo" VALUES(1, \'c\');',
+                ]
+        queries.copy_to_sa(self.engine, self.session, dump)
+        self.assertEqual(self._memos(), [(1, "c"), (2, "b")])
+
+    def test_error_rolls_back(self):
+        dump = ['INSERT INTO "memo" VALUES(1, \'a\');',
+                'INSERT INTO "memo" VALUES(1, \'duplicate\');',
+                ]
+        with self.assertRaises(Exception):
+            queries.copy_to_sa(self.engine, self.session, dump)
+        self.assertEqual(self._memos(), [])
+
+    def test_progress(self):
+        dump = ['INSERT INTO "memo" VALUES({}, \'x\');'.format(i)
+                for i in range(1, 12)]
+        calls = []
+        with unittest.mock.patch.object(queries, 'PROGRESS_INTERVAL', 5):
+            queries.copy_to_sa(self.engine, self.session, dump,
+                               lambda done, total: calls.append((done, total)))
+        self.assertEqual(calls, [(5, 11), (10, 11), (11, 11)])
+
+
+class TestIndexes(unittest.TestCase):
+    """ Declared indexes are created, dropped and retrofitted """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def _index_names(self):
+        inspector = sa.inspect(self.engine)
+        return {ix['name'] for ix in inspector.get_indexes('transaction')}
+
+    def _add_transaction(self, fitid):
+        self.session.add(orm.Transaction(account_id=1, amount="1.00",
+                                         fitid=fitid))
+        self.session.commit()
+
+    def test_created_with_tables(self):
+        names = {ix.name for ix in orm.Transaction.__table__.indexes}
+        self.assertEqual(self._index_names(), names)
+
+    def test_drop_and_create(self):
+        queries.drop_indexes(self.engine)
+        self.assertEqual(self._index_names(), set())
+        self.assertEqual(queries.create_indexes(self.engine), [])
+        self.assertIn('ux_transaction_account_fitid', self._index_names())
+
+    def test_duplicate_fitid_rejected(self):
+        self._add_transaction(fitid=12)
+        with self.assertRaises(sa.exc.IntegrityError):
+            self._add_transaction(fitid=12)
+        self.session.rollback()
+        self._add_transaction(fitid=None)
+        self._add_transaction(fitid=None)
+
+    def test_duplicates_skip_unique_index(self):
+        queries.drop_indexes(self.engine)
+        self._add_transaction(fitid=12)
+        self._add_transaction(fitid=12)
+
+        missing = queries.create_indexes(self.engine)
+        self.assertEqual(missing, ['ux_transaction_account_fitid'])
+        self.assertIn('ix_transaction_account_date', self._index_names())
+
+    def test_upgrade_clears_manual_fitids(self):
+        """ Older files gave every manual transaction a fitid of -1 """
+        queries.drop_indexes(self.engine)
+        dump = ['INSERT INTO "transaction" VALUES'
+                '({},1,NULL,NULL,NULL,\'1\',NULL,NULL,NULL,NULL,{});'
+                .format(num, fitid)
+                for num, fitid in enumerate([-1, -1, 42, -1], start=1)]
+        queries.copy_to_sa(self.engine, self.session, dump)
+
+        self.assertEqual(queries.upgrade_schema(self.engine), [])
+        self.assertIn('ux_transaction_account_fitid', self._index_names())
+        fitids = self.session.query(orm.Transaction.fitid).order_by(
+            orm.Transaction.transaction_id).all()
+        self.assertEqual([fitid for fitid, in fitids], [None, None, 42, None])
+
+    def test_dump_includes_indexes(self):
+        dump = list(queries.sqlite_iterdump(self.engine, self.session))
+        self.assertIn('CREATE UNIQUE INDEX ux_transaction_account_fitid'
+                      ' ON "transaction" (account_id, fitid);', dump)
+
+
+class TestSplitStatements(unittest.TestCase):
+    """ """
+    def test_split_statements(self):
+        insert = "INSERT INTO \"m\" VALUES(1, 'a;b', \"it's\");"
+        sql = "BEGIN;" + insert + "COMMIT;"
+        result = list(queries.split_statements(sql))
+        self.assertEqual(result, ["BEGIN;", insert, "COMMIT;"])
+
+
+class TestCategoryIndex(unittest.TestCase):
+    """ The category index is cached until a category is inserted """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        self.session.add(orm.Category(category_id=1, name="Expense",
+                                      parent=1))
+        self.session.commit()
+
+        patcher = unittest.mock.patch.object(queries, 'session', self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        queries.invalidate_category_index()
+
+    def tearDown(self):
+        queries.invalidate_category_index()
+        self.session.close()
+        self.engine.dispose()
+
+    def test_cached(self):
+        self.assertIs(queries.query_category_index(),
+                      queries.query_category_index())
+
+    def test_insert_category_invalidates(self):
+        index = queries.query_category_index()
+        queries.insert_category("Auto", 1)
+        new_index = queries.query_category_index()
+        self.assertIsNot(new_index, index)
+        self.assertEqual(new_index.ids["Expense:Auto"], 2)
+
+
+class TestCategoryTotals(unittest.TestCase):
+    """ Subtree totals through the category closure table """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        # Children are inserted before their parents here, which the
+        # triggers can't follow but a rebuild can.
+        self.session.add(orm.Category(category_id=1, name="Expense",
+                                      parent=1))
+        self.session.flush()
+        self.session.add(orm.Category(category_id=2, name="Gas", parent=3))
+        self.session.flush()
+        self.session.add(orm.Category(category_id=3, name="Auto", parent=1))
+        self.session.flush()
+        for category_id, amount in ((1, "-1.10"), (2, "-20.00"),
+                                    (3, "-300.05"), (2, "-0.01")):
+            self.session.add(orm.Transaction(category_id=category_id,
+                                             amount=amount))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def test_rebuild_and_total(self):
+        queries.rebuild_category_closure(self.engine)
+        self.assertEqual(queries.query_category_total(self.session, 1),
+                         (4, -32116))
+        self.assertEqual(queries.query_category_total(self.session, 3),
+                         (3, -32006))
+        self.assertEqual(queries.query_category_total(self.session, 2),
+                         (2, -2001))
+
+    def test_subtree_filter(self):
+        queries.rebuild_category_closure(self.engine)
+        query = self.session.query(orm.Transaction)
+        query = query.filter(
+            orm.Transaction.category_id.in_(queries.category_subtree(3)))
+        self.assertEqual(query.count(), 3)
+
+    def test_not_saved(self):
+        dump = list(queries.sqlite_iterdump(self.engine, self.session))
+        self.assertFalse(any(sql.startswith('INSERT INTO "category_closure"')
+                             for sql in dump))
+
+    def test_category_totals(self):
+        self.session.add(orm.Transaction(amount="5.00"))
+        self.session.commit()
+        self.assertEqual(queries.query_category_totals(self.session),
+                         [(None, 1, 500), (1, 1, -110), (2, 2, -2001),
+                          (3, 1, -30005)])
+
+        queries.rebuild_category_closure(self.engine)
+        self.assertEqual(
+            queries.query_category_totals(self.session, rollup=True),
+            [(1, 4, -32116), (2, 2, -2001), (3, 3, -32006)])
+
+
+class TestPeriodTotals(unittest.TestCase):
+    """ Transactions grouped by day, week and month """
+    def setUp(self):
+        self.engine = sa.create_engine('sqlite:///:memory:')
+        orm.Base.metadata.create_all(self.engine)
+        self.session = orm.Session(bind=self.engine)
+        day = datetime.date
+        for date, amount in ((day(2017, 1, 31), "1.00"),    # Tuesday
+                             (day(2017, 1, 30), "2.00"),    # Monday
+                             (day(2017, 2, 5), "4.00"),     # Sunday
+                             (day(2017, 2, 6), "8.00"),     # Monday
+                             (None, "16.00"),
+                             (day(2017, 1, 31), "32.00")):
+            self.session.add(orm.Transaction(date=date, amount=amount))
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+
+    def _expected(self, *rows):
+        return [(0, 1, 1600)] + [
+            (datetime.date(*date).toordinal(), count, cents)
+            for date, count, cents in rows]
+
+    def test_day(self):
+        self.assertEqual(queries.query_period_totals(self.session, 'day'),
+                         self._expected(((2017, 1, 30), 1, 200),
+                                        ((2017, 1, 31), 2, 3300),
+                                        ((2017, 2, 5), 1, 400),
+                                        ((2017, 2, 6), 1, 800)))
+
+    def test_week(self):
+        self.assertEqual(queries.query_period_totals(self.session, 'week'),
+                         self._expected(((2017, 1, 30), 4, 3900),
+                                        ((2017, 2, 6), 1, 800)))
+
+    def test_month(self):
+        self.assertEqual(queries.query_period_totals(self.session),
+                         self._expected(((2017, 1, 1), 3, 3500),
+                                        ((2017, 2, 1), 2, 1200)))
+
+    def test_unknown_period(self):
+        with self.assertRaises(ValueError):
+            queries.query_period_totals(self.session, 'fortnight')
+
+
 class TestInsertFunctions(ORMTestCase):
     """ """
     def test_insert_account_group(self):
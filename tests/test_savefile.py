@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+"""
+Tests reading and writing PyBank files.
+"""
+# Standard Library
+import unittest
+import os
+import tempfile
+import queue
+from unittest import mock
+
+# Third-Party
+import sqlalchemy as sa
+
+# Package / Application
+from pybank import crypto
+from pybank import orm
+from pybank import queries
+from pybank import savefile
+
+
+def _new_database():
+    """ Create a new, empty in-memory database and a tracked session """
+    engine = sa.create_engine('sqlite:///:memory:')
+    orm.Base.metadata.create_all(engine)
+    return engine, orm.Session(bind=engine)
+
+
+def _memos(session):
+    return session.query(orm.Memo.memo_id, orm.Memo.text).all()
+
+
+class TestPyBankFile(unittest.TestCase):
+    """ Checkpoint, append, compact and load a journaled file """
+    key = crypto.create_key(b"secret", b"salt")
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".pybank")
+        os.close(fd)
+        os.remove(self.path)
+
+        self.engine, self.session = _new_database()
+        self.pbfile = savefile.PyBankFile(self.path)
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _save(self, **kwargs):
+        self.pbfile.save(self.key, self.engine, self.session, **kwargs)
+
+    def _num_records(self):
+        num = 0
+        with open(self.path, 'rb') as openf:
+            end = os.fstat(openf.fileno()).st_size
+            while openf.tell() < end:
+                for _ in crypto.decrypt_stream(self.key, openf):
+                    pass
+                num += 1
+        return num
+
+    def _load(self):
+        engine, session = _new_database()
+        pbfile = savefile.PyBankFile(self.path)
+        pbfile.load(self.key, engine, session)
+        return pbfile, session
+
+    def test_first_save_writes_checkpoint(self):
+        self._save()
+        self.assertEqual(self.pbfile.num_deltas, 0)
+        self.assertEqual(self._num_records(), 1)
+
+    def test_changes_are_appended(self):
+        self._save()
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        self._save()
+        self.assertEqual(self.pbfile.num_deltas, 1)
+        self.assertEqual(self._num_records(), 2)
+
+    def test_no_changes_does_not_write(self):
+        self._save()
+        with open(self.path, 'rb') as openf:
+            before = openf.read()
+        self._save()
+        with open(self.path, 'rb') as openf:
+            after = openf.read()
+        self.assertEqual(before, after)
+
+    def test_compact(self):
+        self._save()
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        self._save()
+        self._save(compact=True)
+        self.assertEqual(self.pbfile.num_deltas, 0)
+        self.assertEqual(self._num_records(), 1)
+
+    def test_round_trip(self):
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        self._save()
+
+        memo = orm.Memo(text="second")
+        self.session.add(memo)
+        self.session.commit()
+        self._save()
+
+        memo.text = "changed"
+        self.session.add(orm.Memo(text="third"))
+        self.session.commit()
+        self._save()
+
+        pbfile, session = self._load()
+        self.assertEqual(pbfile.num_deltas, 2)
+        self.assertEqual(_memos(session), _memos(self.session))
+
+    def test_incomplete_last_record_is_discarded(self):
+        self._save()
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        self._save()
+        record = b"".join(crypto.encrypt_stream(self.key, [b"DELETE"]))
+        with open(self.path, 'ab') as openf:
+            openf.write(record[:-5])
+
+        pbfile, session = self._load()
+        self.assertEqual(pbfile.num_deltas, 1)
+        self.assertEqual(_memos(session), _memos(self.session))
+
+    def test_save_after_discarded_record_writes_checkpoint(self):
+        self._save()
+        record = b"".join(crypto.encrypt_stream(self.key, [b""]))
+        with open(self.path, 'ab') as openf:
+            openf.write(record[:-5])
+
+        pbfile, session = self._load()
+        session.add(orm.Memo(text="first"))
+        session.commit()
+        pbfile.save(self.key, session.get_bind(), session)
+        self.assertEqual(self._num_records(), 1)
+
+    def test_legacy_file(self):
+        """ A single Fernet token of SQL text still loads """
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        dump = "".join(queries.sqlite_iterdump(self.engine, self.session))
+        with open(self.path, 'wb') as openf:
+            openf.write(crypto.encrypt(self.key, dump.encode('utf-8')))
+
+        pbfile, session = self._load()
+        self.assertEqual(pbfile.num_deltas, 0)
+        self.assertEqual(_memos(session), _memos(self.session))
+
+    def test_legacy_journal(self):
+        """ Newline-separated Fernet tokens still load """
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        dump = "".join(queries.sqlite_iterdump(self.engine, self.session))
+        delta = 'INSERT INTO "memo" VALUES(2, \'second\');'
+        records = [crypto.encrypt(self.key, dump.encode('utf-8')),
+                   crypto.encrypt(self.key, delta.encode('utf-8')),
+                   b"gAAAAAtruncated",
+                   ]
+        with open(self.path, 'wb') as openf:
+            openf.write(savefile.RECORD_SEP.join(records))
+
+        pbfile, session = self._load()
+        self.assertEqual(pbfile.num_deltas, 1)
+        self.assertEqual(_memos(session), [(1, "first"), (2, "second")])
+
+    def test_legacy_file_is_converted_on_save(self):
+        dump = "".join(queries.sqlite_iterdump(self.engine, self.session))
+        with open(self.path, 'wb') as openf:
+            openf.write(crypto.encrypt(self.key, dump.encode('utf-8')))
+
+        pbfile, session = self._load()
+        pbfile.save(self.key, session.get_bind(), session)
+        with open(self.path, 'rb') as openf:
+            self.assertTrue(crypto.is_stream(openf))
+
+    @unittest.skipUnless(queries.HAS_SERIALIZE, "Requires Python 3.11")
+    def test_checkpoint_is_sqlite_image(self):
+        self._save()
+        payload = crypto.encrypted_read(self.path, self.key)
+        self.assertTrue(payload.startswith(savefile.IMAGE_MAGIC))
+        self.assertIn(b"SQLite format 3", payload[:32])
+
+    @unittest.skipUnless(queries.HAS_SERIALIZE, "Requires Python 3.11")
+    def test_checkpoint_keeps_none_text(self):
+        """ The text "None" must not become NULL """
+        self.session.add(orm.Memo(text="None of your business"))
+        self.session.commit()
+        self._save()
+
+        _, session = self._load()
+        self.assertEqual(_memos(session), [(1, "None of your business")])
+
+    def test_text_checkpoint_round_trip(self):
+        """ Without SQLite images the checkpoint is a streamed SQL dump """
+        self.session.add(orm.Memo(text="first"))
+        self.session.add(orm.Memo(text="second"))
+        self.session.commit()
+        with mock.patch.object(queries, "HAS_SERIALIZE", False):
+            self._save()
+        payload = crypto.encrypted_read(self.path, self.key)
+        self.assertTrue(payload.startswith(b"BEGIN TRANSACTION;"))
+
+        _, session = self._load()
+        self.assertEqual(_memos(session), _memos(self.session))
+
+    def test_missing_indexes_are_created_on_load(self):
+        """ Files saved before an index was declared get it on load """
+        queries.drop_indexes(self.engine)
+        self._save()
+
+        _, session = self._load()
+        inspector = sa.inspect(session.get_bind())
+        names = {ix['name'] for ix in inspector.get_indexes('transaction')}
+        self.assertIn('ux_transaction_account_fitid', names)
+
+    def test_category_closure_rebuilt_on_load(self):
+        self.session.add(orm.Category(category_id=1, name="Expense",
+                                      parent=1))
+        self.session.add(orm.Category(category_id=2, name="Auto", parent=1))
+        self.session.commit()
+        with mock.patch.object(queries, "HAS_SERIALIZE", False):
+            self._save()
+
+        _, session = self._load()
+        self.assertEqual(queries.query_category_total(session, 1), (0, 0))
+        closure = session.query(orm.CategoryClosure.ancestor_id,
+                                orm.CategoryClosure.descendant_id).all()
+        self.assertEqual(sorted(closure), [(1, 1), (1, 2), (2, 2)])
+
+    def test_newer_image_version_raises(self):
+        payload = savefile.IMAGE_MAGIC + bytes([savefile.IMAGE_VERSION + 1])
+        crypto.encrypted_write(self.path, self.key, payload)
+
+        with self.assertRaises(ValueError):
+            self._load()
+
+    def test_failed_checkpoint_leaves_file_intact(self):
+        self._save()
+        with open(self.path, 'rb') as openf:
+            before = openf.read()
+
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        with self.assertRaises(TypeError):
+            self.pbfile.write_checkpoint(None, self.engine, self.session)
+
+        with open(self.path, 'rb') as openf:
+            self.assertEqual(openf.read(), before)
+
+
+class TestBackgroundSaver(unittest.TestCase):
+    """ Saves run on a worker and report back through `dispatch` """
+    key = crypto.create_key(b"secret", b"salt")
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".pybank")
+        os.close(fd)
+        os.remove(self.path)
+
+        self.engine, self.session = _new_database()
+        self.pbfile = savefile.PyBankFile(self.path)
+
+        self.calls = queue.Queue()
+        self.results = []
+        self.saver = savefile.BackgroundSaver(self.pbfile,
+                                              self.engine,
+                                              self.session,
+                                              lambda: self.key,
+                                              self._dispatch,
+                                              self.results.append,
+                                              )
+
+    def tearDown(self):
+        self.saver.shutdown()
+        self.session.close()
+        self.engine.dispose()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def _dispatch(self, func, *args):
+        """ Stand-in for wx.CallAfter """
+        self.calls.put((func, args))
+
+    def _pump(self):
+        """ Run dispatched calls until no save is running """
+        while self.saver.busy:
+            func, args = self.calls.get(timeout=10)
+            func(*args)
+
+    def test_save_in_background(self):
+        self.session.add(orm.Memo(text="first"))
+        self.session.commit()
+        self.saver.request()
+        self._pump()
+
+        self.assertEqual(self.results, [None])
+        engine, session = _new_database()
+        savefile.PyBankFile(self.path).load(self.key, engine, session)
+        self.assertEqual(_memos(session), _memos(self.session))
+
+    def test_requests_are_coalesced(self):
+        self.saver.request()
+        for text in ("first", "second", "third"):
+            self.session.add(orm.Memo(text=text))
+            self.session.commit()
+            self.saver.request()
+        self._pump()
+
+        # The initial save plus one for everything that came in during it.
+        self.assertEqual(self.results, [None, None])
+        self.assertEqual(self.pbfile.num_deltas, 1)
+
+    def test_failure_is_reported(self):
+        self.saver.get_key = lambda: None
+        self.saver.request()
+        self._pump()
+
+        self.assertEqual(len(self.results), 1)
+        self.assertIsInstance(self.results[0], Exception)
+        self.assertFalse(os.path.exists(self.path))
@@ -26,9 +26,8 @@ from decimal import Decimal as D
 from pybank import utils
 
 
-class TestBuildCategoryString(unittest.TestCase):
-    """
-    """
+class CategoryData(object):
+    """ Categories as (id, name, parent) and their full paths """
     data = [(1, "Expense", 1),
             (2, "Income", 2),
             (3, "Auto", 1),
@@ -51,6 +50,10 @@ class TestBuildCategoryString(unittest.TestCase):
 
     invlaid_items = [0, None, '']
 
+
+class TestBuildCategoryString(CategoryData, unittest.TestCase):
+    """
+    """
     def test_known_values(self):
         for data, expected in zip(self.data, self.known_values):
             with self.subTest(params=data):
@@ -68,6 +71,45 @@ class TestBuildCategoryString(unittest.TestCase):
         self.assertEqual(result, "!! None !!")
 
 
+class TestCategoryIndex(CategoryData, unittest.TestCase):
+    """ Same results as build_cat_string, from dict lookups """
+    def setUp(self):
+        self.index = utils.CategoryIndex(self.data)
+
+    def test_known_values(self):
+        for data, expected in zip(self.data, self.known_values):
+            with self.subTest(params=data):
+                self.assertEqual(self.index.path(data[0]), expected)
+                self.assertEqual(self.index.ids[expected], data[0])
+
+    def test_invalid_item(self):
+        for item in self.invlaid_items:
+            with self.subTest(item=item):
+                self.assertEqual(self.index.path(item), "")
+
+    def test_item_not_found(self):
+        self.assertEqual(self.index.path(15), "!! None !!")
+
+    def test_missing_parent(self):
+        index = utils.CategoryIndex(self.data + [(12, "Orphan", 99)])
+        self.assertEqual(index.path(12), "!! None !!")
+        self.assertNotIn("!! None !!", index.ids)
+
+    def test_choices(self):
+        self.assertEqual(self.index.choices, list(self.known_values))
+        self.assertEqual(utils.build_cat_strings(self.data),
+                         list(self.known_values))
+
+    def test_max_nest(self):
+        data = [(1, "Top", 1)] + [(i, str(i), i - 1) for i in range(2, 15)]
+        index = utils.CategoryIndex(data, max_nest=5)
+        for item in range(1, 15):
+            with self.subTest(item=item):
+                self.assertEqual(index.path(item),
+                                 utils.build_cat_string(item, data,
+                                                        max_nest=5))
+
+
 class TestMoneyFmt(unittest.TestCase):
     """
     Test the moneyfmt function.